@@ -0,0 +1,161 @@
+import hashlib
+import re
+import time
+from datetime import datetime, timezone
+
+from opensearchpy import NotFoundError, OpenSearch
+
+from aws_lambda_powertools import Logger
+
+from common.metrics import emit_metric
+
+logger = Logger()
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query so trivially different spellings of a question share one lookup key:
+    lowercased, whitespace collapsed and surrounding punctuation stripped.
+    """
+    return re.sub(r"\s+", " ", query.lower()).strip(" ?!.,;:")
+
+
+def index_fingerprint(opensearch_client: OpenSearch, index_names: str | list[str]) -> str:
+    """
+    Fingerprint the content of an index (or of all partition indexes). It changes whenever
+    documents are added, updated or deleted, or an index is recreated, and tells which
+    precomputed answers are stale.
+
+    :param opensearch_client: The OpenSearch client
+    :param index_names: The name of the index to fingerprint, or a list of index names.
+    :return: A hex digest of each index's UUID, document count and highest sequence number
+    """
+    if isinstance(index_names, str):
+        index_names = [index_names]
+
+    parts = []
+    for index_name in index_names:
+        if not opensearch_client.indices.exists(index_name):
+            parts.append(f"{index_name}:missing")
+            continue
+        settings = opensearch_client.indices.get_settings(index=index_name)
+        uuid = settings[index_name]["settings"]["index"]["uuid"]
+        count = opensearch_client.count(index=index_name)["count"]
+        # Every write (including updates and deletes) takes the next sequence number of its shard
+        latest = opensearch_client.search(
+            index=index_name,
+            body={"size": 1, "sort": [{"_seq_no": "desc"}], "_source": False, "seq_no_primary_term": True},
+        )["hits"]["hits"]
+        seq_no = latest[0]["_seq_no"] if latest else -1
+        parts.append(f"{uuid}:{count}:{seq_no}")
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+class PrecomputedAnswerStore:
+    """
+    Stores answers rendered ahead of time for popular queries in an OpenSearch lookup index.
+
+    Answers are keyed by a hash of the normalized query, so a lookup is a single GET by ID, and
+    record the fingerprint of the searched index and the embedding model they were rendered
+    with. `get_current` only serves answers whose fingerprint and model still match, so answers
+    never outlive a reindex, an ingestion run or a model migration.
+    """
+
+    def __init__(
+        self,
+        opensearch_client: OpenSearch,
+        index_name: str,
+        source_index_names: list[str] | None = None,
+        model_id: str | None = None,
+        fingerprint_ttl: float = 300,
+    ):
+        """
+        :param opensearch_client: The OpenSearch client
+        :param index_name: The name of the index holding precomputed answers.
+        :param source_index_names: The indexes answers are rendered from, fingerprinted by
+                                   `get_current`.
+        :param model_id: The embedding model of the searched index, checked by `get_current`.
+        :param fingerprint_ttl: Seconds the fingerprint of the source indexes is reused between
+                                lookups, instead of recomputing it for every query.
+        """
+        self._opensearch_client = opensearch_client
+        self._index_name = index_name
+        self._source_index_names = source_index_names
+        self._model_id = model_id
+        self._fingerprint_ttl = fingerprint_ttl
+        self._fingerprint: tuple[float, str] | None = None
+
+    @staticmethod
+    def _document_id(query: str) -> str:
+        return hashlib.sha256(normalize_query(query).encode()).hexdigest()
+
+    def get(self, query: str) -> dict | None:
+        """
+        :param query: The user query, normalized before the lookup.
+        :return: The stored entry ('query', 'markdown', 'hit_ids', 'fingerprint', 'model_id',
+                 'updated_at'), or None if there is no precomputed answer
+        """
+        try:
+            document = self._opensearch_client.get(
+                index=self._index_name, id=self._document_id(query)
+            )
+        except NotFoundError:
+            return None
+        return document["_source"]
+
+    def _current_fingerprint(self) -> str:
+        now = time.monotonic()
+        if self._fingerprint is None or now - self._fingerprint[0] >= self._fingerprint_ttl:
+            self._fingerprint = (
+                now,
+                index_fingerprint(self._opensearch_client, self._source_index_names),
+            )
+        return self._fingerprint[1]
+
+    def get_current(self, query: str) -> dict | None:
+        """
+        :param query: The user query, normalized before the lookup.
+        :return: The stored entry if it was rendered against the current content of the source
+                 indexes with the current embedding model, or None
+        """
+        entry = self.get(query)
+        if entry is None:
+            return None
+        if (self._model_id is not None and entry.get("model_id") != self._model_id) or (
+            self._source_index_names is not None
+            and entry.get("fingerprint") != self._current_fingerprint()
+        ):
+            logger.info("Precomputed answer is stale", extra={"query": entry.get("query")})
+            emit_metric("PrecomputedAnswerStale", 1)
+            return None
+        return entry
+
+    def put(
+        self,
+        query: str,
+        markdown: str,
+        hit_ids: list[str],
+        fingerprint: str,
+        model_id: str | None = None,
+    ):
+        """
+        Store (or replace) the precomputed answer of a query.
+
+        :param query: The user query, normalized before it is stored.
+        :param markdown: The rendered answer.
+        :param hit_ids: IDs of the documents the answer was rendered from.
+        :param fingerprint: Fingerprint of the searched index at render time.
+        :param model_id: The embedding model the query was embedded with.
+        """
+        self._opensearch_client.index(
+            index=self._index_name,
+            id=self._document_id(query),
+            body={
+                "query": normalize_query(query),
+                "markdown": markdown,
+                "hit_ids": hit_ids,
+                "fingerprint": fingerprint,
+                "model_id": model_id,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            },
+        )
@@ -49,3 +49,20 @@ def get_bedrock_client():
 
     logger.info("Initializing Bedrock Client")
     return boto3.client(service_name="bedrock-runtime")
+
+
+def get_bedrock_control_client():
+    """
+    Initialize and return a Bedrock control plane client which
+    is used to manage batch inference jobs.
+    """
+
+    logger.info("Initializing Bedrock control plane Client")
+    return boto3.client(service_name="bedrock")
+
+
+def get_s3_client():
+    """Initialize and return an S3 client."""
+
+    logger.info("Initializing S3 Client")
+    return boto3.client(service_name="s3")
@@ -0,0 +1,208 @@
+import json
+import os
+import time
+
+import numpy as np
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+
+class SemanticCache:
+    """
+    A cache of recent query embeddings and the answers rendered for them.
+
+    Embeddings are stored L2-normalized in a compact float32 matrix, so a lookup is a single
+    matrix-vector product. A query whose cosine similarity to a cached query clears the
+    threshold reuses the cached answer, which lets paraphrased questions skip OpenSearch and
+    the LLM call. When the cache is full the least recently used entry is evicted.
+    """
+
+    # Rows the embedding matrix starts with; it doubles as entries are added, up to the capacity
+    _INITIAL_ROWS = 64
+
+    def __init__(
+        self,
+        capacity: int = 1000,
+        threshold: float = 0.95,
+        path: str | None = None,
+        persist_every: int = 50,
+        persist_interval: float = 300,
+    ):
+        """
+        :param capacity: Maximum number of cached queries.
+        :param threshold: Minimum cosine similarity for a cached query to be reused.
+        :param path: Optional file path used to persist the cache between cold starts.
+        :param persist_every: Additions after which maybe_persist writes the cache.
+        :param persist_interval: Seconds after which maybe_persist writes pending additions.
+        """
+        self._capacity = capacity
+        self._threshold = threshold
+        self._path = path
+        self._persist_every = persist_every
+        self._persist_interval = persist_interval
+        # Additions since the cache was last written, and when that was
+        self._unsaved = 0
+        self._persisted_at = time.monotonic()
+
+        # The embedding matrix is allocated lazily, once the embedding dimension is known, and
+        # the use clock of each row is kept alongside it
+        self._embeddings: np.ndarray | None = None
+        self._entries: list[dict] = []
+        self._last_used = np.zeros(0, dtype=np.int64)
+        self._clock = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _allocate(self, rows: int, dimensions: int):
+        """(Re)allocate the embedding matrix and use clocks, keeping the rows of current entries."""
+        size = len(self._entries)
+        embeddings = np.zeros((rows, dimensions), dtype=np.float32)
+        last_used = np.zeros(rows, dtype=np.int64)
+        if self._embeddings is not None and self._embeddings.shape[1] == dimensions:
+            embeddings[:size] = self._embeddings[:size]
+            last_used[:size] = self._last_used[:size]
+        self._embeddings, self._last_used = embeddings, last_used
+
+    def _touch(self, slot: int):
+        self._clock += 1
+        self._last_used[slot] = self._clock
+
+    def lookup(self, embedding) -> dict | None:
+        """
+        Find the cached entry most similar to the given query embedding.
+
+        :param embedding: The query embedding.
+        :return: A dict with 'hit_ids', 'markdown' and 'similarity', or None on a cache miss.
+        """
+        if self._entries and self._embeddings.shape[1] == len(embedding):
+            size = len(self._entries)
+            similarities = self._embeddings[:size] @ self._normalize(embedding)
+            slot = int(np.argmax(similarities))
+            similarity = float(similarities[slot])
+
+            if similarity >= self._threshold:
+                self.hits += 1
+                self._touch(slot)
+                return {**self._entries[slot], "similarity": similarity}
+
+        self.misses += 1
+        return None
+
+    def add(self, embedding, hit_ids: list[str], markdown: str):
+        """
+        Cache the answer rendered for a query, evicting the least recently used entry if full.
+
+        :param embedding: The query embedding.
+        :param hit_ids: IDs of the OpenSearch documents the answer was rendered from.
+        :param markdown: The rendered answer.
+        """
+        vector = self._normalize(embedding)
+        if self._embeddings is None or self._embeddings.shape[1] != vector.shape[0]:
+            # Entries of another embedding dimension can never match again
+            self._entries = []
+            self._allocate(min(self._capacity, self._INITIAL_ROWS), vector.shape[0])
+
+        entry = {"hit_ids": list(hit_ids), "markdown": markdown}
+        size = len(self._entries)
+        if size < self._capacity:
+            if size == len(self._embeddings):
+                self._allocate(min(self._capacity, 2 * size), vector.shape[0])
+            slot = size
+            self._entries.append(entry)
+        else:
+            slot = int(np.argmin(self._last_used[:size]))
+            self._entries[slot] = entry
+
+        self._embeddings[slot] = vector
+        self._touch(slot)
+        self._unsaved += 1
+
+    def stats(self) -> dict:
+        """
+        :return: The cache size and hit-rate counters.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def maybe_persist(self) -> bool:
+        """
+        Persist the cache once enough additions are pending, or pending additions are older than
+        the persist interval. Writing the whole matrix takes milliseconds, so it is not done for
+        every addition on the request path.
+
+        :return: Whether the cache was written
+        """
+        if not self._path or not self._unsaved:
+            return False
+        if (
+            self._unsaved < self._persist_every
+            and time.monotonic() - self._persisted_at < self._persist_interval
+        ):
+            return False
+        self.persist()
+        return True
+
+    def persist(self):
+        """
+        Write the cache to its configured path, if any.
+        The file is written to a temporary path first and then atomically replaced.
+        """
+        if not self._path or not self._entries:
+            return
+
+        size = len(self._entries)
+        temp_path = f"{self._path}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(
+                f,
+                embeddings=self._embeddings[:size],
+                last_used=self._last_used[:size],
+                entries=np.array(json.dumps(self._entries)),
+            )
+        os.replace(temp_path, self._path)
+        self._unsaved = 0
+        self._persisted_at = time.monotonic()
+
+    def _load(self):
+        """
+        Load a previously persisted cache, keeping the most recently used entries if the
+        file holds more entries than the current capacity.
+        """
+        try:
+            with np.load(self._path, allow_pickle=False) as data:
+                embeddings = data["embeddings"]
+                last_used = data["last_used"]
+                entries = json.loads(str(data["entries"]))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable semantic cache at {self._path}", extra={"error": str(e)})
+            return
+
+        keep = np.argsort(last_used)[::-1][: self._capacity]
+        self._entries = []
+        self._allocate(
+            min(self._capacity, max(len(keep), self._INITIAL_ROWS)), embeddings.shape[1]
+        )
+        self._embeddings[: len(keep)] = embeddings[keep]
+        self._last_used[: len(keep)] = last_used[keep]
+        self._entries = [entries[i] for i in keep]
+        self._clock = int(last_used.max(initial=0))
+        logger.info(f"Loaded {len(self._entries)} semantic cache entries from {self._path}")
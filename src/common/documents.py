@@ -0,0 +1,196 @@
+import re
+from dataclasses import dataclass, field
+from html import unescape
+from html.parser import HTMLParser
+
+
+# Typed OpenSearch fields of a StackOverflow document, in addition to the kNN embedding
+DOCUMENT_PROPERTIES = {
+    "question_id": {"type": "keyword"},
+    "title": {"type": "text"},
+    "question_body": {"type": "text", "index": False},
+    "answer_body": {"type": "text", "index": False},
+    "tags": {"type": "keyword"},
+    "score": {"type": "integer"},
+    "creation_date": {"type": "date"},
+    "last_activity_date": {"type": "date"},
+    "text": {"type": "text", "index": False},
+    "content_hash": {"type": "keyword"},
+    # Typeahead over question titles, weighted by question score
+    "title_suggest": {"type": "completion"},
+}
+
+# Fields callers may request in search responses
+RESPONSE_FIELDS = ("question_id", "title", "tags", "score", "answer_body", "creation_date")
+
+
+class _MarkdownConverter(HTMLParser):
+    """Converts the subset of HTML StackOverflow allows in post bodies into markdown."""
+
+    _INLINE = {"strong": "**", "b": "**", "em": "_", "i": "_", "code": "`"}
+    _HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._parts: list[str] = []
+        self._lists: list[list] = []  # [tag, next item number] of the open lists
+        self._links: list[str | None] = []
+        self._quotes: list[int] = []  # index into _parts where each open blockquote starts
+        self._pre: list[str] | None = None  # text of the open code block
+
+    def _at_line_start(self) -> bool:
+        last = next((part for part in reversed(self._parts) if part), "")
+        return not last or last.endswith("\n")
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if self._pre is not None:
+            return
+        if tag in ("p", "div", "pre") or tag in self._HEADINGS:
+            self._parts.append("\n\n")
+        if tag == "pre":
+            self._pre = []
+        elif tag in self._INLINE:
+            self._parts.append(self._INLINE[tag])
+        elif tag in self._HEADINGS:
+            self._parts.append("#" * int(tag[1]) + " ")
+        elif tag == "blockquote":
+            self._quotes.append(len(self._parts))
+        elif tag in ("ul", "ol"):
+            if not self._lists:
+                self._parts.append("\n\n")
+            self._lists.append([tag, 1])
+        elif tag == "li":
+            indent = "  " * max(len(self._lists) - 1, 0)
+            if self._lists and self._lists[-1][0] == "ol":
+                self._parts.append(f"\n{indent}{self._lists[-1][1]}. ")
+                self._lists[-1][1] += 1
+            else:
+                self._parts.append(f"\n{indent}- ")
+        elif tag == "a":
+            self._links.append(attrs.get("href"))
+            self._parts.append("[")
+        elif tag == "img":
+            self._parts.append(f"![{attrs.get('alt') or ''}]({attrs.get('src') or ''})")
+        elif tag == "br":
+            self._parts.append("\n")
+        elif tag == "hr":
+            self._parts.append("\n\n---\n\n")
+
+    def handle_endtag(self, tag):
+        if tag == "pre" and self._pre is not None:
+            code = "".join(self._pre).strip("\n")
+            self._pre = None
+            self._parts.append(f"```\n{code}\n```\n\n")
+        elif self._pre is not None:
+            return
+        elif tag in self._INLINE:
+            self._parts.append(self._INLINE[tag])
+        elif tag in ("p", "div") or tag in self._HEADINGS:
+            self._parts.append("\n\n")
+        elif tag in ("ul", "ol") and self._lists:
+            self._lists.pop()
+            if not self._lists:
+                self._parts.append("\n\n")
+        elif tag == "a" and self._links:
+            href = self._links.pop()
+            self._parts.append(f"]({href})" if href else "]")
+        elif tag == "blockquote" and self._quotes:
+            start = self._quotes.pop()
+            quoted = self._clean("".join(self._parts[start:]))
+            quoted = "\n".join(f"> {line}" if line else ">" for line in quoted.split("\n"))
+            self._parts[start:] = [f"\n\n{quoted}\n\n"]
+
+    def handle_data(self, data):
+        if self._pre is not None:
+            self._pre.append(data)
+            return
+        data = re.sub(r"\s+", " ", data)
+        self._parts.append(data.lstrip() if self._at_line_start() else data)
+
+    @staticmethod
+    def _clean(text: str) -> str:
+        return re.sub(r"\n{3,}", "\n\n", re.sub(r"[ \t]+\n", "\n", text)).strip()
+
+    def markdown(self) -> str:
+        return self._clean("".join(self._parts))
+
+
+def html_to_markdown(html: str) -> str:
+    """
+    Convert a StackOverflow post body (HTML) into markdown: paragraphs, headings, lists, links, images,
+    emphasis and inline code are converted, code blocks become fenced blocks, and any other tag is dropped.
+
+    :param html: The HTML body
+    :return: The markdown text
+    """
+    if "<" not in html:
+        return unescape(html)
+    converter = _MarkdownConverter()
+    converter.feed(html)
+    converter.close()
+    return converter.markdown()
+
+
+def _timestamp(value) -> str | None:
+    """Convert a BigQuery timestamp (pandas Timestamp or string) into an ISO string."""
+    if value is None or value != value:  # None or NaT
+        return None
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+@dataclass
+class StackOverflowDocument:
+    """A StackOverflow question with its accepted answer, as stored in OpenSearch."""
+
+    title: str
+    question_body: str
+    answer_body: str
+    question_id: str | None = None
+    tags: list[str] = field(default_factory=list)
+    score: int | None = None
+    creation_date: str | None = None
+    last_activity_date: str | None = None
+
+    @classmethod
+    def from_row(cls, row) -> "StackOverflowDocument":
+        """
+        Build a document from a BigQuery result row.
+
+        :param row: A mapping (e.g. a pandas Series) with the columns returned by StackOverflowDataRetriever.
+        :return: The document
+        """
+        question_id = row.get("question_id")
+        score = row.get("score")
+        tags = row.get("tags")
+        return cls(
+            title=row["question_title"],
+            question_body=row["question_body"],
+            answer_body=row["accepted_answer_body"],
+            question_id=str(question_id) if question_id is not None else None,
+            # StackOverflow stores tags as a single pipe-separated string
+            tags=tags.split("|") if isinstance(tags, str) and tags else [],
+            score=int(score) if score is not None and score == score else None,
+            creation_date=_timestamp(row.get("creation_date")),
+            last_activity_date=_timestamp(row.get("last_activity_date")),
+        )
+
+    @property
+    def text(self) -> str:
+        """The combined text the document embedding is generated from."""
+        return f"Title: {self.title}\nBody: {self.question_body}\nAccepted Answer: {self.answer_body}"
+
+    def to_source(self) -> dict:
+        """
+        :return: The typed fields stored in the document's OpenSearch `_source`.
+        """
+        return {
+            "question_id": self.question_id,
+            "title": self.title,
+            "question_body": self.question_body,
+            "answer_body": self.answer_body,
+            "tags": self.tags,
+            "score": self.score,
+            "creation_date": self.creation_date,
+            "last_activity_date": self.last_activity_date,
+        }
@@ -1,143 +1,495 @@
-import json
 import hashlib
 import os
 from typing import Iterable
-from opensearchpy import OpenSearch
+
+import numpy as np
+import orjson
+from opensearchpy import OpenSearch, NotFoundError
 from opensearchpy import helpers
 
 from aws_lambda_powertools import Logger
 
+from common.documents import DOCUMENT_PROPERTIES, StackOverflowDocument
+from common.partitions import TagPartitioner
+from common.profiling import profile_section
+from common.providers import SEARCH_DOCUMENT, EmbeddingProvider, TitanEmbeddingProvider
+from common.usage import BedrockUsage
+
 logger = Logger()
 
 
 class EmbeddingService:
     """A class the provides a method to generate embeddings, and queries OpenSearch using those embeddings."""
 
+    # Documents per bulk request, as in opensearchpy.helpers.bulk
+    _BULK_CHUNK_SIZE = 500
+
     def __init__(
         self,
         opensearch_client: OpenSearch,
         bedrock_client,
         index_name: str,
         model_id: str,
+        embedding_dimensions: int | None = None,
+        knn_parameters: dict | None = None,
+        partitioner: TagPartitioner | None = None,
+        provider: EmbeddingProvider | None = None,
     ):
         """
         :param opensearch_client: The OpenSearch client
         :param bedrock_client: The Amazon Bedrock client, used to fetch embeddings
         :param index_name: The name of the OpenSearch index to query.
         :param model_id: The ID of the Amazon model that is used to generate embeddings.
+        :param embedding_dimensions: Embedding size; defaults to EMBEDDING_DIMENSIONS from env, or 1024.
+        :param knn_parameters: Optional HNSW parameters ('m', 'ef_construction', 'ef_search')
+                               stored in the faiss method of the index when it is created.
+        :param partitioner: Optional tag partitioner. Documents are then stored in one index per
+                            partition ('<index_name>-<partition>') and queries only search the
+                            partitions they are classified into.
+        :param provider: Optional embedding provider; defaults to Titan with bedrock_client and
+                         model_id.
         """
         logger.info("Initializing EmbeddingService...")
 
         self._opensearch_client = opensearch_client
         self._bedrock_client = bedrock_client
         self._index_name = index_name
-        self._model_id = model_id
         # Load embedding dimensions from env, fallback is 1024
-        self._embedding_dimensions = os.environ.get("EMBEDDING_DIMENSIONS", 1024)
+        self._embedding_dimensions = int(
+            embedding_dimensions or os.environ.get("EMBEDDING_DIMENSIONS", 1024)
+        )
+        self._knn_parameters = knn_parameters or {}
+        self._partitioner = partitioner
+        self._provider = provider or TitanEmbeddingProvider(
+            bedrock_client, model_id, self._embedding_dimensions
+        )
+        # Indexes known to exist with the current document mapping
+        self._ready_indexes = set()
+        # Indexes that still hold documents keyed by content hash, see _create_if_not_exit
+        self._legacy_indexes = set()
+        # Question ID -> other partition indexes still holding a copy, see check_if_indexed
+        self._moved_copies: dict[str, list[str]] = {}
+
+    @property
+    def opensearch_client(self) -> OpenSearch:
+        """The OpenSearch client, shared with components that keep their own state in OpenSearch."""
+        return self._opensearch_client
+
+    @property
+    def index_name(self) -> str:
+        return self._index_name
+
+    @property
+    def partitioner(self) -> TagPartitioner | None:
+        return self._partitioner
+
+    @property
+    def index_names(self) -> list[str]:
+        """The physical indexes documents are stored in: one per partition, or just index_name."""
+        if self._partitioner is None:
+            return [self._index_name]
+        return [self._partition_index(partition) for partition in self._partitioner.partitions]
+
+    def _partition_index(self, partition: str) -> str:
+        return f"{self._index_name}-{partition}"
 
-    def _create_if_not_exit(self):
+    def _document_index(self, document: StackOverflowDocument | str | None = None, tags=None) -> str:
+        """:return: The index a document (or a document with the given tags) is stored in"""
+        if self._partitioner is None:
+            return self._index_name
+        if isinstance(document, StackOverflowDocument):
+            tags = document.tags
+        return self._partition_index(self._partitioner.partition_for_tags(tags))
+
+    def _create_if_not_exit(self, index_name: str | None = None):
         """
         Check if the OpenSearch index exists, and create it if it doesn't.
-        The created index uses a KNN vector field for storing and searching embeddings.
+        The created index uses a KNN vector field for storing and searching embeddings, plus
+        typed document fields. The HNSW graph uses the faiss engine, which supports efficient
+        filtering during the kNN search. Each index is only checked once per service instance.
         """
-        if not self._opensearch_client.indices.exists(self._index_name):
-            logger.info(f"Creating {self._index_name} index!")
+        index_name = index_name or self._index_name
+        if index_name in self._ready_indexes:
+            return
+        if self._opensearch_client.indices.exists(index_name):
+            # Add fields introduced after the index was created (e.g. title_suggest), so they are
+            # not dynamically mapped on the next write
+            self._opensearch_client.indices.put_mapping(
+                index=index_name, body={"properties": {"title_suggest": DOCUMENT_PROPERTIES["title_suggest"]}}
+            )
+            # Documents indexed before they were keyed by question ID are keyed by their content
+            # hash and have no typed fields. Writes to such an index delete the hash-keyed copy,
+            # so a re-ingested question is not returned twice by kNN searches.
+            legacy = self._opensearch_client.count(
+                index=index_name,
+                body={"query": {"bool": {"must_not": {"exists": {"field": "question_id"}}}}},
+            )
+            if legacy["count"]:
+                logger.info(f"{index_name} holds {legacy['count']} hash-keyed documents to replace")
+                self._legacy_indexes.add(index_name)
+        else:
+            logger.info(f"Creating {index_name} index!")
+            settings = {"index.knn": True}
+            method = {"name": "hnsw", "space_type": "l2", "engine": "faiss"}
+            # The index.knn.algo_param.ef_search setting only applies to nmslib; faiss reads
+            # ef_search from the method parameters (or per query, see query_opensearch)
+            method_parameters = {
+                key: value
+                for key, value in self._knn_parameters.items()
+                if key in ("m", "ef_construction", "ef_search")
+            }
+            if method_parameters:
+                method["parameters"] = method_parameters
+
             self._opensearch_client.indices.create(
-                self._index_name,
+                index_name,
                 body={
-                    "settings": {"index.knn": True},
+                    "settings": settings,
                     "mappings": {
                         "properties": {
                             "embedding": {
                                 "type": "knn_vector",
                                 "dimension": self._embedding_dimensions,
+                                "method": method,
                             },
+                            **DOCUMENT_PROPERTIES,
                         }
                     },
                 },
             )
+        self._ready_indexes.add(index_name)
+
+    @property
+    def model_id(self) -> str:
+        return self._provider.model_id
+
+    @property
+    def embedding_model(self) -> tuple[str, str, int]:
+        """The provider type, model and dimensions; services with equal ones embed texts alike."""
+        return type(self._provider).__name__, self._provider.model_id, self._provider.dimensions
+
+    @property
+    def batch_limits(self) -> tuple[int, int | None]:
+        """The provider's request limits: maximum texts and total characters (or None) per request."""
+        return self._provider.max_batch_size, self._provider.max_batch_chars
+
+    @property
+    def supports_batch_inference(self) -> bool:
+        """Whether Bedrock batch inference can embed with the provider's model."""
+        return self._provider.supports_batch_inference
 
-    def generate_embedding(self, text) -> list[float]:
+    def build_embedding_request(self, text: str) -> dict:
+        """
+        Build the model request body for a text, as used for batch inference input.
+
+        :param text: The text to generate embedding for.
+        :return: The model input
+        """
+        return self._provider.build_request(text)
+
+    def generate_embedding(
+        self,
+        text,
+        usage: BedrockUsage | None = None,
+        key: str | None = None,
+        input_type: str = SEARCH_DOCUMENT,
+    ) -> np.ndarray:
         """
         Generates embeddings for the given input text.
 
         :param text: The text to generate embedding for.
-        :return: A list (or vector) of embeddings
+        :param usage: Optional accumulator the input token count and latency of the call are added to.
+        :param key: Optional identifier of the text (e.g. question ID), recorded with its usage.
+        :param input_type: SEARCH_DOCUMENT for a document to index, SEARCH_QUERY for a query.
+        :return: The embedding as a contiguous float32 vector
         """
-        logger.debug(f"Generating embeddings with {self._model_id} model.")
+        return self.embed_batch([text], usage, [key], input_type)[0]
 
-        content_type = accept = "application/json"
-        payload = json.dumps(
-            {
-                "inputText": text,
-                "dimensions": self._embedding_dimensions,
-                "normalize": True,
-            }
-        )
+    def embed_batch(
+        self,
+        texts: list[str],
+        usage: BedrockUsage | None = None,
+        keys: list | None = None,
+        input_type: str = SEARCH_DOCUMENT,
+    ) -> np.ndarray:
+        """
+        Generates embeddings for many texts, in as few requests as the provider allows.
 
-        # Call Bedrock model to generate embedding vector
-        response = self._bedrock_client.invoke_model(
-            body=payload,
-            modelId=self._model_id,
-            accept=accept,
-            contentType=content_type,
-        )
-        response_body = json.loads(response.get("body").read())
-        logger.debug("Generated embedding", extra={"embedding": response_body})
-        return response_body["embedding"]
+        :param texts: The texts to generate embeddings for.
+        :param usage: Optional accumulator the token counts and latency of the calls are added to.
+        :param keys: Optional identifiers of the texts, recorded with their usage.
+        :param input_type: SEARCH_DOCUMENT for documents to index, SEARCH_QUERY for queries.
+        :return: A float32 matrix with one embedding per text, in order
+        """
+        logger.debug(f"Generating {len(texts)} embeddings with {self.model_id} model.")
+        # One float32 buffer instead of lists of boxed floats; the index stores float32 anyway
+        return self._provider.embed_batch(texts, usage, keys, input_type)
+
+    @staticmethod
+    def _build_filter(filters: dict) -> dict | None:
+        """
+        Translate search filters into an OpenSearch bool filter.
 
-    def query_opensearch(self, query: list[float], k: int = 1):
+        :param filters: dict with optional 'tags' (matches any), 'min_score' and 'created_after'.
+        :return: The bool query, or None if no filter applies.
+        """
+        clauses = []
+        if filters.get("tags"):
+            clauses.append({"terms": {"tags": list(filters["tags"])}})
+        if filters.get("min_score") is not None:
+            clauses.append({"range": {"score": {"gte": filters["min_score"]}}})
+        if filters.get("created_after"):
+            clauses.append({"range": {"creation_date": {"gte": filters["created_after"]}}})
+        return {"bool": {"filter": clauses}} if clauses else None
+
+    def query_opensearch(
+        self,
+        query: list[float],
+        k: int = 1,
+        filters: dict | None = None,
+        source_fields: list[str] | None = None,
+        query_text: str | None = None,
+        ef_search: int | None = None,
+    ):
         """
         Query OpenSearch using the generated embedding with a KNN search.
 
+        Filters are applied inside the kNN search (efficient filtering), so k matching documents
+        are returned even when the filter is selective. With a partitioner, only the partitions
+        the tag filter or the query is classified into are searched; all of them when the
+        classification is not confident or the chosen partitions have no match.
+
         :param query_embedding: The embedding (list/array) to use as the query vector.
         :param k: Number of similar documents to retrieve.
+        :param filters: Optional filters on the typed document fields, see `_build_filter`.
+        :param source_fields: Optional list of `_source` fields to return; all fields when None.
+        :param query_text: Optional query text, used to classify the query into partitions.
+        :param ef_search: Optional HNSW ef_search for this query, overriding the index's value.
         :return: The OpenSearch search response.
         """
 
-        self._create_if_not_exit()
+        if self._partitioner is None:
+            self._create_if_not_exit()
+
+        knn_query = {"vector": query, "k": k}
+        if ef_search is not None:
+            knn_query["method_parameters"] = {"ef_search": ef_search}
+        knn_filter = self._build_filter(filters or {})
+        if knn_filter:
+            knn_query["filter"] = knn_filter
 
-        search_query = {"query": {"knn": {"embedding": {"vector": query, "k": k}}}}
+        search_query = {"size": k, "query": {"knn": {"embedding": knn_query}}}
+        if source_fields is not None:
+            search_query["_source"] = source_fields
 
         logger.info("Querying OpenSearch with a KNN search.")
 
-        # Return top-k documents based on vector similarity
+        if self._partitioner is None:
+            # Return top-k documents based on vector similarity
+            with profile_section("opensearch_search"):
+                results = self._opensearch_client.search(
+                    index=self._index_name, body=search_query
+                )
+            return results["hits"]["hits"]
+
+        partitions = None
+        if filters and filters.get("tags"):
+            partitions = self._partitioner.partitions_for_tags(filters["tags"])
+        if partitions is None:
+            partitions = self._partitioner.classify(query_text, query)
+
+        if partitions:
+            logger.info(f"Searching partitions {', '.join(partitions)}")
+            hits = self._search_indexes([self._partition_index(p) for p in partitions], search_query)
+            if hits:
+                return hits
+        logger.info("Searching all partitions")
+        return self._search_indexes(self.index_names, search_query)
+
+    def _search_indexes(self, index_names: list[str], search_query: dict) -> list[dict]:
+        # Partitions are created lazily on first write, so some may not exist yet
+        with profile_section("opensearch_search"):
+            results = self._opensearch_client.search(
+                index=",".join(index_names), body=search_query, ignore_unavailable=True
+            )
+        return results["hits"]["hits"]
+
+    def suggest_titles(self, prefix: str, size: int = 5) -> list[dict]:
+        """
+        Complete a prefix to question titles with the completion suggester. No embedding is
+        generated, so this runs at plain OpenSearch latency.
+
+        :param prefix: The text typed so far.
+        :param size: Maximum number of suggestions.
+        :return: Suggestions with 'question_id', 'title' and 'score', best first
+        """
+        search_query = {
+            # Without a query the search also returns the first hits of a match_all; skip them
+            "size": 0,
+            "_source": ["question_id", "title"],
+            "suggest": {
+                "titles": {
+                    "prefix": prefix,
+                    "completion": {"field": "title_suggest", "size": size, "skip_duplicates": True},
+                }
+            },
+        }
         results = self._opensearch_client.search(
-            index=self._index_name, body=search_query
+            index=",".join(self.index_names), body=search_query, ignore_unavailable=True
         )
-        return results["hits"]["hits"]
+        # Options of all shards (and partitions) are merged into one top list by OpenSearch
+        return [
+            {
+                "question_id": option["_source"].get("question_id"),
+                "title": option["_source"].get("title", option["text"]),
+                "score": option["_score"],
+            }
+            for suggestion in results["suggest"]["titles"]
+            for option in suggestion["options"]
+        ]
 
-    def check_if_indexed(self, content: str) -> bool:
+    def check_if_indexed(
+        self, content: str, document_id: str | None = None, tags: list[str] | None = None
+    ) -> bool:
         """
         Check whether a given document (by text content) already exists in OpenSearch.
 
         :param content: The full document content used to generate a unique hash-based ID.
+        :param document_id: Optional stable document ID (e.g. the question ID). When given, the
+                            document is only considered indexed if its stored content is unchanged.
+        :param tags: The document's tags, which select its partition when partitioning is enabled.
+                     Copies in other partitions (left behind by a tag change) are looked up in
+                     the same request and deleted when the document is saved.
         :return: True if the document exists in the index, False otherwise.
         """
-        document_id = hashlib.sha256(content.encode()).hexdigest()
-        return self._opensearch_client.exists(self._index_name, document_id)
+        index_name = self._document_index(tags=tags)
+        content_hash = hashlib.sha256(content.encode()).hexdigest()
+        if document_id is None:
+            return self._opensearch_client.exists(index_name, content_hash)
+        if self._partitioner is not None:
+            return self._check_partitions(index_name, document_id, content_hash)
 
-    def save_to_opensearch(self, documents: Iterable[tuple[str, list[float]]]):
+        try:
+            document = self._opensearch_client.get(
+                index=index_name, id=document_id, _source_includes="content_hash"
+            )
+        except NotFoundError:
+            return False
+        return document["_source"].get("content_hash") == content_hash
+
+    def _check_partitions(self, index_name: str, document_id: str, content_hash: str) -> bool:
         """
-        Index a batch of documents into OpenSearch.
-        :param documents: An iterable of (text, embedding) tuples to be indexed.
-                        The text is hashed into a document ID.
+        Look a question up in every partition with one realtime multi-get, and remember the
+        partitions other than index_name holding a copy, so saving the question deletes them.
         """
-        self._create_if_not_exit()
-
-        # Convert (text, vector) pairs into OpenSearch documents with hash-based IDs
-        vectors = [
-            {
-                "_index": self._index_name,
-                "_id": hashlib.sha256(text.encode()).hexdigest(),
-                "embedding": vector,
-                "text": text,
+        response = self._opensearch_client.mget(
+            body={
+                "docs": [
+                    {"_index": name, "_id": document_id, "_source": ["content_hash"]}
+                    for name in self.index_names
+                ]
             }
-            for text, vector in documents
+        )
+        # Partition indexes that do not exist yet come back as errors instead of hits
+        found = {
+            document["_index"]: document["_source"].get("content_hash")
+            for document in response["docs"]
+            if document.get("found")
+        }
+        moved_copies = [name for name in found if name != index_name]
+        if moved_copies:
+            self._moved_copies[document_id] = moved_copies
+            return False
+        self._moved_copies.pop(document_id, None)
+        return found.get(index_name) == content_hash
+
+    def _bulk_body(
+        self, documents: Iterable[tuple[StackOverflowDocument | str, np.ndarray | list[float]]]
+    ) -> bytes:
+        """
+        Serialize (document, embedding) pairs straight into a bulk request body (NDJSON).
+
+        orjson writes float32 vectors from their buffers, so embeddings are never expanded into
+        lists of Python floats on the way to OpenSearch.
+        """
+        lines = []
+        for document, vector in documents:
+            if isinstance(document, StackOverflowDocument):
+                text, fields, document_id = document.text, document.to_source(), document.question_id
+                fields["title_suggest"] = {
+                    "input": [document.title],
+                    # Completion weights must be non-negative integers
+                    "weight": max(document.score or 0, 0),
+                }
+            else:
+                text, fields, document_id = document, {}, None
+
+            content_hash = hashlib.sha256(text.encode()).hexdigest()
+            index_name = self._document_index(document)
+            if document_id and index_name in self._legacy_indexes:
+                lines.append(orjson.dumps({"delete": {"_index": index_name, "_id": content_hash}}))
+            for moved_index in self._moved_copies.pop(document_id, ()):
+                lines.append(orjson.dumps({"delete": {"_index": moved_index, "_id": document_id}}))
+            lines.append(
+                orjson.dumps({"index": {"_index": index_name, "_id": document_id or content_hash}})
+            )
+            lines.append(
+                orjson.dumps(
+                    {
+                        "embedding": vector,
+                        "text": text,
+                        "content_hash": content_hash,
+                        **fields,
+                    },
+                    option=orjson.OPT_SERIALIZE_NUMPY,
+                )
+            )
+        lines.append(b"")
+        return b"\n".join(lines)
+
+    def save_to_opensearch(
+        self,
+        documents: Iterable[tuple[StackOverflowDocument | str, np.ndarray | list[float]]],
+        refresh: bool = True,
+    ):
+        """
+        Index a batch of documents into OpenSearch.
+        :param documents: An iterable of (document, embedding) tuples to be indexed. A document is
+                        either a StackOverflowDocument, stored with its typed fields under its
+                        question ID (replacing its hash-keyed copy in indexes written before
+                        documents had IDs, and copies check_if_indexed found in other
+                        partitions), or plain text, which is hashed into a document ID.
+                        Documents with an existing ID are overwritten. Embeddings may be float32
+                        arrays or lists of floats.
+        :param refresh: Refresh the index so the documents are searchable right away. Bulk loads
+                        skip it per batch and refresh once at the end.
+        :raises BulkIndexError: If any document failed to index.
+        """
+        documents = list(documents)
+        index_names = sorted({self._document_index(document) for document, _ in documents}) or [
+            self._document_index()
         ]
-        logger.info(f"Indexing {len(vectors)} documents into OpenSearch...")
+        for index_name in index_names:
+            self._create_if_not_exit(index_name)
+
+        logger.info(f"Indexing {len(documents)} documents into OpenSearch...")
+
+        errors = []
+        for start in range(0, len(documents), self._BULK_CHUNK_SIZE):
+            with profile_section("bulk_encode"):
+                body = self._bulk_body(documents[start : start + self._BULK_CHUNK_SIZE])
+            with profile_section("opensearch_bulk"):
+                response = self._opensearch_client.bulk(body=body)
+            if response.get("errors"):
+                errors.extend(
+                    item
+                    for item in response["items"]
+                    if "error" in next(iter(item.values()))
+                )
+        if errors:
+            raise helpers.BulkIndexError(f"{len(errors)} document(s) failed to index.", errors)
 
-        helpers.bulk(self._opensearch_client, vectors)
-        self._opensearch_client.indices.refresh(index=self._index_name)
+        if refresh:
+            self._opensearch_client.indices.refresh(index=",".join(index_names))
 
         logger.info("Documents saved to OpenSearch successfully.")
@@ -1,6 +1,34 @@
 import os
 from common.aws import get_bedrock_client, get_opensearch_client
 from common.embeddings import EmbeddingService
+from common.partitions import TagPartitioner
+from common.providers import CohereEmbeddingProvider, LocalEmbeddingProvider
+
+
+def _embedding_provider(bedrock_client, name: str, model_id: str, dimensions: int):
+    """
+    :param name: 'titan' (default), 'cohere' (many texts per request) or 'local'.
+    :return: The embedding provider, or None for the EmbeddingService default (Titan)
+    """
+    if name.lower() == "cohere":
+        return CohereEmbeddingProvider(bedrock_client, model_id, dimensions=dimensions)
+    if name.lower() == "local":
+        return LocalEmbeddingProvider(dimensions)
+    return None
+
+
+def initialize_partitioner() -> TagPartitioner | None:
+    """
+    Create the tag partitioner shared by the Lambdas and the tools: INDEX_PARTITIONS_PATH points
+    to a JSON config (e.g. with centroids), INDEX_PARTITIONING=true uses the default partitions.
+
+    :return: The partitioner, or None if the index is not partitioned
+    """
+    if os.getenv("INDEX_PARTITIONS_PATH"):
+        return TagPartitioner.from_file(os.getenv("INDEX_PARTITIONS_PATH"))
+    if os.getenv("INDEX_PARTITIONING", "false").lower() == "true":
+        return TagPartitioner()
+    return None
 
 
 def initialize_services() -> EmbeddingService:
@@ -23,11 +51,57 @@ def initialize_services() -> EmbeddingService:
     )
     bedrock_client = get_bedrock_client()
 
+    # EMBEDDING_PROVIDER selects how embeddings are generated, see _embedding_provider
+    dimensions = int(os.getenv("EMBEDDING_DIMENSIONS", "1024"))
+    provider = _embedding_provider(
+        bedrock_client,
+        os.getenv("EMBEDDING_PROVIDER", "titan"),
+        os.environ.get("BEDROCK_MODEL_ID"),
+        dimensions,
+    )
+
     embedding_svc = EmbeddingService(
         opensearch_client=opensearch_client,
         bedrock_client=bedrock_client,
         index_name=os.environ.get("OPENSEARCH_INDEX_NAME"),
         model_id=os.environ.get("BEDROCK_MODEL_ID"),
+        partitioner=initialize_partitioner(),
+        provider=provider,
     )
 
     return embedding_svc, bedrock_client
+
+
+def initialize_shadow_service(
+    embedding_svc: EmbeddingService, bedrock_client
+) -> EmbeddingService | None:
+    """
+    Create the embedding service of the shadow index used while migrating to a new embedding
+    model or mapping, when SHADOW_INDEX_NAME is set. Model, provider and dimensions default to
+    those of the current index, so only the settings that change need to be given.
+
+    :param embedding_svc: The embedding service of the current index.
+    :param bedrock_client: The Bedrock client.
+    :return: The shadow embedding service, or None if no migration is configured
+    """
+    if not os.getenv("SHADOW_INDEX_NAME"):
+        return None
+
+    model_id = os.getenv("SHADOW_MODEL_ID", os.environ.get("BEDROCK_MODEL_ID"))
+    dimensions = int(
+        os.getenv("SHADOW_EMBEDDING_DIMENSIONS", os.getenv("EMBEDDING_DIMENSIONS", "1024"))
+    )
+    return EmbeddingService(
+        opensearch_client=embedding_svc.opensearch_client,
+        bedrock_client=bedrock_client,
+        index_name=os.getenv("SHADOW_INDEX_NAME"),
+        model_id=model_id,
+        embedding_dimensions=dimensions,
+        partitioner=embedding_svc.partitioner,
+        provider=_embedding_provider(
+            bedrock_client,
+            os.getenv("SHADOW_EMBEDDING_PROVIDER", os.getenv("EMBEDDING_PROVIDER", "titan")),
+            model_id,
+            dimensions,
+        ),
+    )
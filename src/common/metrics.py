@@ -0,0 +1,21 @@
+import os
+
+from aws_lambda_powertools.metrics import MetricUnit, single_metric
+
+
+def emit_metric(name: str, value: float, unit: MetricUnit = MetricUnit.Count, **dimensions):
+    """
+    Emit a single CloudWatch metric in Embedded Metric Format (EMF).
+
+    The metric is flushed to stdout immediately, so it can be called from anywhere in a
+    Lambda invocation without decorating the handler.
+
+    :param name: The metric name.
+    :param value: The metric value.
+    :param unit: The metric unit (default: Count).
+    :param dimensions: Optional metric dimensions as keyword arguments.
+    """
+    namespace = os.getenv("POWERTOOLS_METRICS_NAMESPACE", "CodeQuest")
+    with single_metric(name=name, unit=unit, value=value, namespace=namespace) as metric:
+        for key, dimension_value in dimensions.items():
+            metric.add_dimension(name=key, value=str(dimension_value))
@@ -0,0 +1,141 @@
+import json
+import re
+
+import numpy as np
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+# Partition name -> StackOverflow tags routed to it. A document goes to the first partition
+# sharing a tag with it; documents without a matching tag go to the default partition. Tags shared
+# by several languages (e.g. 'dataframe', 'pointers') are left out, so they cannot pull an R or
+# Go question into the wrong partition.
+DEFAULT_PARTITIONS = {
+    "python": ["python", "python-3.x", "pandas", "numpy", "django", "flask"],
+    "javascript": ["javascript", "typescript", "node.js", "reactjs", "angular", "vue.js", "jquery"],
+    "java": ["java", "spring", "spring-boot", "maven", "gradle", "kotlin", "android"],
+    "sql": ["sql", "mysql", "postgresql", "sql-server", "sqlite", "oracle", "tsql"],
+    "csharp": ["c#", ".net", "asp.net", "asp.net-core", "linq", "entity-framework"],
+    "cpp": ["c++", "c", "c++11", "c++17", "stl"],
+}
+
+# Tags that route documents but are too generic to match as words in query text ("plan c")
+KEYWORD_EXCLUDES = {"c"}
+
+DEFAULT_PARTITION = "other"
+
+
+class TagPartitioner:
+    """
+    Routes documents into per-language partitions by their StackOverflow tags, and picks the
+    partitions a query should search.
+
+    Queries are classified by keyword rules first (a partition's tags mentioned in the query)
+    and then, if partition centroids are configured, by the nearest centroid of the query
+    embedding. When neither is confident, `classify` returns None and the caller searches
+    every partition.
+    """
+
+    def __init__(
+        self,
+        partitions: dict[str, list[str]] | None = None,
+        default: str = DEFAULT_PARTITION,
+        centroids: dict[str, list[float]] | None = None,
+        min_similarity: float = 0.3,
+        min_margin: float = 0.05,
+    ):
+        """
+        :param partitions: Partition name -> tags routed to it; defaults to DEFAULT_PARTITIONS.
+        :param default: Partition of documents without a matching tag.
+        :param centroids: Optional partition name -> mean embedding of its documents.
+        :param min_similarity: Lowest cosine similarity to the nearest centroid to pick it.
+        :param min_margin: Lowest similarity lead of the nearest centroid over the runner-up.
+        """
+        self._partitions = partitions or DEFAULT_PARTITIONS
+        self._default = default
+        self._tag_partition = {}
+        for name, tags in self._partitions.items():
+            for tag in tags:
+                self._tag_partition.setdefault(tag.lower(), name)
+        # Tags as whole words in a query; tags like "c#" or "node.js" end in non-word characters
+        self._keyword_patterns = {
+            name: re.compile(
+                "|".join(
+                    rf"(?<![\w#+.-]){re.escape(tag.lower())}(?![\w#+-])"
+                    for tag in tags
+                    if tag.lower() not in KEYWORD_EXCLUDES
+                )
+            )
+            for name, tags in self._partitions.items()
+        }
+
+        self._centroid_names = list(centroids or {})
+        self._centroids = None
+        if centroids:
+            matrix = np.asarray([centroids[name] for name in self._centroid_names], dtype=np.float32)
+            self._centroids = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._min_similarity = min_similarity
+        self._min_margin = min_margin
+
+    @classmethod
+    def from_file(cls, path: str) -> "TagPartitioner":
+        """
+        Load a partitioner from a JSON file with optional 'partitions', 'default' and 'centroids'
+        keys, e.g. as written by `tools.partitions centroids`.
+        """
+        with open(path) as f:
+            config = json.load(f)
+        return cls(
+            partitions=config.get("partitions"),
+            default=config.get("default", DEFAULT_PARTITION),
+            centroids=config.get("centroids"),
+        )
+
+    @property
+    def partitions(self) -> list[str]:
+        """All partition names, the default partition last."""
+        return [*self._partitions, self._default]
+
+    def partition_for_tags(self, tags: list[str] | None) -> str:
+        """:return: The partition a document with the given tags is stored in"""
+        matches = {self._tag_partition.get(tag.lower()) for tag in tags or []} - {None}
+        # Follow the configured order when tags match several partitions
+        return next((name for name in self._partitions if name in matches), self._default)
+
+    def partitions_for_tags(self, tags: list[str]) -> list[str] | None:
+        """
+        :return: The partitions holding documents with any of the given tags, or None if a tag
+                 is not routed to a partition (and may be in any of them)
+        """
+        partitions = {self._tag_partition.get(tag.lower()) for tag in tags}
+        if None in partitions:
+            return None
+        return [name for name in self._partitions if name in partitions]
+
+    def classify(self, query_text: str | None, embedding=None) -> list[str] | None:
+        """
+        Pick the partitions a query should search.
+
+        :param query_text: The user query.
+        :param embedding: The query embedding, used with the partition centroids.
+        :return: The partitions to search, or None to search all of them
+        """
+        if query_text:
+            text = query_text.lower()
+            matches = [name for name, pattern in self._keyword_patterns.items() if pattern.search(text)]
+            if len(matches) == 1:
+                return matches
+            if matches:
+                # Several languages mentioned: too ambiguous to narrow down
+                return None
+
+        if self._centroids is not None and embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            similarities = self._centroids @ (vector / (np.linalg.norm(vector) or 1.0))
+            order = np.argsort(similarities)[::-1]
+            best = float(similarities[order[0]])
+            runner_up = float(similarities[order[1]]) if len(order) > 1 else -1.0
+            if best >= self._min_similarity and best - runner_up >= self._min_margin:
+                return [self._centroid_names[order[0]]]
+
+        return None
@@ -0,0 +1,218 @@
+import cProfile
+import functools
+import json
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import boto3
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+PROFILE_MODES = ("sample", "cprofile")
+
+# The profiling session of the running invocation; None when profiling is off, which is the only
+# thing profile_section checks
+_session = None
+
+
+class SamplingProfiler:
+    """
+    A wall-clock sampling profiler: a background thread records the stack of every other thread
+    at a fixed interval, so worker threads (e.g. of the ingestion pipeline) are covered too and
+    the profiled code runs unmodified. Stacks are aggregated in collapsed format ('frame;frame
+    count' per line), which flamegraph.pl, speedscope and inferno read directly.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        """
+        :param interval: Seconds between samples.
+        """
+        self._interval = interval
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self._interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self._stacks[";".join([names.get(ident, "thread"), *reversed(stack)])] += 1
+
+    def stop(self) -> bytes:
+        """:return: The collected stacks in collapsed format"""
+        self._stop.set()
+        self._thread.join()
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common()).encode()
+
+
+class _CProfiler:
+    """Deterministic profiling of the handler thread with cProfile, written as pstats data."""
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self) -> bytes:
+        self._profile.disable()
+        self._profile.create_stats()
+        # The format pstats.Stats.dump_stats writes, readable by pstats and snakeviz
+        return marshal.dumps(self._profile.stats)
+
+
+class _Session:
+    """Timings of the named sections of one profiled invocation."""
+
+    def __init__(self):
+        self.sections: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            section = self.sections.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            section["count"] += 1
+            section["total_ms"] += seconds * 1000
+            section["max_ms"] = max(section["max_ms"], seconds * 1000)
+
+
+@contextmanager
+def profile_section(name: str):
+    """
+    Time a block of code (e.g. a client call or JSON encoding) in the running profiling session.
+    A no-op when profiling is off.
+
+    :param name: The section name; timings of sections with the same name are summed.
+    """
+    session = _session
+    if session is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        session.record(name, time.perf_counter() - start)
+
+
+class LocalProfileSink:
+    """Writes profiles to a local directory."""
+
+    def __init__(self, directory: str):
+        self._directory = directory
+
+    def write(self, key: str, data: bytes) -> str:
+        path = os.path.join(self._directory, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+
+class S3ProfileSink:
+    """Writes profiles to an S3 (or S3-compatible) bucket."""
+
+    def __init__(self, s3_client, bucket: str, prefix: str = ""):
+        self._s3_client = s3_client
+        self._bucket = bucket
+        self._prefix = prefix.strip("/")
+
+    def write(self, key: str, data: bytes) -> str:
+        key = f"{self._prefix}/{key}" if self._prefix else key
+        self._s3_client.put_object(Bucket=self._bucket, Key=key, Body=data)
+        return f"s3://{self._bucket}/{key}"
+
+
+def sink_from_uri(uri: str) -> LocalProfileSink | S3ProfileSink:
+    """:param uri: 's3://bucket/prefix' or a local directory."""
+    url = urlparse(uri)
+    if url.scheme == "s3":
+        endpoint_url = os.getenv("PROFILE_S3_ENDPOINT_URL")
+        return S3ProfileSink(boto3.client("s3", endpoint_url=endpoint_url), url.netloc, url.path)
+    return LocalProfileSink(uri)
+
+
+def profile_handler(name: str):
+    """
+    Decorate a Lambda handler with an opt-in profiler.
+
+    Profiling is on for every invocation when PROFILE_MODE is set ('sample' or 'cprofile'), or
+    for a single invocation whose event has a top-level 'profile' key (true, or a mode). API
+    Gateway requests cannot set top-level event keys, so only direct invocations can ask for a
+    profile. The profile ('.collapsed' stacks or '.pstats'), and a '.sections.json' with the
+    timed sections (see profile_section), are written to PROFILE_SINK (a local directory or
+    's3://bucket/prefix', default /tmp/profiles). When profiling is off, the wrapper only reads
+    the event's 'profile' key.
+
+    :param name: The handler name, used as the key prefix of its profiles.
+    """
+    default_mode = os.getenv("PROFILE_MODE") or None
+    interval = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            requested = event.get("profile") if isinstance(event, dict) else None
+            mode = default_mode
+            if requested:
+                mode = requested if requested in PROFILE_MODES else "sample"
+            if mode is None:
+                return handler(event, context)
+            return _run_profiled(name, mode, interval, handler, event, context)
+
+        return wrapper
+
+    return decorator
+
+
+def _run_profiled(name: str, mode: str, interval: float, handler, event, context):
+    global _session
+
+    profiler = _CProfiler() if mode == "cprofile" else SamplingProfiler(interval)
+    _session = session = _Session()
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        return handler(event, context)
+    finally:
+        data = profiler.stop()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        _session = None
+
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        request_id = getattr(context, "aws_request_id", None) or "local"
+        key = f"{name}/{timestamp}-{request_id}"
+        try:
+            sink = sink_from_uri(os.getenv("PROFILE_SINK", "/tmp/profiles"))
+            location = sink.write(f"{key}.{'pstats' if mode == 'cprofile' else 'collapsed'}", data)
+            sink.write(
+                f"{key}.sections.json",
+                json.dumps({"mode": mode, "elapsed_ms": elapsed_ms, "sections": session.sections}).encode(),
+            )
+            logger.info(
+                f"Wrote {mode} profile to {location}",
+                extra={"elapsed_ms": round(elapsed_ms, 2), "sections": session.sections},
+            )
+        except Exception as e:
+            # Profiling must never fail the invocation
+            logger.warning(f"Could not write the profile: {e}")
@@ -0,0 +1,288 @@
+import hashlib
+import json
+import time
+from typing import Protocol
+
+import numpy as np
+import orjson
+
+from common.profiling import profile_section
+from common.usage import INVOCATION_LATENCY_HEADER, BedrockUsage
+
+# Response header with the number of input tokens of an InvokeModel call
+INPUT_TOKEN_COUNT_HEADER = "x-amzn-bedrock-input-token-count"
+
+# Input types of embed_batch: documents being indexed, or queries searching them. Models like
+# Cohere Embed embed them differently; Titan embeds both alike.
+SEARCH_DOCUMENT = "search_document"
+SEARCH_QUERY = "search_query"
+
+
+def pack_batches(texts: list[str], max_count: int, max_chars: int | None = None) -> list[list[int]]:
+    """
+    Pack texts into consecutive batches that respect a provider's request limits.
+
+    :param texts: The texts to embed.
+    :param max_count: Maximum number of texts per request.
+    :param max_chars: Optional maximum total characters per request; a longer text gets a batch
+                      of its own.
+    :return: Lists of text positions, one list per request
+    """
+    batches, batch, chars = [], [], 0
+    for position, text in enumerate(texts):
+        if batch and (
+            len(batch) >= max_count or (max_chars is not None and chars + len(text) > max_chars)
+        ):
+            batches.append(batch)
+            batch, chars = [], 0
+        batch.append(position)
+        chars += len(text)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class EmbeddingProvider(Protocol):
+    """
+    The interface of an embedding provider.
+    """
+
+    model_id: str
+    dimensions: int
+    # Request limits: maximum texts, and total characters (or None), per embed_batch request
+    max_batch_size: int
+    max_batch_chars: int | None
+    # Whether Bedrock batch inference accepts the model's requests and returns an 'embedding'
+    supports_batch_inference: bool
+
+    def build_request(self, text: str) -> dict:
+        """
+        :param text: The text to generate embedding for.
+        :return: The model input for a single text
+        """
+        ...
+
+    def embed_batch(
+        self,
+        texts: list[str],
+        usage: BedrockUsage | None = None,
+        keys: list | None = None,
+        input_type: str = SEARCH_DOCUMENT,
+    ) -> np.ndarray:
+        """
+        :param texts: The texts to embed.
+        :param usage: Optional accumulator of the token usage and latency of the calls.
+        :param keys: Optional identifiers of the texts, recorded with their usage.
+        :param input_type: SEARCH_DOCUMENT to index the texts, SEARCH_QUERY to search with them.
+        :return: A float32 matrix with one embedding per text
+        """
+        ...
+
+
+class TitanEmbeddingProvider:
+    """
+    Amazon Titan text embeddings (v2): one text per InvokeModel request.
+    """
+
+    max_batch_size = 1
+    max_batch_chars = None
+    supports_batch_inference = True
+
+    def __init__(self, bedrock_client, model_id: str, dimensions: int = 1024):
+        """
+        :param bedrock_client: The Amazon Bedrock runtime client.
+        :param model_id: The Titan embedding model ID.
+        :param dimensions: Embedding size (256, 512 or 1024).
+        """
+        self._bedrock_client = bedrock_client
+        self.model_id = model_id
+        self.dimensions = dimensions
+
+    def build_request(self, text: str) -> dict:
+        """
+        Build the Titan request body for a text. Shared by synchronous calls and batch inference input.
+
+        :param text: The text to generate embedding for.
+        :return: The model input
+        """
+        return {
+            "inputText": text,
+            "dimensions": self.dimensions,
+            "normalize": True,
+        }
+
+    def embed_batch(
+        self,
+        texts: list[str],
+        usage: BedrockUsage | None = None,
+        keys: list | None = None,
+        input_type: str = SEARCH_DOCUMENT,
+    ) -> np.ndarray:
+        """
+        :param texts: The texts to embed, one request each.
+        :param usage: Optional accumulator of the token usage and latency of the calls.
+        :param keys: Optional identifiers of the texts (e.g. question IDs), recorded with their usage.
+        :param input_type: Ignored; Titan embeds documents and queries alike.
+        :return: A float32 matrix with one embedding per text
+        """
+        keys = keys or [None] * len(texts)
+        embeddings = []
+        for text, key in zip(texts, keys):
+            start = time.perf_counter()
+            with profile_section("bedrock_invoke_model"):
+                response = self._bedrock_client.invoke_model(
+                    body=json.dumps(self.build_request(text)),
+                    modelId=self.model_id,
+                    accept="application/json",
+                    contentType="application/json",
+                )
+            response_body = orjson.loads(response.get("body").read())
+            if usage is not None:
+                headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+                latency = headers.get(INVOCATION_LATENCY_HEADER)
+                usage.add(
+                    self.model_id,
+                    input_tokens=response_body.get("inputTextTokenCount", 0),
+                    bedrock_ms=float(latency) if latency is not None else None,
+                    elapsed_ms=(time.perf_counter() - start) * 1000,
+                    key=key,
+                )
+            embeddings.append(response_body["embedding"])
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+
+
+class CohereEmbeddingProvider:
+    """
+    Cohere Embed (v3) on Bedrock: up to 96 texts per InvokeModel request.
+
+    Texts are clipped to the 2048 characters the model accepts per text.
+    """
+
+    max_batch_size = 96
+    max_text_chars = 2048
+    max_batch_chars = max_batch_size * max_text_chars
+    supports_batch_inference = False
+
+    def __init__(
+        self,
+        bedrock_client,
+        model_id: str = "cohere.embed-english-v3",
+        dimensions: int = 1024,
+    ):
+        """
+        :param bedrock_client: The Amazon Bedrock runtime client.
+        :param model_id: The Cohere embedding model ID.
+        :param dimensions: Embedding size of the model.
+        """
+        self._bedrock_client = bedrock_client
+        self.model_id = model_id
+        self.dimensions = dimensions
+
+    def build_request(self, text: str) -> dict:
+        """
+        :param text: The text to generate embedding for.
+        :return: The model input for a single document text
+        """
+        return self._build_batch_request([text], SEARCH_DOCUMENT)
+
+    def _build_batch_request(self, texts: list[str], input_type: str) -> dict:
+        return {
+            "texts": [text[: self.max_text_chars] for text in texts],
+            "input_type": input_type,
+            "truncate": "END",
+        }
+
+    def embed_batch(
+        self,
+        texts: list[str],
+        usage: BedrockUsage | None = None,
+        keys: list | None = None,
+        input_type: str = SEARCH_DOCUMENT,
+    ) -> np.ndarray:
+        """
+        :param texts: The texts to embed, packed into as few requests as the limits allow.
+        :param usage: Optional accumulator of the token usage and latency of the calls.
+        :param keys: Optional identifiers of the texts; only recorded for single-text requests,
+                     as Bedrock reports tokens per request.
+        :param input_type: SEARCH_DOCUMENT to index the texts, SEARCH_QUERY to search with them.
+        :return: A float32 matrix with one embedding per text
+        """
+        keys = keys or [None] * len(texts)
+        texts = [text[: self.max_text_chars] for text in texts]
+        embeddings = []
+        # Batches are consecutive, so their vectors are concatenated in text order
+        for batch in pack_batches(texts, self.max_batch_size, self.max_batch_chars):
+            start = time.perf_counter()
+            with profile_section("bedrock_invoke_model"):
+                response = self._bedrock_client.invoke_model(
+                    body=json.dumps(
+                        self._build_batch_request(
+                            [texts[position] for position in batch], input_type
+                        )
+                    ),
+                    modelId=self.model_id,
+                    accept="application/json",
+                    contentType="application/json",
+                )
+            response_body = orjson.loads(response.get("body").read())
+            if usage is not None:
+                headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+                latency = headers.get(INVOCATION_LATENCY_HEADER)
+                usage.add(
+                    self.model_id,
+                    input_tokens=int(headers.get(INPUT_TOKEN_COUNT_HEADER, 0)),
+                    bedrock_ms=float(latency) if latency is not None else None,
+                    elapsed_ms=(time.perf_counter() - start) * 1000,
+                    key=keys[batch[0]] if len(batch) == 1 else None,
+                )
+            vectors = response_body["embeddings"]
+            # Requests with 'embedding_types' return the vectors per type
+            if isinstance(vectors, dict):
+                vectors = vectors["float"]
+            embeddings.extend(vectors)
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+
+
+class LocalEmbeddingProvider:
+    """
+    A deterministic, offline embedding provider for tests and local runs.
+
+    Each text is mapped to a unit vector seeded by its hash, so equal texts get equal embeddings
+    and different texts are nearly orthogonal. It carries no meaning beyond identity.
+    """
+
+    max_batch_size = 1024
+    max_batch_chars = None
+    supports_batch_inference = False
+
+    def __init__(self, dimensions: int = 1024, model_id: str = "local"):
+        """
+        :param dimensions: Embedding size.
+        :param model_id: Name the provider reports as its model.
+        """
+        self.model_id = model_id
+        self.dimensions = dimensions
+
+    def build_request(self, text: str) -> dict:
+        return {"inputText": text}
+
+    def embed_batch(
+        self,
+        texts: list[str],
+        usage: BedrockUsage | None = None,
+        keys: list | None = None,
+        input_type: str = SEARCH_DOCUMENT,
+    ) -> np.ndarray:
+        """
+        :param texts: The texts to embed.
+        :param usage: Ignored; the provider makes no Bedrock calls.
+        :param keys: Ignored.
+        :param input_type: Ignored.
+        :return: A float32 matrix with one unit-length embedding per text
+        """
+        embeddings = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dimensions)
+            embeddings[row] = vector / np.linalg.norm(vector)
+        return embeddings
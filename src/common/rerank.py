@@ -0,0 +1,110 @@
+import numpy as np
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def score_gap_cutoff(scores, max_gap: float) -> int:
+    """
+    Find where the scores of a descending result list drop off sharply.
+
+    :param scores: Search scores, sorted in descending order.
+    :param max_gap: The largest allowed drop between two consecutive scores.
+    :return: The number of leading results to keep.
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    if len(scores) < 2:
+        return len(scores)
+
+    gaps = scores[:-1] - scores[1:]
+    drops = np.flatnonzero(gaps > max_gap)
+    return int(drops[0]) + 1 if len(drops) else len(scores)
+
+
+def maximal_marginal_relevance(
+    query_vector,
+    doc_vectors,
+    k: int,
+    diversity: float = 0.5,
+    duplicate_threshold: float = 1.0,
+) -> list[int]:
+    """
+    Select documents that are relevant to the query but not redundant with each other.
+
+    Each step picks the candidate maximizing
+    ``(1 - diversity) * sim(query, doc) - diversity * max(sim(doc, selected))``.
+    Candidates whose cosine similarity to an already selected document is at or above
+    ``duplicate_threshold`` are never picked, so near-identical documents are dropped.
+
+    :param query_vector: The query embedding.
+    :param doc_vectors: A (n, d) matrix of candidate embeddings.
+    :param k: The maximum number of documents to select.
+    :param diversity: 0 ranks purely by relevance, 1 purely by novelty.
+    :param duplicate_threshold: Similarity at which a candidate counts as a duplicate.
+    :return: Indexes of the selected documents in selection order.
+    """
+    docs = _normalize_rows(np.asarray(doc_vectors, dtype=np.float32))
+    query = _normalize_rows(np.asarray(query_vector, dtype=np.float32))
+    if len(docs) == 0 or k <= 0:
+        return []
+
+    relevance = docs @ query
+    pairwise = docs @ docs.T
+
+    # Highest similarity of every candidate to the documents selected so far
+    redundancy = np.full(len(docs), -np.inf, dtype=np.float32)
+    available = np.ones(len(docs), dtype=bool)
+    selected: list[int] = []
+
+    while len(selected) < k and available.any():
+        if selected:
+            mmr = (1 - diversity) * relevance - diversity * redundancy
+        else:
+            mmr = relevance.copy()
+        mmr[~available] = -np.inf
+
+        best = int(np.argmax(mmr))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, pairwise[best])
+        available &= redundancy < duplicate_threshold
+
+    return selected
+
+
+def rerank_hits(
+    query_vector,
+    hits: list[dict],
+    k: int,
+    diversity: float = 0.5,
+    max_score_gap: float | None = None,
+    duplicate_threshold: float = 0.98,
+) -> list[dict]:
+    """
+    Narrow over-fetched OpenSearch hits down to the fewest, most diverse documents.
+
+    Hits after a sharp score drop are discarded first, then the remainder are reranked with
+    maximal marginal relevance using the embeddings stored in each hit's ``_source``.
+    Hits without an embedding are ranked by score only.
+
+    :param query_vector: The query embedding.
+    :param hits: OpenSearch hits, sorted by descending score.
+    :param k: The maximum number of hits to keep.
+    :param diversity: The MMR trade-off between relevance and novelty.
+    :param max_score_gap: Optional largest allowed drop between consecutive scores.
+    :param duplicate_threshold: Similarity at which a hit counts as a duplicate.
+    :return: The selected hits.
+    """
+    if max_score_gap is not None:
+        hits = hits[: score_gap_cutoff([hit["_score"] for hit in hits], max_score_gap)]
+
+    if not hits or any("embedding" not in hit["_source"] for hit in hits):
+        return hits[:k]
+
+    vectors = np.array([hit["_source"]["embedding"] for hit in hits], dtype=np.float32)
+    selected = maximal_marginal_relevance(
+        query_vector, vectors, k, diversity, duplicate_threshold
+    )
+    return [hits[i] for i in selected]
@@ -0,0 +1,278 @@
+import json
+import threading
+import time
+import uuid
+
+from aws_lambda_powertools import Logger
+from botocore.exceptions import ClientError
+
+from common.metrics import emit_metric
+
+logger = Logger()
+
+
+class LocalCacheBackend:
+    """
+    An in-process cache backend with per-entry expiry.
+
+    Stands in for the shared backends in local runs and tests; it is only shared between the
+    threads of one process.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, tuple[float, dict]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            self._entries.pop(key, None)
+            return None
+        return entry[1]
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key: str, value: dict, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+
+    def add(self, key: str, value: dict, ttl: float) -> bool:
+        """Set the key only if it is absent (or expired). :return: True if it was set"""
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._entries[key] = (time.time() + ttl, value)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_if(self, key: str, value: dict):
+        """Delete the key only if it still holds the given value."""
+        with self._lock:
+            if self._live(key) == value:
+                del self._entries[key]
+
+
+class RedisCacheBackend:
+    """
+    A cache backend on any Redis-protocol server (Redis, Valkey, ElastiCache).
+    """
+
+    # Compare-and-delete in one step, so a lock that expired and was taken over is left alone
+    _DELETE_IF_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+    def __init__(self, redis_client, prefix: str = "codequest:"):
+        """
+        :param redis_client: A redis-py compatible client.
+        :param prefix: Prefix of every key, to share a server with other applications.
+        """
+        self._redis_client = redis_client
+        self._prefix = prefix
+
+    def get(self, key: str) -> dict | None:
+        value = self._redis_client.get(self._prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value: dict, ttl: float):
+        self._redis_client.set(self._prefix + key, json.dumps(value), px=int(ttl * 1000))
+
+    def add(self, key: str, value: dict, ttl: float) -> bool:
+        """Set the key only if it is absent (or expired). :return: True if it was set"""
+        return bool(
+            self._redis_client.set(self._prefix + key, json.dumps(value), px=int(ttl * 1000), nx=True)
+        )
+
+    def delete(self, key: str):
+        self._redis_client.delete(self._prefix + key)
+
+    def delete_if(self, key: str, value: dict):
+        """Delete the key only if it still holds the given value."""
+        self._redis_client.eval(self._DELETE_IF_SCRIPT, 1, self._prefix + key, json.dumps(value))
+
+
+class DynamoDbCacheBackend:
+    """
+    A cache backend on a DynamoDB (or DynamoDB-compatible) table with a string 'cache_key'
+    partition key. Entries carry an 'expires_at' epoch timestamp; DynamoDB TTL on that attribute
+    deletes expired entries eventually, so reads check the expiry themselves.
+    """
+
+    def __init__(self, dynamodb_client, table_name: str):
+        """
+        :param dynamodb_client: A boto3 DynamoDB client.
+        :param table_name: The name of the cache table.
+        """
+        self._dynamodb_client = dynamodb_client
+        self._table_name = table_name
+
+    def _item(self, key: str, value: dict, ttl: float) -> dict:
+        return {
+            "cache_key": {"S": key},
+            "value": {"S": json.dumps(value)},
+            "expires_at": {"N": str(int(time.time() + ttl))},
+        }
+
+    def get(self, key: str) -> dict | None:
+        item = self._dynamodb_client.get_item(
+            TableName=self._table_name, Key={"cache_key": {"S": key}}, ConsistentRead=True
+        ).get("Item")
+        if item is None or int(item["expires_at"]["N"]) <= time.time():
+            return None
+        return json.loads(item["value"]["S"])
+
+    def set(self, key: str, value: dict, ttl: float):
+        self._dynamodb_client.put_item(TableName=self._table_name, Item=self._item(key, value, ttl))
+
+    def add(self, key: str, value: dict, ttl: float) -> bool:
+        """Set the key only if it is absent (or expired). :return: True if it was set"""
+        try:
+            self._dynamodb_client.put_item(
+                TableName=self._table_name,
+                Item=self._item(key, value, ttl),
+                ConditionExpression="attribute_not_exists(cache_key) OR expires_at <= :now",
+                ExpressionAttributeValues={":now": {"N": str(int(time.time()))}},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    def delete(self, key: str):
+        self._dynamodb_client.delete_item(TableName=self._table_name, Key={"cache_key": {"S": key}})
+
+    def delete_if(self, key: str, value: dict):
+        """Delete the key only if it still holds the given value."""
+        try:
+            self._dynamodb_client.delete_item(
+                TableName=self._table_name,
+                Key={"cache_key": {"S": key}},
+                # 'value' is a DynamoDB reserved word
+                ConditionExpression="#v = :value",
+                ExpressionAttributeNames={"#v": "value"},
+                ExpressionAttributeValues={":value": {"S": json.dumps(value)}},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+
+class SharedCache:
+    """
+    A response cache shared by all Query Lambda containers, with single-flight request coalescing.
+
+    The first request for a key takes a short-lived lock and computes the response; concurrent
+    requests for the same key (in any container) wait for its result instead of calling Titan,
+    OpenSearch and Haiku again. Responses without matches are cached too, for a shorter time.
+    Only successful and no-match responses are cached, and a failing backend never fails the
+    request: it is then computed without the cache.
+
+    A failed computation is not cached for new requests, but is kept for `error_ttl` seconds for
+    the requests that were waiting on it: they return the same failure rather than taking the
+    lock and computing it again one after another.
+    """
+
+    def __init__(
+        self,
+        backend: LocalCacheBackend | RedisCacheBackend | DynamoDbCacheBackend,
+        ttl: float = 300,
+        negative_ttl: float = 60,
+        lock_ttl: float = 30,
+        error_ttl: float = 5,
+        wait_timeout: float = 10,
+        poll_interval: float = 0.05,
+    ):
+        """
+        :param backend: Where entries and locks are stored.
+        :param ttl: Seconds a successful response is cached.
+        :param negative_ttl: Seconds a no-match (404) response is cached.
+        :param lock_ttl: Seconds after which the lock of a crashed computation expires.
+        :param error_ttl: Seconds a failed computation is kept for the requests waiting on it.
+        :param wait_timeout: Maximum seconds to wait for another request's result before
+                             computing the response independently.
+        :param poll_interval: Seconds between checks for another request's result.
+        """
+        self._backend = backend
+        self._ttls = {200: ttl, 404: negative_ttl}
+        self._lock_ttl = lock_ttl
+        self._error_ttl = error_ttl
+        self._wait_timeout = wait_timeout
+        self._poll_interval = poll_interval
+
+    def get_or_compute(self, key: str, compute) -> dict:
+        """
+        :param key: The cache key of the request.
+        :param compute: Called without arguments to compute the response on a miss.
+        :return: The cached or computed response
+        """
+        lock_key, error_key = f"{key}:lock", f"{key}:error"
+        # A unique owner, so a request whose lock expired cannot release a lock taken over since
+        lock = {"owner": uuid.uuid4().hex}
+        deadline = time.monotonic() + self._wait_timeout
+        waited = False
+        while True:
+            failure = None
+            try:
+                cached = self._backend.get(key)
+                if cached is None and self._backend.add(lock_key, lock, self._lock_ttl):
+                    # The lock was released without a result: the request we waited on failed
+                    failure = self._backend.get(error_key) if waited else None
+                    if failure is None:
+                        break
+                    self._release(key, lock_key, lock)
+            except Exception as e:
+                logger.warning(f"Shared cache unavailable, computing without it: {e}")
+                return compute()
+
+            if failure is not None:
+                emit_metric("SharedCacheCoalescedFailure", 1)
+                # Without a response the failed request raised; compute once, without the lock
+                return failure["response"] or compute()
+
+            if cached is not None:
+                emit_metric("SharedCacheCoalesced" if waited else "SharedCacheHit", 1)
+                return cached
+            if time.monotonic() >= deadline:
+                logger.warning(f"Timed out waiting for a coalesced result of {key}")
+                emit_metric("SharedCacheWaitTimeout", 1)
+                return compute()
+            # Another request is computing this response
+            waited = True
+            time.sleep(self._poll_interval)
+
+        emit_metric("SharedCacheMiss", 1)
+        try:
+            try:
+                response = compute()
+            except Exception:
+                self._store(error_key, {"response": None}, self._error_ttl)
+                raise
+            ttl = self._ttls.get(response.get("statusCode"))
+            if ttl:
+                self._store(key, response, ttl)
+            else:
+                self._store(error_key, {"response": response}, self._error_ttl)
+            return response
+        finally:
+            self._release(key, lock_key, lock)
+
+    def _store(self, key: str, value: dict, ttl: float):
+        try:
+            self._backend.set(key, value, ttl)
+        except Exception as e:
+            logger.warning(f"Could not store {key} in the shared cache: {e}")
+
+    def _release(self, key: str, lock_key: str, lock: dict):
+        try:
+            self._backend.delete_if(lock_key, lock)
+        except Exception as e:
+            logger.warning(f"Could not release the shared cache lock of {key}: {e}")
@@ -0,0 +1,107 @@
+import heapq
+import threading
+
+from aws_lambda_powertools.metrics import MetricUnit
+
+from common.metrics import emit_metric
+
+# Response header with the model-side latency of an InvokeModel call
+INVOCATION_LATENCY_HEADER = "x-amzn-bedrock-invocation-latency"
+
+
+class BedrockUsage:
+    """
+    Accumulates token counts and latency of Bedrock calls, per model, over one query or one
+    ingestion run. Safe to share between threads.
+
+    Bedrock reports how long the model took ('bedrock_ms'); the rest of the time measured around
+    the call ('overhead_ms') is network, SDK and retry overhead on our side. The largest inputs
+    are kept by key (e.g. question ID) to tell which documents drive cost.
+    """
+
+    def __init__(self, top_n: int = 5):
+        """
+        :param top_n: Number of largest inputs to keep.
+        """
+        self._top_n = top_n
+        self._models: dict[str, dict] = {}
+        self._largest: list[tuple[int, str]] = []  # min-heap of (input tokens, key)
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        model_id: str,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        bedrock_ms: float | None = None,
+        elapsed_ms: float | None = None,
+        key: str | None = None,
+    ):
+        """
+        Record one Bedrock call.
+
+        :param model_id: The invoked model.
+        :param input_tokens: Input tokens reported by Bedrock.
+        :param output_tokens: Output tokens reported by Bedrock.
+        :param bedrock_ms: Model latency reported by Bedrock, if any.
+        :param elapsed_ms: Time measured around the call by the caller.
+        :param key: Optional identifier of the input, e.g. a question ID.
+        """
+        with self._lock:
+            totals = self._models.setdefault(
+                model_id,
+                {"calls": 0, "input_tokens": 0, "output_tokens": 0, "bedrock_ms": 0.0, "overhead_ms": 0.0},
+            )
+            totals["calls"] += 1
+            totals["input_tokens"] += input_tokens
+            totals["output_tokens"] += output_tokens
+            if bedrock_ms is not None:
+                totals["bedrock_ms"] += bedrock_ms
+                if elapsed_ms is not None:
+                    totals["overhead_ms"] += max(elapsed_ms - bedrock_ms, 0.0)
+
+            if key is not None and self._top_n:
+                entry = (input_tokens, str(key))
+                if len(self._largest) < self._top_n:
+                    heapq.heappush(self._largest, entry)
+                elif entry > self._largest[0]:
+                    heapq.heapreplace(self._largest, entry)
+
+    def to_dict(self) -> dict:
+        """
+        :return: Totals per model ('calls', 'input_tokens', 'output_tokens', 'bedrock_ms',
+                 'overhead_ms') and the largest inputs, largest first
+        """
+        with self._lock:
+            return {
+                "models": {
+                    model_id: {
+                        **totals,
+                        "bedrock_ms": round(totals["bedrock_ms"], 2),
+                        "overhead_ms": round(totals["overhead_ms"], 2),
+                    }
+                    for model_id, totals in self._models.items()
+                },
+                "largest_inputs": [
+                    {"key": key, "input_tokens": tokens}
+                    for tokens, key in sorted(self._largest, reverse=True)
+                ],
+            }
+
+    def emit_metrics(self, **dimensions):
+        """
+        Emit the totals of each model as BedrockCalls, BedrockInputTokens, BedrockOutputTokens,
+        BedrockLatency and BedrockOverhead metrics.
+
+        :param dimensions: Extra metric dimensions, e.g. Operation="query".
+        """
+        for model_id, totals in self.to_dict()["models"].items():
+            emit_metric("BedrockCalls", totals["calls"], Model=model_id, **dimensions)
+            emit_metric("BedrockInputTokens", totals["input_tokens"], Model=model_id, **dimensions)
+            emit_metric("BedrockOutputTokens", totals["output_tokens"], Model=model_id, **dimensions)
+            emit_metric(
+                "BedrockLatency", totals["bedrock_ms"], MetricUnit.Milliseconds, Model=model_id, **dimensions
+            )
+            emit_metric(
+                "BedrockOverhead", totals["overhead_ms"], MetricUnit.Milliseconds, Model=model_id, **dimensions
+            )
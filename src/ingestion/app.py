@@ -1,14 +1,29 @@
 import json
+import os
 import sys
 
+import boto3
+
 from google.cloud import bigquery
 from aws_lambda_powertools import Logger
 
+from .backfill import (
+    BackfillHandler,
+    BedrockBatchJobRunner,
+    LocalBatchJobRunner,
+    LocalStorage,
+    S3Storage,
+)
 from .handler import IngestionHandler
 from .retrievers import StackOverflowDataRetriever
+from .retry_queue import FileRetryQueue, SqsRetryQueue
+from .throttling import AdaptiveConcurrencyLimiter
+from .watermark import WatermarkStore
 
 
-from common.init_service import initialize_services
+from common.aws import get_bedrock_control_client, get_s3_client
+from common.init_service import initialize_services, initialize_shadow_service
+from common.profiling import profile_handler
 
 
 logger = Logger()
@@ -21,25 +36,85 @@ try:
     )
 
     # Initialize OpenSearch + Bedrock clients and the embedding service
-    embedding_svc, _ = initialize_services()
+    embedding_svc, bedrock_client = initialize_services()
+    # While migrating to a new embedding model or mapping, documents are also written to a shadow index
+    shadow_svc = initialize_shadow_service(embedding_svc, bedrock_client)
 
     # Set up data retriever and ingestion handler
     data_retriever = StackOverflowDataRetriever(bigquery_client)
-    ingestion_handler = IngestionHandler(embedding_svc, data_retriever)
+    # Incremental runs keep their high-water mark next to the index they write to
+    watermark_store = WatermarkStore(
+        embedding_svc.opensearch_client, f"{embedding_svc.index_name}-state"
+    )
+
+    # Documents whose embedding keeps failing are queued and retried by the next run
+    retry_queue = None
+    if os.getenv("RETRY_QUEUE_URL"):
+        retry_queue = SqsRetryQueue(boto3.client("sqs"), os.getenv("RETRY_QUEUE_URL"))
+    elif os.getenv("RETRY_QUEUE_PATH"):
+        retry_queue = FileRetryQueue(os.getenv("RETRY_QUEUE_PATH"))
+
+    limiter = AdaptiveConcurrencyLimiter(
+        initial=int(os.getenv("EMBEDDING_CONCURRENCY", "4")),
+        maximum=int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "32")),
+    )
+    ingestion_handler = IngestionHandler(
+        embedding_svc, data_retriever, watermark_store, retry_queue, limiter, shadow_svc=shadow_svc
+    )
+
+    # Bulk backfills go through Bedrock batch inference, staged in S3 or a local directory
+    backfill_handler = None
+    if os.getenv("BACKFILL_BUCKET"):
+        backfill_handler = BackfillHandler(
+            embedding_svc,
+            data_retriever,
+            S3Storage(get_s3_client(), os.getenv("BACKFILL_BUCKET")),
+            BedrockBatchJobRunner(
+                get_bedrock_control_client(),
+                os.getenv("BACKFILL_ROLE_ARN"),
+                embedding_svc.model_id,
+            ),
+            retry_queue,
+        )
+    elif os.getenv("BACKFILL_LOCAL_DIR"):
+        local_storage = LocalStorage(os.getenv("BACKFILL_LOCAL_DIR"))
+        backfill_handler = BackfillHandler(
+            embedding_svc,
+            data_retriever,
+            local_storage,
+            LocalBatchJobRunner(
+                local_storage,
+                lambda model_input: embedding_svc.generate_embedding(
+                    model_input["inputText"]
+                ).tolist(),
+            ),
+            retry_queue,
+        )
 except Exception as e:
     logger.exception("Failed to initialize dependency services", e)
     sys.exit(1)
 
 
+@profile_handler("ingestion")
 def lambda_handler(event, context):
     """
     AWS Lambda entry point for handling ingestion requests.
 
+    Set "profile" in the event to profile the invocation (see common.profiling).
+
     :param event: Lambda event payload
     :param context: Lambda runtime context
     :return: JSON response with status code
     """
     try:
+        if event.get("mode") == "backfill":
+            if backfill_handler is None:
+                return {
+                    "statusCode": 400,
+                    "body": json.dumps({"error": "Backfill storage is not configured"}),
+                }
+            return backfill_handler.handle(event, context)
+
         return ingestion_handler.handle(event, context)
 
     except Exception as e:
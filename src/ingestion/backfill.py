@@ -0,0 +1,393 @@
+import json
+import os
+import uuid
+from typing import Iterator
+
+import numpy as np
+import orjson
+from aws_lambda_powertools import Logger
+
+from common.documents import StackOverflowDocument
+from common.embeddings import EmbeddingService
+from .retrievers import StackOverflowDataRetriever
+from .retry_queue import FileRetryQueue, SqsRetryQueue
+
+logger = Logger()
+
+
+class LocalStorage:
+    """
+    Stores batch inference files in a local directory. Stand-in for S3 in local runs and tests.
+    """
+
+    def __init__(self, root: str):
+        """
+        :param root: The directory files are stored under.
+        """
+        self._root = root
+
+    def uri(self, key: str) -> str:
+        return os.path.join(self._root, key)
+
+    def write(self, key: str, data: bytes):
+        path = self.uri(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def read(self, key: str) -> bytes:
+        with open(self.uri(key), "rb") as f:
+            return f.read()
+
+    def read_lines(self, key: str) -> Iterator[bytes]:
+        """Stream the non-empty lines of a file."""
+        with open(self.uri(key), "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield line.rstrip(b"\n")
+
+    def list(self, prefix: str) -> list[str]:
+        keys = []
+        for directory, _, files in os.walk(self.uri(prefix)):
+            keys.extend(
+                os.path.relpath(os.path.join(directory, name), self._root) for name in files
+            )
+        return sorted(keys)
+
+
+class S3Storage:
+    """
+    Stores batch inference files in an S3 bucket, where Bedrock batch jobs read and write them.
+    """
+
+    def __init__(self, s3_client, bucket: str):
+        """
+        :param s3_client: A boto3 S3 client.
+        :param bucket: The bucket files are stored in.
+        """
+        self._s3_client = s3_client
+        self._bucket = bucket
+
+    def uri(self, key: str) -> str:
+        return f"s3://{self._bucket}/{key}"
+
+    def write(self, key: str, data: bytes):
+        self._s3_client.put_object(Bucket=self._bucket, Key=key, Body=data)
+
+    def read(self, key: str) -> bytes:
+        return self._s3_client.get_object(Bucket=self._bucket, Key=key)["Body"].read()
+
+    def read_lines(self, key: str) -> Iterator[bytes]:
+        """Stream the non-empty lines of an object without reading it whole."""
+        body = self._s3_client.get_object(Bucket=self._bucket, Key=key)["Body"]
+        for line in body.iter_lines():
+            if line.strip():
+                yield line
+
+    def list(self, prefix: str) -> list[str]:
+        keys = []
+        paginator = self._s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self._bucket, Prefix=prefix):
+            keys.extend(item["Key"] for item in page.get("Contents", []))
+        return sorted(keys)
+
+
+class BedrockBatchJobRunner:
+    """
+    Submits and tracks Bedrock batch inference (model invocation) jobs.
+    """
+
+    def __init__(self, bedrock_control_client, role_arn: str, model_id: str):
+        """
+        :param bedrock_control_client: A boto3 'bedrock' (control plane) client.
+        :param role_arn: The IAM role Bedrock assumes to read input and write output in S3.
+        :param model_id: The embedding model to run.
+        """
+        self._client = bedrock_control_client
+        self._role_arn = role_arn
+        self._model_id = model_id
+
+    def submit(self, job_name: str, input_uri: str, output_uri: str) -> str:
+        """:return: The ARN of the submitted job"""
+        response = self._client.create_model_invocation_job(
+            jobName=job_name,
+            roleArn=self._role_arn,
+            modelId=self._model_id,
+            inputDataConfig={"s3InputDataConfig": {"s3Uri": input_uri}},
+            outputDataConfig={"s3OutputDataConfig": {"s3Uri": output_uri}},
+        )
+        return response["jobArn"]
+
+    def status(self, job_id: str) -> str:
+        """:return: The job status, e.g. 'InProgress', 'Completed' or 'Failed'"""
+        return self._client.get_model_invocation_job(jobIdentifier=job_id)["status"]
+
+
+class LocalBatchJobRunner:
+    """
+    Runs batch inference jobs synchronously against local storage, mimicking Bedrock's output
+    layout (`<output>/<job id>/<input file>.out`). Used in local runs and tests.
+    """
+
+    def __init__(self, storage: LocalStorage, embed):
+        """
+        :param storage: The local storage jobs read input from and write output to.
+        :param embed: A callable mapping a model input dict to an embedding.
+        """
+        self._storage = storage
+        self._embed = embed
+        self._root = storage.uri("")
+
+    def submit(self, job_name: str, input_uri: str, output_uri: str) -> str:
+        input_key = os.path.relpath(input_uri, self._root)
+        output_key = os.path.join(os.path.relpath(output_uri, self._root), job_name)
+
+        output_lines = []
+        for line in self._storage.read(input_key).decode().splitlines():
+            record = json.loads(line)
+            try:
+                record["modelOutput"] = {"embedding": self._embed(record["modelInput"])}
+            except Exception as e:
+                record["error"] = {"errorMessage": str(e)}
+            output_lines.append(json.dumps(record))
+
+        output_name = os.path.basename(input_key) + ".out"
+        self._storage.write(
+            os.path.join(output_key, output_name), "\n".join(output_lines).encode()
+        )
+        return job_name
+
+    def status(self, job_id: str) -> str:
+        return "Completed"
+
+
+class BackfillHandler:
+    """
+    Backfills the index with Bedrock batch inference instead of one invoke_model call per document.
+
+    A backfill run happens in two invocations. 'submit' fetches rows, writes their model inputs as
+    JSON Lines batch inference files (plus the normalized documents, keyed by the same record ID)
+    and submits one job per file. 'load' checks the jobs and, once they have completed, joins
+    their output records back to the documents by record ID and streams them into OpenSearch.
+
+    Only providers that support batch inference (single-text models returning one 'embedding'
+    per record, such as Titan) can be backfilled. Documents the jobs returned no embedding for
+    are put on the retry queue, if given, and embedded by the next ingestion run.
+    """
+
+    _FAILED = {"Failed", "Stopped", "Expired"}
+    # Partially completed jobs have output for every record that succeeded
+    _COMPLETED = {"Completed", "PartiallyCompleted"}
+
+    def __init__(
+        self,
+        embedding_svc: EmbeddingService,
+        data_retriever: StackOverflowDataRetriever,
+        storage: LocalStorage | S3Storage,
+        job_runner: BedrockBatchJobRunner | LocalBatchJobRunner,
+        retry_queue: FileRetryQueue | SqsRetryQueue | None = None,
+    ):
+        self._embedding_svc = embedding_svc
+        self._data_retriever = data_retriever
+        self._storage = storage
+        self._job_runner = job_runner
+        self._retry_queue = retry_queue
+
+    def handle(self, event, *args, **kwargs):
+        """
+        :param event: dict with 'action' ('submit' or 'load'). 'submit' takes 'number_of_records',
+                      'records_offset', 'batch_size' and 'records_per_job'; 'load' takes the
+                      'run_id' returned by 'submit'.
+        :return: API-compatible response
+        """
+        if not self._embedding_svc.supports_batch_inference:
+            return {
+                "statusCode": 400,
+                "body": json.dumps(
+                    {"error": f"{self._embedding_svc.model_id} does not support batch inference"}
+                ),
+            }
+
+        action = event.get("action", "submit")
+        if action == "submit":
+            result = self.submit(
+                number_of_records=int(event.get("number_of_records", "100000")),
+                offset=int(event.get("records_offset", "0")),
+                batch_size=int(event.get("batch_size", "10000")),
+                records_per_job=int(event.get("records_per_job", "50000")),
+            )
+            return {"statusCode": 202, "body": json.dumps(result)}
+
+        if action == "load":
+            result = self.load(event["run_id"], int(event.get("batch_size", "500")))
+            status_code = {"Completed": 200, "InProgress": 202}.get(result["status"], 500)
+            return {"statusCode": status_code, "body": json.dumps(result)}
+
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"error": f"Unknown backfill action: {action}"}),
+        }
+
+    def _write_part(self, run_id: str, part: int, documents: list[StackOverflowDocument]) -> str:
+        """
+        Write one batch inference input file and its documents.
+
+        :return: The key of the input file
+        """
+        input_key = f"backfill/{run_id}/input/part-{part:05d}.jsonl"
+        records = [
+            {
+                "recordId": document.question_id,
+                "modelInput": self._embedding_svc.build_embedding_request(document.text),
+            }
+            for document in documents
+        ]
+        self._storage.write(input_key, "\n".join(map(json.dumps, records)).encode())
+        self._storage.write(
+            f"backfill/{run_id}/documents/part-{part:05d}.jsonl",
+            "\n".join(json.dumps(document.to_source()) for document in documents).encode(),
+        )
+        return input_key
+
+    def submit(
+        self,
+        number_of_records: int,
+        offset: int = 0,
+        batch_size: int = 10000,
+        records_per_job: int = 50000,
+    ) -> dict:
+        """
+        Fetch rows, write them as batch inference input and submit one job per input file.
+
+        :param number_of_records: Number of rows to backfill.
+        :param offset: Offset of the first row.
+        :param batch_size: Number of rows fetched per BigQuery call.
+        :param records_per_job: Number of records per batch inference input file and job.
+        :return: The run ID and submitted job IDs
+        :raises ValueError: If the embedding provider does not support batch inference.
+        """
+        if not self._embedding_svc.supports_batch_inference:
+            raise ValueError(f"{self._embedding_svc.model_id} does not support batch inference")
+
+        run_id = uuid.uuid4().hex[:12]
+        input_keys, pending = [], []
+        fetched = 0
+
+        while fetched < number_of_records:
+            limit = min(batch_size, number_of_records - fetched)
+            data = self._data_retriever.get_dataframe(limit, offset + fetched)
+            if data.empty:
+                break
+            fetched += len(data)
+            pending.extend(
+                StackOverflowDocument.from_row(row) for row in data.to_dict("records")
+            )
+
+            while len(pending) >= records_per_job:
+                input_keys.append(self._write_part(run_id, len(input_keys), pending[:records_per_job]))
+                pending = pending[records_per_job:]
+
+        if pending:
+            input_keys.append(self._write_part(run_id, len(input_keys), pending))
+
+        output_uri = self._storage.uri(f"backfill/{run_id}/output/")
+        job_ids = [
+            self._job_runner.submit(
+                f"codequest-backfill-{run_id}-{part}", self._storage.uri(input_key), output_uri
+            )
+            for part, input_key in enumerate(input_keys)
+        ]
+        self._storage.write(
+            f"backfill/{run_id}/manifest.json", json.dumps({"job_ids": job_ids}).encode()
+        )
+
+        logger.info(f"Submitted {len(job_ids)} batch jobs for {fetched} documents", extra={"run_id": run_id})
+        return {"run_id": run_id, "records": fetched, "job_ids": job_ids}
+
+    def load(self, run_id: str, batch_size: int = 500) -> dict:
+        """
+        Load the output of a completed backfill run into OpenSearch. Each job's output is joined
+        to the documents of its own input file and streamed line by line, so memory use is bounded
+        by records_per_job rather than by the size of the run.
+
+        :param run_id: The run ID returned by submit.
+        :param batch_size: Number of documents per bulk request.
+        :return: The run status and, once completed, the number of documents indexed and failed
+        """
+        manifest = json.loads(self._storage.read(f"backfill/{run_id}/manifest.json"))
+        statuses = {job_id: self._job_runner.status(job_id) for job_id in manifest["job_ids"]}
+
+        if any(status in self._FAILED for status in statuses.values()):
+            logger.error("Backfill jobs failed", extra={"statuses": statuses})
+            return {"status": "Failed", "jobs": statuses}
+        if any(status not in self._COMPLETED for status in statuses.values()):
+            return {"status": "InProgress", "jobs": statuses}
+
+        # Parts are loaded one at a time, so memory is bounded by records_per_job, not the run size
+        indexed, failed = 0, 0
+        for key in self._storage.list(f"backfill/{run_id}/output/"):
+            if not key.endswith(".jsonl.out"):
+                continue
+            part = os.path.basename(key)[: -len(".out")]
+            part_indexed, part_failed = self._load_part(
+                self._storage.read_lines(f"backfill/{run_id}/documents/{part}"),
+                self._storage.read_lines(key),
+                batch_size,
+            )
+            indexed += part_indexed
+            failed += part_failed
+
+        # Bulk requests skip the refresh; make the whole run searchable at once
+        if indexed:
+            self._embedding_svc.opensearch_client.indices.refresh(
+                index=",".join(self._embedding_svc.index_names)
+            )
+        logger.info(f"Backfilled {indexed} documents, {failed} failed", extra={"run_id": run_id})
+        return {"status": "Completed", "results": indexed, "failed": failed}
+
+    def _load_part(
+        self, document_lines: Iterator[bytes], output_lines: Iterator[bytes], batch_size: int
+    ) -> tuple[int, int]:
+        """
+        Join the output records of one batch job to the documents of its input file (Bedrock does
+        not keep the input order) and index them in bulk requests of batch_size. Documents whose
+        record has an error or is missing from the output count as failed and are put on the
+        retry queue.
+
+        :return: The number of documents indexed and failed
+        """
+        documents = {}
+        for line in document_lines:
+            source = orjson.loads(line)
+            documents[source["question_id"]] = source
+
+        indexed, failed, es_documents, retries = 0, 0, [], []
+        for line in output_lines:
+            record = orjson.loads(line)
+            source = documents.pop(record["recordId"], None)
+            if source is None or "modelOutput" not in record:
+                failed += 1
+                if source is not None:
+                    retries.append(source)
+                continue
+
+            # Titan output: one 'embedding' per record
+            embedding = np.asarray(record["modelOutput"]["embedding"], dtype=np.float32)
+            es_documents.append((StackOverflowDocument(**source), embedding))
+            if len(es_documents) >= batch_size:
+                self._embedding_svc.save_to_opensearch(es_documents, refresh=False)
+                indexed += len(es_documents)
+                es_documents = []
+
+        if es_documents:
+            self._embedding_svc.save_to_opensearch(es_documents, refresh=False)
+            indexed += len(es_documents)
+
+        # Documents the job wrote no output record for
+        if documents:
+            logger.warning(f"{len(documents)} documents have no batch inference output")
+            failed += len(documents)
+            retries.extend(documents.values())
+        if retries and self._retry_queue is not None:
+            self._retry_queue.put(retries)
+        return indexed, failed
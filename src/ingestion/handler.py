@@ -1,87 +1,449 @@
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 from botocore.exceptions import ClientError
 
+from common.documents import StackOverflowDocument
 from common.embeddings import EmbeddingService
+from common.metrics import emit_metric
+from common.profiling import profile_section
+from common.providers import pack_batches
+from common.usage import BedrockUsage
+from .pipeline import Pipeline
 from .retrievers import StackOverflowDataRetriever
+from .retry_queue import FileRetryQueue, SqsRetryQueue
+from .throttling import AdaptiveConcurrencyLimiter, call_with_backoff
+from .watermark import WatermarkStore
 
 
 from aws_lambda_powertools import Logger
+from aws_lambda_powertools.metrics import MetricUnit
 
 logger = Logger()
 
 
+class _IngestionRun:
+    """
+    State shared by the pipeline stages of one ingestion run.
+
+    Tracks how many documents were admitted for embedding and how many were indexed. Admission
+    stops at the target, so documents of pages already in flight beyond it are not embedded;
+    the fetch stage waits for admitted documents still in flight before it stops, since a failed
+    embedding frees its slot again. Every fetched page is tracked until all of its documents
+    have been indexed, skipped or queued for retry; the watermark is only advanced past pages
+    that completed in fetch order, and never past a page with documents left out for the target,
+    so an interrupted or capped incremental run resumes without gaps.
+    Bedrock token usage and latency of the run's embedding calls are accumulated in usage.
+    """
+
+    # How often the fetch stage re-checks whether the pipeline was aborted while it waits
+    _WAIT_SECONDS = 0.1
+
+    def __init__(
+        self,
+        target: int,
+        watermark_store: WatermarkStore | None = None,
+        usage: BedrockUsage | None = None,
+    ):
+        self.target = target
+        self.admitted = 0
+        self.indexed = 0
+        self.usage = usage or BedrockUsage()
+        self._watermark_store = watermark_store
+        # [remaining documents, watermark, whether a document was left out] per page, in fetch order
+        self._pages: list[list] = []
+        self._committed = 0
+        self._changed = threading.Condition()
+        self._aborted = threading.Event()
+
+    def abort_on(self, aborted: threading.Event):
+        """Stop waiting for documents in flight once the given event is set."""
+        self._aborted = aborted
+
+    @property
+    def fetch_more(self) -> bool:
+        with self._changed:
+            while self.target <= self.admitted != self.indexed and not self._aborted.is_set():
+                self._changed.wait(self._WAIT_SECONDS)
+            return self.admitted < self.target
+
+    def add_page(self, size: int, watermark: dict | None = None) -> int:
+        """:return: The sequence number of the page"""
+        with self._changed:
+            self._pages.append([size, watermark, False])
+            return len(self._pages) - 1
+
+    def admit(self, page: int) -> bool:
+        """
+        Admit a document of a page for embedding, unless the target is reached.
+
+        :return: Whether the document was admitted; if not, it is completed as left out
+        """
+        with self._changed:
+            if self.admitted < self.target:
+                self.admitted += 1
+                return True
+            self._pages[page][2] = True
+        self.complete(page)
+        return False
+
+    def reject(self):
+        """Return an admitted document's slot, e.g. because its embedding failed."""
+        with self._changed:
+            self.admitted -= 1
+            self._changed.notify_all()
+
+    def complete(self, page: int, indexed: int = 0, count: int = 1):
+        """Mark documents of a page as done and advance the watermark past completed pages."""
+        with self._changed:
+            self.indexed += indexed
+            self._pages[page][0] -= count
+            self._changed.notify_all()
+
+            watermark = None
+            while (
+                self._committed < len(self._pages)
+                and self._pages[self._committed][0] == 0
+                and not self._pages[self._committed][2]
+            ):
+                watermark = self._pages[self._committed][1] or watermark
+                self._committed += 1
+
+            if watermark and self._watermark_store is not None:
+                self._watermark_store.set(watermark)
+
+
 class IngestionHandler:
     """
     Handles document ingestion into OpenSearch using embeddings.
 
     Retrieves documents via a DataRetriever, generates embeddings,
-    and saves them to OpenSearch in batches.
+    and saves them to OpenSearch in batches. The steps run as a streaming pipeline
+    (fetch → normalize → dedupe → embed → write) connected by bounded queues, so
+    fetching, embedding and indexing overlap.
     """
 
     def __init__(
         self,
         embedding_svc: EmbeddingService,
         data_retriever: StackOverflowDataRetriever,
+        watermark_store: WatermarkStore | None = None,
+        retry_queue: FileRetryQueue | SqsRetryQueue | None = None,
+        limiter: AdaptiveConcurrencyLimiter | None = None,
+        concurrency: dict | None = None,
+        queue_size: int = 8,
+        shadow_svc: EmbeddingService | None = None,
+        flush_seconds: float = 0.5,
     ):
+        """
+        :param embedding_svc: The embedding service used to embed and index documents.
+        :param data_retriever: The retriever StackOverflow rows are fetched from.
+        :param watermark_store: Optional store for the incremental ingestion watermark.
+        :param retry_queue: Optional queue for documents whose embedding failed; drained on the next run.
+        :param limiter: Adaptive limiter for concurrent embedding calls. It lives as long as the
+                        handler, so warm invocations start at the last sustainable concurrency.
+        :param concurrency: Default worker count per stage ('normalize', 'dedupe', 'embed', 'write').
+        :param queue_size: Default capacity of the queues between stages.
+        :param shadow_svc: Optional embedding service of a shadow index being migrated to.
+                           Every written document is also embedded with its model and written
+                           to it; shadow failures never fail the run.
+        :param flush_seconds: Seconds without input after which the embed and write stages
+                              process a partial batch.
+        """
         self._embedding_svc = embedding_svc
         self._data_retriever = data_retriever
+        self._watermark_store = watermark_store
+        self._retry_queue = retry_queue
+        self._limiter = limiter or AdaptiveConcurrencyLimiter()
+        self._concurrency = {
+            "normalize": 1,
+            "dedupe": 4,
+            "embed": self._limiter.maximum,
+            "write": 1,
+            **(concurrency or {}),
+        }
+        self._queue_size = queue_size
+        self._shadow_svc = shadow_svc
+        self._flush_seconds = flush_seconds
+
+    def _embed_documents(
+        self,
+        documents: list[StackOverflowDocument],
+        usage: BedrockUsage | None = None,
+        embedding_svc: EmbeddingService | None = None,
+    ) -> list:
+        """
+        Generate the embeddings of documents, packed into requests by the provider's count and
+        size limits, backing off while Bedrock throttles.
+
+        :param usage: Optional accumulator of the token usage and latency of the calls.
+        :param embedding_svc: The service to embed with; defaults to the one of the current index.
+        :return: One embedding per document, or None for documents whose request failed
+        """
+        embedding_svc = embedding_svc or self._embedding_svc
+        texts = [document.text for document in documents]
+        keys = [document.question_id or document.title for document in documents]
+        embeddings = [None] * len(documents)
+        for batch in pack_batches(texts, *embedding_svc.batch_limits):
+            try:
+                vectors = call_with_backoff(
+                    self._limiter,
+                    lambda: embedding_svc.embed_batch(
+                        [texts[position] for position in batch],
+                        usage,
+                        [keys[position] for position in batch],
+                    ),
+                )
+            except ClientError as e:
+                logger.error(
+                    "Error generating embeddings",
+                    extra={
+                        "error": e,
+                        "question_ids": [documents[position].question_id for position in batch],
+                    },
+                )
+                continue
+            for position, vector in zip(batch, vectors):
+                embeddings[position] = vector
+        return embeddings
+
+    def _write_shadow(
+        self,
+        es_documents: list[tuple[StackOverflowDocument, np.ndarray]],
+        usage: BedrockUsage | None = None,
+    ):
+        """
+        Embed documents with the shadow model and write them to the shadow index. A mapping-only
+        migration (same provider, model and dimensions) reuses the current embeddings instead.
+        Failures are logged and counted in the ShadowWriteFailed metric, but never fail the run;
+        the shadow backfill (tools.shadow) fills any gaps before cutover.
+
+        :param es_documents: The (document, embedding) pairs written to the current index.
+        :param usage: Optional accumulator of the token usage and latency of the embedding calls.
+        """
+        if self._shadow_svc is None or not es_documents:
+            return
+        try:
+            if self._shadow_svc.embedding_model == self._embedding_svc.embedding_model:
+                shadow_documents = es_documents
+            else:
+                documents = [document for document, _ in es_documents]
+                embeddings = self._embed_documents(documents, usage, self._shadow_svc)
+                shadow_documents = [(d, e) for d, e in zip(documents, embeddings) if e is not None]
+            if shadow_documents:
+                self._shadow_svc.save_to_opensearch(shadow_documents, refresh=False)
+            failed = len(es_documents) - len(shadow_documents)
+        except Exception as e:
+            logger.warning(f"Shadow write failed: {e}")
+            failed = len(es_documents)
+        if failed:
+            emit_metric("ShadowWriteFailed", failed)
+
+    def _drain_retry_queue(self, max_records: int, usage: BedrockUsage | None = None) -> int:
+        """
+        Retry documents whose embedding failed in earlier runs.
+        Documents that fail again are put back on the queue. Drained records are only removed
+        from the queue once they are indexed (or queued again), so an interrupted retry loses none.
+
+        :param max_records: Maximum number of documents to retry in this run.
+        :param usage: Optional accumulator of the token usage and latency of the embedding calls.
+        :return: The number of documents indexed
+        """
+        if self._retry_queue is None:
+            return 0
+
+        with self._retry_queue.drain(max_records) as records:
+            documents = [StackOverflowDocument(**record) for record in records]
+            if not documents:
+                return 0
+
+            logger.info(f"Retrying {len(documents)} documents from the retry queue")
+            max_count = self._embedding_svc.batch_limits[0]
+            chunks = [
+                documents[start : start + max_count]
+                for start in range(0, len(documents), max_count)
+            ]
+            with ThreadPoolExecutor(max_workers=self._limiter.maximum) as executor:
+                embeddings = [
+                    embedding
+                    for chunk_embeddings in executor.map(
+                        lambda chunk: self._embed_documents(chunk, usage), chunks
+                    )
+                    for embedding in chunk_embeddings
+                ]
+
+            es_documents = [(d, e) for d, e in zip(documents, embeddings) if e is not None]
+            failed = [d.to_source() for d, e in zip(documents, embeddings) if e is None]
+            if failed:
+                self._retry_queue.put(failed)
+            if es_documents:
+                self._embedding_svc.save_to_opensearch(es_documents)
+                self._write_shadow(es_documents, usage)
+        return len(es_documents)
+
+    def _fetch_pages(self, run: _IngestionRun, offset: int, batch_size: int):
+        """Fetch stage: page through the dataset by offset until enough documents were admitted."""
+        while run.fetch_more:
+            logger.info(
+                f"Fetching and processing a barch of {batch_size} docs from {offset}"
+            )
+            with profile_section("bigquery_fetch"):
+                data = self._data_retriever.get_dataframe(batch_size, offset)
+            if data.empty:
+                break
+            offset += batch_size
+            yield run.add_page(len(data)), data
+
+    def _fetch_pages_since(self, run: _IngestionRun, watermark: dict | None, batch_size: int):
+        """Fetch stage: page through the rows changed since the watermark."""
+        while run.fetch_more:
+            with profile_section("bigquery_fetch"):
+                data = self._data_retriever.get_dataframe_since(watermark, batch_size)
+            if data.empty:
+                break
+
+            last_document = StackOverflowDocument.from_row(data.iloc[-1])
+            watermark = {
+                "last_activity_date": last_document.last_activity_date,
+                "creation_date": last_document.creation_date,
+                "question_id": int(last_document.question_id),
+            }
+            yield run.add_page(len(data), watermark), data
+
+            if len(data) < batch_size:
+                break
+
+    def _build_pipeline(
+        self,
+        run: _IngestionRun,
+        source,
+        batch_size: int,
+        concurrency: dict,
+        queue_size: int,
+    ) -> Pipeline:
+        def normalize(page):
+            # Build structured documents from plain dicts, avoiding a pandas Series per row
+            sequence, data = page
+            with profile_section("normalize_rows"):
+                return [
+                    (sequence, StackOverflowDocument.from_row(row))
+                    for row in data.to_dict("records")
+                ]
+
+        def dedupe(item):
+            # Skip if already indexed (avoid duplicate work and model cost)
+            sequence, document = item
+            if self._embedding_svc.check_if_indexed(
+                document.text, document.question_id, document.tags
+            ):
+                run.complete(sequence)
+                return None
+            if not run.admit(sequence):
+                return None
+            return [item]
+
+        def embed(items):
+            # Items arrive in batches of up to the provider's texts per request
+            embeddings = self._embed_documents([document for _, document in items], run.usage)
+            embedded = []
+            for (sequence, document), embedding in zip(items, embeddings):
+                if embedding is None:
+                    if self._retry_queue is not None:
+                        self._retry_queue.put([document.to_source()])
+                    run.reject()
+                    run.complete(sequence)
+                    continue
+                embedded.append((sequence, document, embedding))
+            return embedded
+
+        def write(batch):
+            logger.info(f"Flushing {len(batch)} documents to database!")
+            es_documents = [(document, embedding) for _, document, embedding in batch]
+            self._embedding_svc.save_to_opensearch(es_documents)
+            self._write_shadow(es_documents, run.usage)
+            for sequence, _, _ in batch:
+                run.complete(sequence, indexed=1)
+            logger.info(f"{run.indexed} documents are indexed so far!")
+
+        # Partial batches are flushed when their input stalls, e.g. while the fetch stage waits
+        # for the last admitted documents
+        pipeline = (
+            Pipeline(source, name="fetch", queue_size=queue_size)
+            .add_stage("normalize", normalize, concurrency["normalize"])
+            .add_stage("dedupe", dedupe, concurrency["dedupe"])
+            .add_stage(
+                "embed",
+                embed,
+                concurrency["embed"],
+                batch_size=self._embedding_svc.batch_limits[0],
+                flush_after=self._flush_seconds,
+            )
+            .add_stage(
+                "write",
+                write,
+                concurrency["write"],
+                batch_size=batch_size,
+                flush_after=self._flush_seconds,
+            )
+        )
+        run.abort_on(pipeline.aborted)
+        return pipeline
 
     def handle(self, event, *args, **kwargs):
         """
         Lambda handler for ingesting a specified number of documents.
 
-        :param event: dict containing 'number_of_records', 'batch_size', and 'records_offset'
-        :return: API-compatible response with the number of documents indexed
+        At most number_of_records documents (including retried ones) are embedded and indexed;
+        documents of pages fetched beyond that are left for the next run.
+
+        :param event: dict containing 'number_of_records', 'batch_size', and 'records_offset'.
+                      Set 'mode' to 'incremental' to only ingest rows changed since the last
+                      incremental run instead of paging by offset. Optional 'concurrency'
+                      (worker count per stage) and 'queue_size' tune the pipeline.
+        :return: API-compatible response with the number of documents indexed and the Bedrock
+                 token usage and latency of the run, see BedrockUsage.to_dict
         """
         logger.debug("Starting IngestionHandler")
-        es_documents: list[tuple[str, list[float]]] = []
 
         number_of_records = int(event.get("number_of_records", "1000"))
         offset = int(event.get("records_offset", "0"))
         batch_size = int(event.get("batch_size", "100"))
+        concurrency = {**self._concurrency, **event.get("concurrency", {})}
+        queue_size = int(event.get("queue_size", self._queue_size))
 
-        limit = batch_size
-        total_indexed = 0
-
-        while total_indexed < number_of_records:
-            logger.info(
-                f"Fetching and processing a barch of {limit} docs from {offset}"
-            )
-            # Fetch next batch of StackOverflow rows
-            data = self._data_retriever.get_dataframe(limit, offset)
-            for _, row in data.iterrows():
-                question_title = row["question_title"]
-                question_body = row["question_body"]
-                accepted_answer = row["accepted_answer_body"]
-
-                # Combine fields into a single document for embedding
-                combined_text = f"Title: {question_title}\nBody: {question_body}\nAccepted Answer: {accepted_answer}"
-
-                # Skip if already indexed (avoid duplicate work and model cost)
-                if self._embedding_svc.check_if_indexed(combined_text):
-                    continue
+        # Documents left over from earlier runs count towards this run's total
+        usage = BedrockUsage()
+        retried = self._drain_retry_queue(number_of_records, usage)
 
-                try:
-                    # Generate embedding and queue for indexing
-                    embedding = self._embedding_svc.generate_embedding(
-                        text=combined_text
-                    )
-                    es_documents.append((combined_text, embedding))
-                    total_indexed += 1
-                except ClientError as e:
-                    logger.error(f"Error generating embedding", extra={"error": e})
-                    continue
-            offset += limit
+        if event.get("mode", "full") == "incremental":
+            if self._watermark_store is None:
+                raise ValueError("Incremental ingestion requires a watermark store")
+            run = _IngestionRun(number_of_records - retried, self._watermark_store, usage)
+            watermark = self._watermark_store.get()
+            logger.info("Starting incremental ingestion", extra={"watermark": watermark})
+            source = self._fetch_pages_since(run, watermark, batch_size)
+        else:
+            run = _IngestionRun(number_of_records - retried, usage=usage)
+            source = self._fetch_pages(run, offset, batch_size)
 
-            # Save batch to OpenSearch and clear buffer
-            if es_documents:
-                logger.info(f"Flushing {len(es_documents)} documents to database!")
-                self._embedding_svc.save_to_opensearch(es_documents)
-                es_documents = []
+        stats = self._build_pipeline(run, source, batch_size, concurrency, queue_size).run()
+        logger.info("Ingestion pipeline finished", extra={"stages": stats})
+        for stage in stats:
+            emit_metric(
+                "StageThroughput",
+                stage["items_per_second"],
+                MetricUnit.CountPerSecond,
+                Stage=stage["stage"],
+            )
 
-            logger.info(f"{total_indexed} documents are indexed so far!")
+        usage.emit_metrics(Operation="ingestion")
+        logger.info("Bedrock usage of the run", extra={"usage": usage.to_dict()})
 
-        logger.info(
-            f"Processed and saved {len(es_documents)} documents to Elasticsearch."
-        )
-        return {"statusCode": 200, "body": json.dumps({"results": total_indexed})}
+        total_indexed = retried + run.indexed
+        logger.info(f"Processed and saved {total_indexed} documents to Elasticsearch.")
+        return {
+            "statusCode": 200,
+            "body": json.dumps({"results": total_indexed, "usage": usage.to_dict()}),
+        }
@@ -0,0 +1,268 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable
+
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+# Marks the end of a stage's input
+_DONE = object()
+# Returned by _get when no input arrived within the stage's flush interval
+_IDLE = object()
+
+# How often blocked workers check whether the pipeline was aborted
+_POLL_SECONDS = 0.1
+
+
+class _Aborted(Exception):
+    """Raised inside workers when another stage failed and the pipeline is shutting down."""
+
+
+class StageStats:
+    """Throughput and input queue depth counters of a pipeline stage."""
+
+    def __init__(self, name: str, concurrency: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self._queue_depth_total = 0
+        self._queue_depth_samples = 0
+        self._lock = threading.Lock()
+
+    def record(self, items: int, busy_seconds: float, queue_depth: int | None = None):
+        with self._lock:
+            self.items += items
+            self.busy_seconds += busy_seconds
+            if queue_depth is not None:
+                self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+                self._queue_depth_total += queue_depth
+                self._queue_depth_samples += 1
+
+    def report(self, elapsed_seconds: float) -> dict:
+        """
+        :param elapsed_seconds: Wall time of the pipeline run.
+        :return: Items processed, throughput, worker utilization and input queue depth of the stage
+        """
+        elapsed_seconds = max(elapsed_seconds, 1e-9)
+        return {
+            "stage": self.name,
+            "concurrency": self.concurrency,
+            "items": self.items,
+            "items_per_second": round(self.items / elapsed_seconds, 2),
+            "utilization": round(self.busy_seconds / (elapsed_seconds * self.concurrency), 3),
+            "max_queue_depth": self.max_queue_depth,
+            "avg_queue_depth": round(
+                self._queue_depth_total / self._queue_depth_samples, 2
+            )
+            if self._queue_depth_samples
+            else 0.0,
+        }
+
+
+class _Stage:
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        concurrency: int,
+        batch_size: int | None,
+        flush_after: float | None,
+    ):
+        self.name = name
+        self.func = func
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.flush_after = flush_after
+        self.stats = StageStats(name, concurrency)
+
+
+class Pipeline:
+    """
+    Runs a source and a chain of stages concurrently, connected by bounded queues.
+
+    The source runs in its own thread; every stage runs in `concurrency` worker threads. A stage
+    function takes one item (or a list of up to `batch_size` items for batching stages) and returns
+    an iterable of items for the next stage, or None. Because the queues are bounded, a slow stage
+    blocks its upstream stages (backpressure) instead of letting work pile up in memory, so the
+    slowest stage sets the pace while the others keep working ahead of it.
+
+    If any stage raises, the pipeline is aborted and the exception is re-raised by `run`.
+    """
+
+    def __init__(self, source: Iterable, name: str = "fetch", queue_size: int = 8):
+        """
+        :param source: An iterable producing the pipeline input, consumed in its own thread.
+        :param name: The name the source is reported under.
+        :param queue_size: Capacity of each queue between stages.
+        """
+        self._source = source
+        self._source_stats = StageStats(name, 1)
+        self._queue_size = queue_size
+        self._stages: list[_Stage] = []
+        self._aborted = threading.Event()
+        self._error: BaseException | None = None
+
+    def add_stage(
+        self,
+        name: str,
+        func: Callable,
+        concurrency: int = 1,
+        batch_size: int | None = None,
+        flush_after: float | None = None,
+    ) -> "Pipeline":
+        """
+        Append a stage to the pipeline.
+
+        :param name: The name the stage is reported under.
+        :param func: The function applied to each item (or batch of items).
+        :param concurrency: Number of worker threads running the stage.
+        :param batch_size: If set, items are grouped into lists of up to this size per call.
+        :param flush_after: If set, a partial batch is processed once no input arrived for this
+                            many seconds, instead of waiting for a full batch or the end of input.
+        :return: The pipeline, for chaining
+        """
+        self._stages.append(_Stage(name, func, max(1, concurrency), batch_size, flush_after))
+        return self
+
+    @property
+    def aborted(self) -> threading.Event:
+        """Set once a stage failed and the pipeline is shutting down."""
+        return self._aborted
+
+    def _put(self, q: queue.Queue, item):
+        while True:
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                if self._aborted.is_set():
+                    raise _Aborted()
+
+    def _get(self, q: queue.Queue, idle_timeout: float | None = None):
+        """:return: The next item, or _IDLE if none arrived within idle_timeout seconds"""
+        deadline = time.monotonic() + idle_timeout if idle_timeout is not None else None
+        while True:
+            try:
+                return q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                if self._aborted.is_set():
+                    raise _Aborted()
+                if deadline is not None and time.monotonic() >= deadline:
+                    return _IDLE
+
+    def _fail(self, error: BaseException):
+        if not self._aborted.is_set():
+            self._error = error
+            self._aborted.set()
+
+    def _run_source(self, output: queue.Queue):
+        try:
+            iterator = iter(self._source)
+            while True:
+                start = time.perf_counter()
+                item = next(iterator, _DONE)
+                if item is _DONE:
+                    break
+                self._source_stats.record(1, time.perf_counter() - start)
+                self._put(output, item)
+            self._put(output, _DONE)
+        except _Aborted:
+            pass
+        except BaseException as e:
+            logger.exception(f"Pipeline source '{self._source_stats.name}' failed")
+            self._fail(e)
+
+    def _run_worker(self, stage: _Stage, inbox: queue.Queue, outbox: queue.Queue, alive: list, lock: threading.Lock):
+        batch = []
+
+        def process(item_or_batch, items: int, queue_depth: int | None):
+            start = time.perf_counter()
+            outputs = stage.func(item_or_batch)
+            stage.stats.record(items, time.perf_counter() - start, queue_depth)
+            for output in outputs or ():
+                self._put(outbox, output)
+
+        try:
+            while True:
+                queue_depth = inbox.qsize()
+                item = self._get(inbox, stage.flush_after if batch else None)
+                if item is _IDLE:
+                    process(batch, len(batch), queue_depth)
+                    batch = []
+                    continue
+                if item is _DONE:
+                    # Let sibling workers see the end of the input too
+                    self._put(inbox, _DONE)
+                    break
+
+                if stage.batch_size is None:
+                    process(item, 1, queue_depth)
+                    continue
+
+                batch.append(item)
+                if len(batch) >= stage.batch_size:
+                    process(batch, len(batch), queue_depth)
+                    batch = []
+
+            if batch:
+                process(batch, len(batch), None)
+
+            with lock:
+                alive[0] -= 1
+                last_worker = alive[0] == 0
+            if last_worker:
+                self._put(outbox, _DONE)
+        except _Aborted:
+            pass
+        except BaseException as e:
+            logger.exception(f"Pipeline stage '{stage.name}' failed")
+            self._fail(e)
+
+    def run(self) -> list[dict]:
+        """
+        Run the pipeline until the source is exhausted and every stage has drained its input.
+
+        :return: Per-stage statistics, source first
+        :raises Exception: The first exception raised by the source or a stage
+        """
+        queues = [queue.Queue(maxsize=self._queue_size) for _ in range(len(self._stages) + 1)]
+        threads = [threading.Thread(target=self._run_source, args=(queues[0],), daemon=True)]
+
+        for i, stage in enumerate(self._stages):
+            alive, lock = [stage.concurrency], threading.Lock()
+            threads.extend(
+                threading.Thread(
+                    target=self._run_worker,
+                    args=(stage, queues[i], queues[i + 1], alive, lock),
+                    daemon=True,
+                )
+                for _ in range(stage.concurrency)
+            )
+
+        # The last stage's output is discarded, so drain it to keep its workers unblocked
+        sink = queues[-1]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        while not self._aborted.is_set():
+            try:
+                if sink.get(timeout=_POLL_SECONDS) is _DONE:
+                    break
+            except queue.Empty:
+                pass
+
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        if self._error is not None:
+            raise self._error
+
+        return [self._source_stats.report(elapsed)] + [
+            stage.stats.report(elapsed) for stage in self._stages
+        ]
@@ -28,7 +28,8 @@ class StackOverflowDataRetriever:
 
         :param number_of_records: Number of rows to return (default: 100)
         :param offset: Optional offset for pagination
-        :return: pandas DataFrame with columns: question_title, question_body, accepted_answer_body
+        :return: pandas DataFrame with columns: question_id, question_title, question_body,
+                 accepted_answer_body, tags, score, creation_date
         """
 
         query = f"""\
@@ -38,7 +39,10 @@ WITH accepted_answers AS (
         q.title AS question_title,
         q.body AS question_body,
         q.accepted_answer_id,
-        a.body AS accepted_answer_body
+        a.body AS accepted_answer_body,
+        q.tags,
+        q.score,
+        q.creation_date
     FROM
         `bigquery-public-data.stackoverflow.posts_questions` q
     LEFT JOIN
@@ -58,6 +62,69 @@ LIMIT {number_of_records}\
         result_df = query_job.to_dataframe()
         return result_df
 
+    def get_dataframe_since(self, watermark: dict | None = None, number_of_records: int = 100):
+        """
+        Retrieve questions with accepted answers that were created or changed after a watermark.
+
+        A row's activity date is the latest of the question's and the accepted answer's
+        last_activity_date, so edits to the accepted answer are picked up as well. Rows are
+        ordered by (last_activity_date, question_id), which makes the pair a strict cursor.
+
+        :param watermark: dict with 'last_activity_date' (ISO timestamp) and 'question_id' of the
+                          last processed row, or None to start from the beginning.
+        :param number_of_records: Number of rows to return (default: 100)
+        :return: pandas DataFrame with columns: question_id, question_title, question_body,
+                 accepted_answer_body, tags, score, creation_date, last_activity_date
+        """
+
+        query = """\
+WITH accepted_answers AS (
+    SELECT
+        q.id AS question_id,
+        q.title AS question_title,
+        q.body AS question_body,
+        q.accepted_answer_id,
+        a.body AS accepted_answer_body,
+        q.tags,
+        q.score,
+        q.creation_date,
+        GREATEST(q.last_activity_date, IFNULL(a.last_activity_date, q.last_activity_date)) AS last_activity_date
+    FROM
+        `bigquery-public-data.stackoverflow.posts_questions` q
+    LEFT JOIN
+        `bigquery-public-data.stackoverflow.posts_answers` a
+    ON
+        q.accepted_answer_id = a.id
+    WHERE
+        q.accepted_answer_id IS NOT NULL
+)
+SELECT * FROM accepted_answers
+WHERE
+    last_activity_date > @last_activity_date
+    OR (last_activity_date = @last_activity_date AND question_id > @question_id)
+ORDER BY last_activity_date, question_id
+LIMIT @number_of_records\
+"""
+        watermark = watermark or {}
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter(
+                    "last_activity_date",
+                    "TIMESTAMP",
+                    watermark.get("last_activity_date", "1970-01-01T00:00:00+00:00"),
+                ),
+                bigquery.ScalarQueryParameter(
+                    "question_id", "INT64", int(watermark.get("question_id", 0))
+                ),
+                bigquery.ScalarQueryParameter(
+                    "number_of_records", "INT64", number_of_records
+                ),
+            ]
+        )
+
+        query_job = self._bigquery_client.query(query, job_config=job_config)
+        return query_job.to_dataframe()
+
     @staticmethod
     def _get_credentials():
         """
@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+
+class FileRetryQueue:
+    """
+    A persistent retry queue backed by a local JSON Lines file.
+
+    Used for local runs and tests; Lambda deployments use SqsRetryQueue instead.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Path of the JSON Lines file holding queued records.
+        """
+        self._path = path
+        self._lock = threading.Lock()
+
+    def put(self, records: list[dict]):
+        """
+        Append records to the queue.
+
+        :param records: JSON-serializable records to retry later.
+        """
+        if not records:
+            return
+        with self._lock, open(self._path, "a") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+        logger.info(f"Queued {len(records)} records for retry in {self._path}")
+
+    @contextmanager
+    def drain(self, max_records: int = 1000) -> Iterator[list[dict]]:
+        """
+        Read the oldest queued records, and remove them once the with block completes. Records
+        of a block that raises stay queued.
+
+        :param max_records: Maximum number of records to read; the rest stay queued.
+        :return: A context manager yielding the records, oldest first
+        """
+        records = []
+        with self._lock:
+            if os.path.exists(self._path):
+                with open(self._path) as f:
+                    for line in f:
+                        if len(records) >= max_records:
+                            break
+                        if line.strip():
+                            records.append(json.loads(line))
+        yield records
+        if not records:
+            return
+
+        # Records are only appended while the block runs, so the drained ones are still the oldest
+        with self._lock:
+            with open(self._path) as f:
+                remaining = [line for line in f if line.strip()][len(records) :]
+            temp_path = f"{self._path}.tmp"
+            with open(temp_path, "w") as f:
+                f.writelines(remaining)
+            os.replace(temp_path, self._path)
+
+
+class SqsRetryQueue:
+    """
+    A persistent retry queue backed by an SQS (or SQS-compatible) queue.
+    """
+
+    # SQS accepts and returns at most 10 messages, of at most 256 KiB in total, per batch call
+    _BATCH_SIZE = 10
+    _MAX_BATCH_BYTES = 256 * 1024
+    _MAX_SEND_ATTEMPTS = 3
+
+    def __init__(self, sqs_client, queue_url: str, visibility_timeout: int = 900):
+        """
+        :param sqs_client: A boto3 SQS client.
+        :param queue_url: The URL of the queue holding records to retry.
+        :param visibility_timeout: Seconds drained messages stay hidden from other consumers; at
+                                   least as long as a run takes to re-embed and index them.
+        """
+        self._sqs_client = sqs_client
+        self._queue_url = queue_url
+        self._visibility_timeout = visibility_timeout
+
+    def put(self, records: list[dict]):
+        """
+        Send records to the queue, in batches within the SQS count and size limits.
+
+        :param records: JSON-serializable records to retry later.
+        :raises ValueError: If a record is larger than an SQS message can be.
+        :raises RuntimeError: If SQS keeps rejecting some of the records.
+        """
+        batch, batch_bytes = [], 0
+        for record in records:
+            body = json.dumps(record)
+            size = len(body.encode())
+            if size > self._MAX_BATCH_BYTES:
+                raise ValueError(f"Record of {size} bytes exceeds the SQS message size limit")
+            if batch and (
+                len(batch) >= self._BATCH_SIZE or batch_bytes + size > self._MAX_BATCH_BYTES
+            ):
+                self._send_batch(batch)
+                batch, batch_bytes = [], 0
+            batch.append(body)
+            batch_bytes += size
+        if batch:
+            self._send_batch(batch)
+        if records:
+            logger.info(f"Queued {len(records)} records for retry in {self._queue_url}")
+
+    def _send_batch(self, bodies: list[str]):
+        """Send a batch, resending the entries SQS reports as failed."""
+        entries = [{"Id": str(i), "MessageBody": body} for i, body in enumerate(bodies)]
+        for _ in range(self._MAX_SEND_ATTEMPTS):
+            response = self._sqs_client.send_message_batch(QueueUrl=self._queue_url, Entries=entries)
+            failed = response.get("Failed", [])
+            if not failed:
+                return
+            failed_ids = {entry["Id"] for entry in failed}
+            entries = [entry for entry in entries if entry["Id"] in failed_ids]
+            # Sender faults (e.g. invalid content) fail the same way on every attempt
+            if any(entry.get("SenderFault") for entry in failed):
+                break
+        raise RuntimeError(f"SQS rejected {len(entries)} records queued for retry: {failed}")
+
+    @contextmanager
+    def drain(self, max_records: int = 1000) -> Iterator[list[dict]]:
+        """
+        Receive queued records, and delete them once the with block completes. Messages of a
+        block that raises are not deleted, so they are received again after the visibility timeout.
+
+        :param max_records: Maximum number of records to receive.
+        :return: A context manager yielding the records
+        """
+        messages = []
+        while len(messages) < max_records:
+            response = self._sqs_client.receive_message(
+                QueueUrl=self._queue_url,
+                MaxNumberOfMessages=min(self._BATCH_SIZE, max_records - len(messages)),
+                WaitTimeSeconds=0,
+                VisibilityTimeout=self._visibility_timeout,
+            )
+            batch = response.get("Messages", [])
+            if not batch:
+                break
+            messages.extend(batch)
+
+        yield [json.loads(message["Body"]) for message in messages]
+
+        for start in range(0, len(messages), self._BATCH_SIZE):
+            response = self._sqs_client.delete_message_batch(
+                QueueUrl=self._queue_url,
+                Entries=[
+                    {"Id": str(i), "ReceiptHandle": message["ReceiptHandle"]}
+                    for i, message in enumerate(messages[start : start + self._BATCH_SIZE])
+                ],
+            )
+            if response.get("Failed"):
+                # Undeleted messages are only retried once more, never lost
+                logger.warning(f"Could not delete {len(response['Failed'])} retried records from the queue")
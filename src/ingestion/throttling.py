@@ -0,0 +1,136 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from botocore.exceptions import ClientError
+
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+# Error codes Bedrock returns when a request is rejected because of quota or capacity limits
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceQuotaExceededException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """:return: True if the error is a Bedrock throttling or capacity error."""
+    if not isinstance(error, ClientError):
+        return False
+    error_info = error.response.get("Error", {}) if isinstance(error.response, dict) else {}
+    return error_info.get("Code") in THROTTLING_ERROR_CODES
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits the number of concurrent model calls with additive-increase/multiplicative-decrease (AIMD).
+
+    Every successful call grows the limit by roughly one slot per full window of calls, and
+    a throttled call cuts it by a constant factor. Throttles arriving within the cooldown after
+    a decrease belong to the same congestion event and do not cut the limit again. The limit
+    converges on the highest concurrency the account quota sustains.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 32,
+        decrease_factor: float = 0.5,
+        cooldown_seconds: float = 1.0,
+    ):
+        """
+        :param initial: The starting concurrency limit.
+        :param minimum: The lowest concurrency the limit can be cut to.
+        :param maximum: The highest concurrency the limit can grow to.
+        :param decrease_factor: Factor the limit is multiplied by on a throttle.
+        :param cooldown_seconds: Time after a decrease during which further throttles are ignored.
+        """
+        self._limit = float(initial)
+        self._minimum = minimum
+        self._maximum = maximum
+        self._decrease_factor = decrease_factor
+        self._cooldown_seconds = cooldown_seconds
+        self._last_decrease = float("-inf")
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        """The current number of calls allowed to run concurrently."""
+        return int(self._limit)
+
+    @property
+    def maximum(self) -> int:
+        return self._maximum
+
+    @contextmanager
+    def slot(self):
+        """Block until a call slot is free under the current limit, and hold it for the block."""
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self):
+        """Grow the limit additively: about one slot per window of successful calls."""
+        with self._condition:
+            self._limit = min(self._maximum, self._limit + 1 / self._limit)
+            self._condition.notify_all()
+
+    def on_throttle(self):
+        """Cut the limit multiplicatively, once per congestion event."""
+        with self._condition:
+            now = time.monotonic()
+            if now - self._last_decrease < self._cooldown_seconds:
+                return
+            self._last_decrease = now
+            self._limit = max(self._minimum, self._limit * self._decrease_factor)
+            logger.warning(f"Throttled by Bedrock, reducing concurrency to {self.limit}")
+
+
+def call_with_backoff(
+    limiter: AdaptiveConcurrencyLimiter,
+    func,
+    max_attempts: int = 5,
+    base_delay: float = 0.2,
+    max_delay: float = 5.0,
+):
+    """
+    Call a function under the limiter, retrying throttled calls with exponential backoff and jitter.
+
+    :param limiter: The limiter that bounds concurrency and receives success/throttle feedback.
+    :param func: A zero-argument callable making the model call.
+    :param max_attempts: Number of attempts before a throttling error is re-raised.
+    :param base_delay: Initial backoff delay in seconds.
+    :param max_delay: Upper bound for a single backoff delay in seconds.
+    :return: The function's result
+    :raises ClientError: If the call fails with a non-throttling error, or is still throttled
+                         after max_attempts.
+    """
+    for attempt in range(max_attempts):
+        try:
+            with limiter.slot():
+                result = func()
+        except ClientError as e:
+            if not is_throttling_error(e):
+                raise
+            limiter.on_throttle()
+            if attempt == max_attempts - 1:
+                raise
+            time.sleep(random.uniform(0, min(max_delay, base_delay * 2**attempt)))
+        else:
+            limiter.on_success()
+            return result
@@ -0,0 +1,48 @@
+from opensearchpy import NotFoundError, OpenSearch
+
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+
+class WatermarkStore:
+    """
+    Persists the incremental ingestion high-water mark as a document in an OpenSearch state index.
+    """
+
+    _WATERMARK_ID = "watermark"
+
+    def __init__(self, opensearch_client: OpenSearch, index_name: str):
+        """
+        :param opensearch_client: The OpenSearch client
+        :param index_name: The name of the index holding ingestion state.
+        """
+        self._opensearch_client = opensearch_client
+        self._index_name = index_name
+
+    def get(self) -> dict | None:
+        """
+        :return: The last persisted watermark, or None if no incremental run has completed yet.
+        """
+        try:
+            document = self._opensearch_client.get(
+                index=self._index_name, id=self._WATERMARK_ID
+            )
+        except NotFoundError:
+            return None
+        return document["_source"]
+
+    def set(self, watermark: dict):
+        """
+        Persist a new watermark, replacing the previous one.
+
+        :param watermark: dict with 'last_activity_date', 'creation_date' and 'question_id' of the
+                          last processed row.
+        """
+        logger.info("Advancing ingestion watermark", extra={"watermark": watermark})
+        self._opensearch_client.index(
+            index=self._index_name,
+            id=self._WATERMARK_ID,
+            body=watermark,
+            refresh=True,
+        )
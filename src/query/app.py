@@ -2,8 +2,22 @@ import json
 import os
 import sys
 
-from common.init_service import initialize_services
+import boto3
+
+from common.answers import PrecomputedAnswerStore
+from common.cache import SemanticCache
+from common.init_service import initialize_services, initialize_shadow_service
+from common.profiling import profile_handler
+from common.shared_cache import (
+    DynamoDbCacheBackend,
+    LocalCacheBackend,
+    RedisCacheBackend,
+    SharedCache,
+)
 from .handler import QueryHandler
+from .query_log import QueryLogRecorder
+from .shadow import ShadowMirror
+from .suggest import SuggestHandler
 
 from aws_lambda_powertools import Logger
 
@@ -20,7 +34,77 @@ api_key = None
 if os.getenv("AWS_SAM_LOCAL") != "true":
     api_key = os.getenv("API_KEY")
 
+# The semantic cache lives at module level so it survives across warm invocations
+semantic_cache = None
+if int(os.getenv("SEMANTIC_CACHE_SIZE", "0")) > 0:
+    semantic_cache = SemanticCache(
+        capacity=int(os.getenv("SEMANTIC_CACHE_SIZE")),
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+        path=os.getenv("SEMANTIC_CACHE_PATH"),
+        persist_every=int(os.getenv("SEMANTIC_CACHE_PERSIST_EVERY", "50")),
+        persist_interval=float(os.getenv("SEMANTIC_CACHE_PERSIST_INTERVAL", "300")),
+    )
+
+# Answers precomputed for popular queries by tools.precompute
+answer_store = None
+if os.getenv("PRECOMPUTED_ANSWERS_INDEX"):
+    answer_store = PrecomputedAnswerStore(
+        embedding_svc.opensearch_client,
+        os.getenv("PRECOMPUTED_ANSWERS_INDEX"),
+        source_index_names=embedding_svc.index_names,
+        model_id=embedding_svc.model_id,
+    )
+
+# Sanitized query log with stage timings, replayable with tools.replay
+query_log = QueryLogRecorder(os.getenv("QUERY_LOG_PATH")) if os.getenv("QUERY_LOG_PATH") else None
+
+# Response cache shared by all containers, so a trending question is answered once
+shared_cache_backend = None
+if os.getenv("SHARED_CACHE_REDIS_URL"):
+    import redis
+
+    shared_cache_backend = RedisCacheBackend(
+        redis.Redis.from_url(os.getenv("SHARED_CACHE_REDIS_URL"))
+    )
+elif os.getenv("SHARED_CACHE_TABLE"):
+    shared_cache_backend = DynamoDbCacheBackend(
+        boto3.client("dynamodb"), os.getenv("SHARED_CACHE_TABLE")
+    )
+elif os.getenv("SHARED_CACHE_LOCAL") == "true":
+    shared_cache_backend = LocalCacheBackend()
+
+shared_cache = None
+if shared_cache_backend is not None:
+    shared_cache = SharedCache(
+        shared_cache_backend,
+        ttl=float(os.getenv("SHARED_CACHE_TTL", "300")),
+        negative_ttl=float(os.getenv("SHARED_CACHE_NEGATIVE_TTL", "60")),
+    )
 
+# While migrating to a new embedding model or mapping, a sample of queries is mirrored to the
+# shadow index and compared with the current one
+shadow = None
+shadow_svc = initialize_shadow_service(embedding_svc, bedrock_client)
+if shadow_svc is not None and float(os.getenv("SHADOW_QUERY_PERCENT", "0")) > 0:
+    shadow = ShadowMirror(shadow_svc, float(os.getenv("SHADOW_QUERY_PERCENT")))
+
+# Default search options; each can be overridden per request via query string parameters
+search_defaults = {
+    "k": int(os.getenv("SEARCH_K", "5")),
+    "fetch_k": int(os.getenv("RERANK_FETCH_K")) if os.getenv("RERANK_FETCH_K") else None,
+    "diversity": float(os.getenv("RERANK_DIVERSITY", "0.5")),
+    "max_score_gap": (
+        float(os.getenv("RERANK_MAX_SCORE_GAP"))
+        if os.getenv("RERANK_MAX_SCORE_GAP")
+        else None
+    ),
+    "fast_path_score": (
+        float(os.getenv("FAST_PATH_SCORE")) if os.getenv("FAST_PATH_SCORE") else None
+    ),
+}
+
+
+@profile_handler("query")
 def lambda_handler(event, context):
     """
     AWS Lambda entry point.
@@ -31,10 +115,28 @@ def lambda_handler(event, context):
         "query": "How to query in BigQuery and store results in Elasticsearch?"
     }
 
+    Requests to the '/code/suggest' resource are answered by the typeahead handler instead.
+    Direct invocations with a 'profile' key are profiled (see common.profiling).
+
     Returns the handler response or a 500 error if an exception occurs.
     """
     try:
-        return QueryHandler(embedding_svc, bedrock_client, api_key).handle(event, context)
+        if event.get("resource", event.get("path")) == "/code/suggest":
+            return SuggestHandler(
+                embedding_svc, api_key, size=int(os.getenv("SUGGEST_SIZE", "5"))
+            ).handle(event, context)
+
+        return QueryHandler(
+            embedding_svc,
+            bedrock_client,
+            api_key,
+            semantic_cache=semantic_cache,
+            answer_store=answer_store,
+            query_log=query_log,
+            shared_cache=shared_cache,
+            shadow=shadow,
+            **search_defaults,
+        ).handle(event, context)
     except Exception as e:
         logger.exception("Unexpected Error", e)
         return {
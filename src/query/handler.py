@@ -1,11 +1,32 @@
+import hashlib
 import json
 import os
+import time
+from html import unescape
 from aws_lambda_powertools import Logger
 
+from common.answers import PrecomputedAnswerStore, normalize_query
+from common.cache import SemanticCache
+from common.documents import RESPONSE_FIELDS, html_to_markdown
 from common.embeddings import EmbeddingService
+from common.metrics import emit_metric
+from common.profiling import profile_section
+from common.providers import SEARCH_QUERY
+from common.rerank import rerank_hits
+from common.shared_cache import SharedCache
+from common.usage import BedrockUsage
+from .query_log import QueryLogRecorder
+from .shadow import ShadowMirror
 
 logger = Logger()
 
+# Query string parameters that change what is searched or returned
+SEARCH_OPTION_PARAMS = {"k", "fetch_k", "diversity", "max_score_gap", "tags", "min_score", "fields"}
+
+# Response modes: 'fast' returns the top match verbatim, 'render' always calls the LLM and
+# 'auto' takes the fast path when the top match scores above the handler's threshold
+RESPONSE_MODES = ("auto", "fast", "render")
+
 
 class QueryHandler:
     """
@@ -17,17 +38,127 @@ class QueryHandler:
         embedding_svc: EmbeddingService,
         bedrock_client,
         api_key: str | None = None,
+        semantic_cache: SemanticCache | None = None,
+        k: int = 5,
+        fetch_k: int | None = None,
+        diversity: float = 0.5,
+        max_score_gap: float | None = None,
+        fast_path_score: float | None = None,
+        answer_store: PrecomputedAnswerStore | None = None,
+        query_log: QueryLogRecorder | None = None,
+        shared_cache: SharedCache | None = None,
+        shadow: ShadowMirror | None = None,
     ):
+        """
+        :param embedding_svc: The embedding service used to embed queries and search OpenSearch.
+        :param bedrock_client: The Amazon Bedrock client, used to render the final answer.
+        :param api_key: Optional API key expected in the 'api_key' request header.
+        :param semantic_cache: Optional cache of answers for semantically similar queries.
+        :param k: Default number of matched documents sent to the LLM.
+        :param fetch_k: Default number of candidates fetched from OpenSearch before reranking.
+                        Reranking is skipped when it is not larger than k.
+        :param diversity: Default MMR trade-off between relevance (0) and novelty (1).
+        :param max_score_gap: Default largest allowed score drop between consecutive candidates.
+        :param fast_path_score: Optional kNN score at or above which the top match is returned
+                                directly instead of rendering an answer with the LLM.
+        :param answer_store: Optional store of answers precomputed for popular queries, checked
+                             before the query is embedded.
+        :param query_log: Optional recorder of sanitized queries and their stage timings.
+        :param shared_cache: Optional response cache shared between containers; concurrent
+                             identical requests are coalesced into one computation.
+        :param shadow: Optional mirror of a sample of queries to a shadow index, see ShadowMirror.
+        """
         self._embedding_svc = embedding_svc
         self._bedrock_client = bedrock_client
         self._api_key = api_key
+        self._semantic_cache = semantic_cache
+        self._k = k
+        self._fetch_k = fetch_k or k
+        self._diversity = diversity
+        self._max_score_gap = max_score_gap
+        self._fast_path_score = fast_path_score
+        self._answer_store = answer_store
+        self._query_log = query_log
+        self._shared_cache = shared_cache
+        self._shadow = shadow
 
-    def _render_response(self, query: str, matched_docs: list[str]) -> str:
+    def _search_options(self, query_params: dict) -> dict:
+        """
+        Resolve the search and rerank options for a request, letting query string parameters
+        override the handler defaults.
+
+        :raises ValueError: If a parameter is malformed or out of range.
+        """
+        k = int(query_params.get("k", self._k))
+        fetch_k = int(query_params.get("fetch_k", max(self._fetch_k, k)))
+        diversity = float(query_params.get("diversity", self._diversity))
+        max_score_gap = query_params.get("max_score_gap", self._max_score_gap)
+        tags = [tag.strip() for tag in query_params.get("tags", "").split(",") if tag.strip()]
+        min_score = query_params.get("min_score")
+        fields = [f.strip() for f in query_params.get("fields", "").split(",") if f.strip()]
+        mode = query_params.get("mode", "auto")
+
+        if k < 1 or fetch_k < k:
+            raise ValueError("'k' must be positive and 'fetch_k' must be at least 'k'")
+        if not 0 <= diversity <= 1:
+            raise ValueError("'diversity' must be between 0 and 1")
+        if set(fields) - set(RESPONSE_FIELDS):
+            raise ValueError(f"'fields' must be a subset of {', '.join(RESPONSE_FIELDS)}")
+        if mode not in RESPONSE_MODES:
+            raise ValueError(f"'mode' must be one of {', '.join(RESPONSE_MODES)}")
+
+        return {
+            "k": k,
+            "fetch_k": fetch_k,
+            "diversity": diversity,
+            "max_score_gap": float(max_score_gap) if max_score_gap is not None else None,
+            "filters": {
+                "tags": tags,
+                "min_score": int(min_score) if min_score is not None else None,
+            },
+            "fields": fields,
+            "mode": mode,
+        }
+
+    @staticmethod
+    def _match_text(source: dict) -> str:
+        """
+        The text of a matched document sent to the LLM: just the title and accepted answer for
+        structured documents, the full combined text otherwise.
+        """
+        if "title" in source and "answer_body" in source:
+            return f"Title: {source['title']}\nAccepted Answer: {source['answer_body']}"
+        return source.get("text", "")
+
+    @staticmethod
+    def _fast_response(source: dict) -> str:
+        """
+        The markdown returned on the fast path: the matched question's accepted answer, converted
+        from the HTML StackOverflow stores so it has the same shape as a rendered answer.
+        """
+        if "answer_body" not in source:
+            return source.get("text", "")
+
+        title = unescape(source.get("title", ""))
+        markdown = f"## {title}\n\n{html_to_markdown(source['answer_body'])}"
+        if source.get("question_id"):
+            markdown += f"\n\n[View on Stack Overflow](https://stackoverflow.com/questions/{source['question_id']})"
+        return markdown
+
+    def _use_fast_path(self, mode: str, top_score: float) -> bool:
+        if mode == "auto":
+            return self._fast_path_score is not None and top_score >= self._fast_path_score
+        return mode == "fast"
+
+    def _render_response(
+        self, query: str, matched_docs: list[str], usage: BedrockUsage | None = None
+    ) -> str:
         """
         Renders a final answer to the user based on matched documents.
 
         Constructs a prompt using the user query and matched documents, calls the Claude Haiku model
-        via Bedrock, and extracts a markdown-formatted answer from the response.
+        via Bedrock, and extracts a markdown-formatted answer from the response. The token usage and
+        model latency Bedrock reports are added to usage, if given.
 
         Returns:
             str: A markdown-formatted answer, or raw output if markdown tags are missing.
@@ -73,7 +204,18 @@ class QueryHandler:
         }
 
         logger.info("Calling Haiku3.5 to summarize findings", extra=converse_args)
-        response = self._bedrock_client.converse(**converse_args)
+        start = time.perf_counter()
+        with profile_section("bedrock_converse"):
+            response = self._bedrock_client.converse(**converse_args)
+        if usage is not None:
+            latency = response.get("metrics", {}).get("latencyMs")
+            usage.add(
+                converse_args["modelId"],
+                input_tokens=response.get("usage", {}).get("inputTokens", 0),
+                output_tokens=response.get("usage", {}).get("outputTokens", 0),
+                bedrock_ms=latency,
+                elapsed_ms=(time.perf_counter() - start) * 1000,
+            )
 
         output_message = response["output"]["message"]
 
@@ -85,6 +227,22 @@ class QueryHandler:
         return result
 
     def handle(self, event, context):
+        start = time.perf_counter()
+        timings = {}
+        usage = BedrockUsage()
+        response = self._handle(event, context, timings, usage)
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+
+        usage.emit_metrics(Operation="query")
+        if self._query_log is not None:
+            self._query_log.record(event, response, timings, usage.to_dict()["models"])
+        return response
+
+    def _handle(self, event, context, timings: dict, usage: BedrockUsage):
+        """
+        :param timings: Filled with the duration of each stage in milliseconds.
+        :param usage: Filled with the token usage and latency of the Bedrock calls.
+        """
         logger.info("Starting QueryHandler. Event received: %s", event)
 
         # Extract the user query from the event
@@ -103,11 +261,82 @@ class QueryHandler:
                 "body": json.dumps({"error": "Unauthorized"}),
             }
 
+        try:
+            options = self._search_options(query_params)
+        except ValueError as e:
+            logger.warning("Invalid search options: %s", e)
+            return {
+                "statusCode": 400,
+                "body": json.dumps({"error": f"Invalid search options: {str(e)}"}),
+            }
+
+        mirrors = []
+        try:
+            if self._shared_cache is not None:
+                return self._shared_cache.get_or_compute(
+                    self._shared_cache_key(query_params),
+                    lambda: self._answer(query_text, query_params, options, timings, usage, mirrors),
+                )
+            return self._answer(query_text, query_params, options, timings, usage, mirrors)
+        finally:
+            # Outside the shared cache lock, so coalesced requests are not held up by the comparison
+            for mirror in mirrors:
+                self._shadow.wait(mirror)
+
+    @staticmethod
+    def _shared_cache_key(query_params: dict) -> str:
+        """:return: The shared cache key of a request: its normalized query and other parameters"""
+        params = {name: value for name, value in query_params.items() if name != "query"}
+        key = json.dumps([normalize_query(query_params["query"]), sorted(params.items())])
+        return "query:" + hashlib.sha256(key.encode()).hexdigest()
+
+    def _answer(
+        self,
+        query_text: str,
+        query_params: dict,
+        options: dict,
+        timings: dict,
+        usage: BedrockUsage,
+        mirrors: list,
+    ):
+        """
+        Answer a validated request.
+
+        :param query_text: The user query.
+        :param query_params: The query string parameters of the request.
+        :param options: The search options of the request, see `_search_options`.
+        :param timings: Filled with the duration of each stage in milliseconds.
+        :param usage: Filled with the token usage and latency of the Bedrock calls.
+        :param mirrors: Filled with the pending shadow comparison of a mirrored request.
+        """
+        # Cached and precomputed answers were rendered with the default options, so only reuse
+        # them for default requests
+        default_options = not (query_params.keys() & SEARCH_OPTION_PARAMS)
+        use_cache = self._semantic_cache is not None and default_options
+
+        if self._answer_store is not None and default_options and options["mode"] != "fast":
+            try:
+                precomputed = self._answer_store.get_current(query_text)
+            except Exception as e:
+                logger.warning("Precomputed answer lookup failed: %s", e)
+                precomputed = None
+            if precomputed:
+                logger.info("Returning precomputed answer", extra={"query": precomputed["query"]})
+                emit_metric("QueryPath", 1, Path="precomputed")
+                return {
+                    "statusCode": 200,
+                    "body": json.dumps({"markdown": precomputed["markdown"], "path": "precomputed"}),
+                }
+
         logger.info("Query recieved, generating embedding!")
 
         try:
             # Generate the embeding from the query_text.
-            embedding = self._embedding_svc.generate_embedding(text=query_text)
+            stage_start = time.perf_counter()
+            embedding = self._embedding_svc.generate_embedding(
+                text=query_text, usage=usage, input_type=SEARCH_QUERY
+            )
+            timings["embed_ms"] = (time.perf_counter() - stage_start) * 1000
         except Exception as e:
             logger.error("Error generating embedding: %s", e, exc_info=True)
             return {
@@ -115,11 +344,41 @@ class QueryHandler:
                 "body": json.dumps({"error": f"Embedding generation failed: {str(e)}"}),
             }
 
+        if use_cache:
+            cached = self._semantic_cache.lookup(embedding)
+            emit_metric("SemanticCacheHit" if cached else "SemanticCacheMiss", 1)
+            logger.info("Semantic cache lookup", extra=self._semantic_cache.stats())
+            if cached:
+                logger.info(f"Reusing cached answer with similarity {cached['similarity']:.3f}")
+                emit_metric("QueryPath", 1, Path="cache")
+                return {
+                    "statusCode": 200,
+                    "body": json.dumps({"markdown": cached["markdown"], "path": "cache"}),
+                }
+
         logger.info("generated embedding, querying for the hits!")
 
         try:
             # Query ES with the generated embeddings and return results
-            hits = self._embedding_svc.query_opensearch(query=embedding, k=5)
+            rerank = options["fetch_k"] > options["k"] or options["max_score_gap"] is not None
+            fast_path_possible = options["mode"] == "fast" or (
+                options["mode"] == "auto" and self._fast_path_score is not None
+            )
+            # Only fetch the fields needed to render the answer and those the caller asked for
+            source_fields = sorted(
+                {"text", "title", "answer_body", *options["fields"]}
+                | ({"embedding"} if rerank else set())
+                | ({"question_id"} if fast_path_possible else set())
+            )
+            stage_start = time.perf_counter()
+            hits = self._embedding_svc.query_opensearch(
+                query=embedding,
+                k=options["fetch_k"],
+                filters=options["filters"],
+                source_fields=source_fields,
+                query_text=query_text,
+            )
+            timings["search_ms"] = (time.perf_counter() - stage_start) * 1000
 
             if not hits:
                 logger.warning("No hits found in Opensearch results.")
@@ -128,13 +387,67 @@ class QueryHandler:
                     "body": json.dumps({"error": f"No matches found"}),
                 }
 
+            top_score = hits[0].get("_score") or 0.0
+            if self._use_fast_path(options["mode"], top_score):
+                # A confident match answers the question on its own, so skip the LLM call
+                logger.info(f"Returning the top match directly, score {top_score:.3f}")
+                emit_metric("QueryPath", 1, Path="fast")
+                body = {"markdown": self._fast_response(hits[0]["_source"]), "path": "fast"}
+                if options["fields"]:
+                    body["matches"] = [
+                        {field: hits[0]["_source"].get(field) for field in options["fields"]}
+                    ]
+                return {
+                    "statusCode": 200,
+                    "body": json.dumps(body),
+                }
+
+            if self._shadow is not None and self._shadow.sample():
+                # Only rendered queries are mirrored: the comparison runs in the background while
+                # the answer is rendered, which takes longer, so the user rarely waits for it
+                mirrors.append(
+                    self._shadow.submit(
+                        query_text, options, hits, timings["embed_ms"] + timings["search_ms"]
+                    )
+                )
+
+            if rerank:
+                # Narrow the over-fetched candidates down to the fewest, most diverse matches
+                candidates = len(hits)
+                hits = rerank_hits(
+                    embedding,
+                    hits,
+                    k=options["k"],
+                    diversity=options["diversity"],
+                    max_score_gap=options["max_score_gap"],
+                )
+                logger.info(f"Reranked {candidates} candidates down to {len(hits)}")
+
             logger.info(f"{len(hits)} found! Returning results!")
-            matches = [hit["_source"].get("text", "") for hit in hits]
-            rendered_response = self._render_response(query_text, matches)
+            matches = [self._match_text(hit["_source"]) for hit in hits]
+            stage_start = time.perf_counter()
+            rendered_response = self._render_response(query_text, matches, usage)
+            timings["render_ms"] = (time.perf_counter() - stage_start) * 1000
+
+            if use_cache:
+                self._semantic_cache.add(
+                    embedding, [hit["_id"] for hit in hits], rendered_response
+                )
+                self._semantic_cache.maybe_persist()
+
+            emit_metric("QueryPath", 1, Path="rendered")
+            body = {"markdown": rendered_response, "path": "rendered"}
+            if options["fields"]:
+                body["matches"] = [
+                    {field: hit["_source"].get(field) for field in options["fields"]}
+                    for hit in hits
+                ]
 
+            with profile_section("response_encode"):
+                encoded = json.dumps(body)
             return {
                 "statusCode": 200,
-                "body": json.dumps({"markdown": rendered_response}),
+                "body": encoded,
             }
 
         except Exception as e:
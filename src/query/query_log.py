@@ -0,0 +1,66 @@
+import json
+import re
+import threading
+from datetime import datetime, timezone
+
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+# Anything that looks like a credential or personal contact detail is masked before logging
+_REDACTIONS = [
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "<email>"),
+    (re.compile(r"\b(?:AKIA|ASIA)[A-Z0-9]{16}\b"), "<aws-key>"),
+    (re.compile(r"\b(?:sk|ghp|gho|xox[bap])[-_][A-Za-z0-9_-]{10,}\b"), "<token>"),
+    (re.compile(r"\b[A-Za-z0-9+/_-]{32,}={0,2}"), "<secret>"),
+]
+
+
+def sanitize_query(text: str) -> str:
+    """Mask e-mail addresses, access keys and other secret-looking strings in a query."""
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class QueryLogRecorder:
+    """
+    Appends one sanitized JSON line per handled query to a local file, with its parameters,
+    outcome, stage timings and Bedrock usage. The log feeds `tools.replay` and `tools.precompute`.
+
+    Only query string parameters are recorded; headers (including the API key) never are.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Path of the JSON Lines file queries are appended to.
+        """
+        self._path = path
+        self._lock = threading.Lock()
+
+    def record(self, event: dict, response: dict, timings: dict, usage: dict | None = None):
+        """
+        :param event: The Lambda event of the query.
+        :param response: The handler response.
+        :param timings: Stage timings in milliseconds, e.g. 'embed_ms', 'search_ms', 'total_ms'.
+        :param usage: Optional Bedrock token usage and latency per model, see BedrockUsage.
+        """
+        params = dict(event.get("queryStringParameters") or {})
+        query = sanitize_query(params.pop("query", None) or "")
+        body = json.loads(response.get("body") or "{}")
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "query": query,
+            "params": params,
+            "status_code": response.get("statusCode"),
+            "path": body.get("path"),
+            **{name: round(value, 2) for name, value in timings.items()},
+        }
+        if usage:
+            record["bedrock"] = usage
+        try:
+            with self._lock, open(self._path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            # Recording is best effort and must never fail the request
+            logger.warning(f"Could not record query to {self._path}: {e}")
@@ -0,0 +1,117 @@
+import random
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.metrics import MetricUnit
+
+from common.embeddings import EmbeddingService
+from common.metrics import emit_metric
+from common.providers import SEARCH_QUERY
+
+logger = Logger()
+
+
+def overlap_at_k(primary_ids: list[str], shadow_ids: list[str], k: int) -> float:
+    """
+    :return: The share of the primary top-k documents that the shadow index also returns in its
+             top k; 1.0 when neither returns anything
+    """
+    expected = set(primary_ids[:k])
+    if not expected:
+        return 0.0 if shadow_ids[:k] else 1.0
+    return len(expected & set(shadow_ids[:k])) / len(expected)
+
+
+class ShadowMirror:
+    """
+    Mirrors a sample of queries to a shadow index during an embedding model or mapping migration.
+
+    A mirrored query is embedded with the shadow model and searched in the shadow index in a
+    background thread, and compared with the primary search: the embed plus search latency of
+    both, and the overlap of their top-k documents. Comparisons are emitted as ShadowOverlap and
+    MirroredSearchLatency metrics and logged; users are always answered from the primary index.
+    """
+
+    def __init__(self, shadow_svc: EmbeddingService, percentage: float, timeout: float = 0.2):
+        """
+        :param shadow_svc: The embedding service of the shadow index.
+        :param percentage: Percentage of queries to mirror (0-100).
+        :param timeout: Maximum seconds a request waits for its comparison after it is answered;
+                        a slower comparison finishes in the background if the container is not
+                        frozen first.
+        """
+        self._shadow_svc = shadow_svc
+        self._percentage = percentage
+        self._timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=2)
+
+    def sample(self) -> bool:
+        """:return: Whether to mirror the current query"""
+        return random.random() * 100 < self._percentage
+
+    def submit(
+        self, query_text: str, options: dict, primary_hits: list[dict], primary_ms: float
+    ) -> Future:
+        """
+        Start comparing a query in the background.
+
+        :param query_text: The user query.
+        :param options: The search options of the request; 'k' and 'filters' are mirrored.
+        :param primary_hits: The hits of the primary search, best first.
+        :param primary_ms: The embed plus search time of the primary search in milliseconds.
+        :return: A future of the comparison
+        """
+        primary_ids = [hit["_id"] for hit in primary_hits]
+        return self._executor.submit(
+            self.compare, query_text, options["k"], options["filters"], primary_ids, primary_ms
+        )
+
+    def compare(
+        self, query_text: str, k: int, filters: dict, primary_ids: list[str], primary_ms: float
+    ) -> dict:
+        """
+        Search the shadow index and compare its results with the primary ones.
+
+        :return: The comparison: 'k', 'overlap', 'primary_ms' and 'shadow_ms'
+        """
+        start = time.perf_counter()
+        embedding = self._shadow_svc.generate_embedding(text=query_text, input_type=SEARCH_QUERY)
+        hits = self._shadow_svc.query_opensearch(
+            query=embedding,
+            k=k,
+            filters=filters,
+            source_fields=["question_id"],
+            query_text=query_text,
+        )
+        shadow_ms = (time.perf_counter() - start) * 1000
+
+        comparison = {
+            "k": k,
+            "overlap": overlap_at_k(primary_ids, [hit["_id"] for hit in hits], k),
+            "primary_ms": round(primary_ms, 2),
+            "shadow_ms": round(shadow_ms, 2),
+        }
+        logger.info("Shadow comparison", extra={"shadow": comparison})
+        emit_metric("ShadowOverlap", comparison["overlap"] * 100, MetricUnit.Percent)
+        emit_metric("MirroredSearchLatency", primary_ms, MetricUnit.Milliseconds, Index="primary")
+        emit_metric("MirroredSearchLatency", shadow_ms, MetricUnit.Milliseconds, Index="shadow")
+        return comparison
+
+    def wait(self, future: Future) -> dict | None:
+        """
+        Wait briefly for a comparison, so it usually completes before the Lambda is frozen.
+        Failures are logged and never fail the request.
+
+        :return: The comparison, or None if it failed or timed out
+        """
+        try:
+            return future.result(timeout=self._timeout)
+        except TimeoutError:
+            logger.info("Shadow comparison still running, not waiting for it")
+            emit_metric("ShadowQueryTimeout", 1)
+            return None
+        except Exception as e:
+            logger.warning(f"Shadow comparison failed: {e}")
+            emit_metric("ShadowQueryFailed", 1)
+            return None
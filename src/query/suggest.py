@@ -0,0 +1,69 @@
+import json
+
+from aws_lambda_powertools import Logger
+
+from common.embeddings import EmbeddingService
+
+logger = Logger()
+
+# Upper bound for the 'size' query string parameter
+MAX_SUGGESTIONS = 20
+
+
+class SuggestHandler:
+    """
+    Handles typeahead requests: completes the text typed so far to known question titles.
+
+    Backed by the completion field populated at ingestion, so it never calls Bedrock and
+    answers within tens of milliseconds, letting users jump to a known question before
+    running the full search.
+    """
+
+    def __init__(self, embedding_svc: EmbeddingService, api_key: str | None = None, size: int = 5):
+        """
+        :param embedding_svc: The embedding service whose indexes are searched.
+        :param api_key: Optional API key expected in the 'api_key' request header.
+        :param size: Default number of suggestions.
+        """
+        self._embedding_svc = embedding_svc
+        self._api_key = api_key
+        self._size = size
+
+    def handle(self, event, context):
+        query_params = event.get("queryStringParameters") or {}
+        prefix = (query_params.get("prefix") or query_params.get("query") or "").strip()
+        if not prefix:
+            return {
+                "statusCode": 400,
+                "body": json.dumps({"error": "No prefix provided in event."}),
+            }
+
+        if self._api_key and event.get("headers", {}).get("api_key") != self._api_key:
+            return {
+                "statusCode": 401,
+                "body": json.dumps({"error": "Unauthorized"}),
+            }
+
+        try:
+            size = int(query_params.get("size", self._size))
+        except ValueError:
+            size = 0
+        if not 1 <= size <= MAX_SUGGESTIONS:
+            return {
+                "statusCode": 400,
+                "body": json.dumps({"error": f"'size' must be between 1 and {MAX_SUGGESTIONS}"}),
+            }
+
+        try:
+            suggestions = self._embedding_svc.suggest_titles(prefix, size)
+        except Exception as e:
+            logger.error("Error fetching suggestions: %s", e, exc_info=True)
+            return {
+                "statusCode": 500,
+                "body": json.dumps({"error": f"Opensearch suggest failed: {str(e)}"}),
+            }
+
+        return {
+            "statusCode": 200,
+            "body": json.dumps({"suggestions": suggestions}),
+        }
@@ -0,0 +1,76 @@
+"""
+Benchmark the rerank stage on synthetic candidates.
+
+Simulates over-fetched kNN results in which groups of candidates are near-duplicates of each
+other, and reports how long MMR reranking takes and how many documents (and prompt characters)
+are sent to the LLM with and without it.
+
+Usage:
+    PYTHONPATH=src python -m tools.bench_rerank --fetch-k 20 --k 5 --dimensions 1024
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from common.rerank import rerank_hits
+
+
+def make_candidates(fetch_k: int, dimensions: int, duplicates: int, rng: np.random.Generator):
+    """
+    Build a query vector and fetch_k hits, where every `duplicates` consecutive hits are
+    small perturbations of the same document.
+    """
+    query = rng.normal(size=dimensions).astype(np.float32)
+    hits = []
+    for i in range(fetch_k):
+        if i % duplicates == 0:
+            base = query + rng.normal(scale=1.5, size=dimensions).astype(np.float32)
+        vector = base + rng.normal(scale=0.01, size=dimensions).astype(np.float32)
+        vector /= np.linalg.norm(vector)
+        hits.append(
+            {
+                "_id": str(i),
+                "_score": 1.0 - i * 0.01,
+                "_source": {"text": "x" * 2000, "embedding": vector.tolist()},
+            }
+        )
+    return query / np.linalg.norm(query), hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dimensions", type=int, default=1024)
+    parser.add_argument("--duplicates", type=int, default=3, help="Near-duplicate group size")
+    parser.add_argument("--diversity", type=float, default=0.5)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    query, hits = make_candidates(args.fetch_k, args.dimensions, args.duplicates, rng)
+
+    selected = rerank_hits(query, hits, k=args.k, diversity=args.diversity)
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        rerank_hits(query, hits, k=args.k, diversity=args.diversity)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / args.iterations
+
+    baseline = hits[: args.k]
+
+    def distinct(docs):
+        return len({int(hit["_id"]) // args.duplicates for hit in docs})
+
+    def prompt_chars(docs):
+        return sum(len(hit["_source"]["text"]) for hit in docs)
+
+    print(f"candidates fetched:     {args.fetch_k} x {args.dimensions} dims")
+    print(f"rerank latency:         {elapsed_ms:.3f} ms/query")
+    print(f"top-k documents:        {len(baseline)} ({distinct(baseline)} distinct, {prompt_chars(baseline)} prompt chars)")
+    print(f"reranked documents:     {len(selected)} ({distinct(selected)} distinct, {prompt_chars(selected)} prompt chars)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark embedding decoding and bulk request serialization for one ingestion batch.
+
+Compares the previous path (Bedrock responses decoded into lists of Python floats, serialized
+action by action with the OpenSearch client's JSON serializer, as helpers.bulk does) with the
+current one (float32 buffers serialized straight into an NDJSON bulk body with orjson). Reports
+peak traced memory and time per batch.
+
+Usage:
+    PYTHONPATH=src python -m tools.bench_serialization --batch-size 100 --dimensions 1024
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from unittest.mock import MagicMock
+
+import numpy as np
+import orjson
+from opensearchpy.helpers import expand_action
+from opensearchpy.serializer import JSONSerializer
+
+from common.documents import StackOverflowDocument
+from common.embeddings import EmbeddingService
+
+
+def make_batch(batch_size: int, dimensions: int, rng: np.random.Generator):
+    """Build documents and the raw Bedrock response bodies of their embeddings."""
+    documents, responses = [], []
+    for i in range(batch_size):
+        documents.append(
+            StackOverflowDocument(
+                title=f"Question {i}",
+                question_body="x" * 1500,
+                answer_body="y" * 1500,
+                question_id=str(i),
+                tags=["python"],
+                score=10,
+            )
+        )
+        vector = rng.normal(size=dimensions)
+        vector /= np.linalg.norm(vector)
+        responses.append(
+            json.dumps({"embedding": vector.tolist(), "inputTextTokenCount": 800}).encode()
+        )
+    return documents, responses
+
+
+def list_path(embedding_svc: EmbeddingService, documents, responses) -> int:
+    """Previous path: json.loads into lists, one serializer call per action line."""
+    serializer = JSONSerializer()
+    pairs = [
+        (document, json.loads(response)["embedding"])
+        for document, response in zip(documents, responses)
+    ]
+    lines = []
+    for document, vector in pairs:
+        action, source = expand_action(
+            {
+                "_index": embedding_svc.index_name,
+                "_id": document.question_id,
+                "embedding": vector,
+                "text": document.text,
+                **document.to_source(),
+            }
+        )
+        lines.append(serializer.dumps(action))
+        lines.append(serializer.dumps(source))
+    return len("\n".join(lines).encode())
+
+
+def buffer_path(embedding_svc: EmbeddingService, documents, responses) -> int:
+    """Current path: orjson into float32 buffers, serialized straight into the bulk body."""
+    pairs = [
+        (document, np.asarray(orjson.loads(response)["embedding"], dtype=np.float32))
+        for document, response in zip(documents, responses)
+    ]
+    return len(embedding_svc._bulk_body(pairs))
+
+
+def measure(func, *args, iterations: int):
+    """:return: Peak traced memory in bytes, mean time in ms and the body size of one run"""
+    tracemalloc.start()
+    size = func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(*args)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / iterations
+    return peak, elapsed_ms, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--dimensions", type=int, default=1024)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    documents, responses = make_batch(args.batch_size, args.dimensions, rng)
+    embedding_svc = EmbeddingService(MagicMock(), MagicMock(), "bench-index", "bench-model")
+
+    print(f"batch:                  {args.batch_size} documents x {args.dimensions} dims")
+    for name, func in (("lists + json", list_path), ("float32 + orjson", buffer_path)):
+        peak, elapsed_ms, size = measure(
+            func, embedding_svc, documents, responses, iterations=args.iterations
+        )
+        print(
+            f"{name + ':':<24}{elapsed_ms:8.2f} ms/batch, peak {peak / 2**20:7.2f} MiB, "
+            f"body {size / 2**20:6.2f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
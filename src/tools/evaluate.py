@@ -0,0 +1,282 @@
+"""
+Evaluate retrieval quality against latency across embedding and kNN configurations.
+
+Builds a labelled golden set from documents already ingested into OpenSearch, where each
+question title is a query and the question's own document is the expected answer. The
+corpus is then re-embedded and indexed into a throwaway index for every combination of
+Titan embedding dimensions and HNSW parameters, and each configuration is scored on
+recall@k, MRR, index size and query latency percentiles.
+
+The titles are held out of the evaluation corpus, which embeds only the question and answer
+bodies; otherwise every query would match its own text and recall would be near perfect for
+any configuration. Absolute scores are therefore lower than production retrieval (which
+embeds the title too) and only meaningful for comparing configurations with each other.
+
+Usage:
+    PYTHONPATH=src python -m tools.evaluate golden --size 2000 --output golden.jsonl
+    PYTHONPATH=src python -m tools.evaluate run --golden golden.jsonl \\
+        --dimensions 256,512,1024 --m 16,32 --ef-search 100,256 --k 1,5,10 --output report.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+from aws_lambda_powertools import Logger
+from opensearchpy import OpenSearch
+
+from common.aws import get_bedrock_client, get_opensearch_client
+from common.documents import StackOverflowDocument
+from common.embeddings import EmbeddingService
+from common.providers import SEARCH_QUERY
+
+logger = Logger()
+
+
+def build_golden_set(
+    opensearch_client: OpenSearch, index_name: str, size: int, seed: int = 42
+) -> list[dict]:
+    """
+    Sample structured documents from the ingested index.
+
+    :param opensearch_client: The OpenSearch client
+    :param index_name: The index to sample from.
+    :param size: Number of documents to sample.
+    :param seed: Random seed, so the same golden set can be rebuilt.
+    :return: A list of document sources, as returned by StackOverflowDocument.to_source
+    """
+    fields = list(StackOverflowDocument.__dataclass_fields__)
+    results = opensearch_client.search(
+        index=index_name,
+        body={
+            "size": size,
+            "_source": fields,
+            "query": {
+                "function_score": {
+                    "query": {"exists": {"field": "question_id"}},
+                    "random_score": {"seed": seed, "field": "_seq_no"},
+                }
+            },
+        },
+    )
+    return [hit["_source"] for hit in results["hits"]["hits"]]
+
+
+def corpus_text(document: StackOverflowDocument) -> str:
+    """
+    :return: The text a golden document is indexed with: its combined text without the title,
+             which is the query expected to retrieve it
+    """
+    return f"Body: {document.question_body}\nAccepted Answer: {document.answer_body}"
+
+
+def recall_at_k(ranked_ids: list[str], expected_id: str, k: int) -> float:
+    """:return: 1.0 if the expected document is in the top k results, 0.0 otherwise."""
+    return float(expected_id in ranked_ids[:k])
+
+
+def reciprocal_rank(ranked_ids: list[str], expected_id: str) -> float:
+    """:return: 1 / rank of the expected document, or 0.0 if it was not retrieved."""
+    if expected_id not in ranked_ids:
+        return 0.0
+    return 1.0 / (ranked_ids.index(expected_id) + 1)
+
+
+def latency_percentiles(latencies_ms: list[float]) -> dict:
+    """:return: p50, p95 and p99 of the given latencies in milliseconds."""
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+
+def evaluate_searches(
+    embedding_svc: EmbeddingService,
+    queries: list[tuple[str, list[float]]],
+    k: int,
+    ef_search: int | None = None,
+) -> dict:
+    """
+    Run every golden query against an index and score the results.
+
+    :param embedding_svc: An embedding service bound to the index under evaluation.
+    :param queries: (expected question ID, query embedding) pairs.
+    :param k: Number of results to retrieve per query.
+    :param ef_search: Optional HNSW ef_search passed with every query.
+    :return: recall@k, MRR and latency percentiles
+    """
+    recalls, reciprocal_ranks, latencies = [], [], []
+    for expected_id, vector in queries:
+        start = time.perf_counter()
+        hits = embedding_svc.query_opensearch(
+            vector, k=k, source_fields=["question_id"], ef_search=ef_search
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        ranked_ids = [hit["_source"].get("question_id") for hit in hits]
+        recalls.append(recall_at_k(ranked_ids, expected_id, k))
+        reciprocal_ranks.append(reciprocal_rank(ranked_ids, expected_id))
+
+    return {
+        "recall@k": float(np.mean(recalls)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        **latency_percentiles(latencies),
+    }
+
+
+def run_sweep(
+    opensearch_client: OpenSearch,
+    bedrock_client,
+    model_id: str,
+    golden: list[dict],
+    num_queries: int,
+    dimensions: list[int],
+    knn_grid: list[dict],
+    ef_search_values: list[int],
+    k_values: list[int],
+    keep_indexes: bool = False,
+) -> list[dict]:
+    """
+    Evaluate every configuration in the sweep.
+
+    The corpus is embedded once per dimension and re-indexed once per HNSW build configuration;
+    ef_search is a search-time parameter, passed with each kNN query (method_parameters), so it is
+    varied without rebuilding.
+
+    :return: One report row per (dimensions, m, ef_construction, ef_search, k) combination
+    """
+    documents = [StackOverflowDocument(**source) for source in golden]
+    query_documents = documents[:num_queries]
+    report = []
+
+    for dims in dimensions:
+        logger.info(f"Embedding {len(documents)} documents with {dims} dimensions")
+        embedder = EmbeddingService(
+            opensearch_client, bedrock_client, "unused", model_id, embedding_dimensions=dims
+        )
+        corpus = [
+            (document, embedder.generate_embedding(corpus_text(document))) for document in documents
+        ]
+        queries = [
+            (document.question_id, embedder.generate_embedding(document.title, input_type=SEARCH_QUERY))
+            for document in query_documents
+        ]
+
+        for knn_parameters in knn_grid:
+            index_name = "codequest-eval-{}-m{}-efc{}".format(
+                dims, knn_parameters["m"], knn_parameters["ef_construction"]
+            )
+            if opensearch_client.indices.exists(index_name):
+                opensearch_client.indices.delete(index_name)
+
+            embedding_svc = EmbeddingService(
+                opensearch_client,
+                bedrock_client,
+                index_name,
+                model_id,
+                embedding_dimensions=dims,
+                knn_parameters=knn_parameters,
+            )
+            embedding_svc.save_to_opensearch(corpus)
+            stats = opensearch_client.indices.stats(index=index_name, metric="store")
+            index_size = stats["indices"][index_name]["total"]["store"]["size_in_bytes"]
+
+            for ef_search, k in itertools.product(ef_search_values, k_values):
+                row = {
+                    "dimensions": dims,
+                    **knn_parameters,
+                    "ef_search": ef_search,
+                    "k": k,
+                    "index_size_bytes": index_size,
+                    **evaluate_searches(embedding_svc, queries, k, ef_search),
+                }
+                logger.info("Evaluated configuration", extra=row)
+                report.append(row)
+
+            if not keep_indexes:
+                opensearch_client.indices.delete(index_name)
+
+    return report
+
+
+def format_report(report: list[dict]) -> str:
+    """:return: The report as a markdown table, one row per configuration."""
+    columns = [
+        "dimensions", "m", "ef_construction", "ef_search", "k", "recall@k", "mrr",
+        "p50_ms", "p95_ms", "p99_ms", "index_size_bytes",
+    ]
+    lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+    for row in report:
+        cells = [f"{row[c]:.3f}" if isinstance(row[c], float) else str(row[c]) for c in columns]
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(item) for item in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    golden_parser = subparsers.add_parser("golden", help="Sample a golden set from the index")
+    golden_parser.add_argument("--size", type=int, default=1000)
+    golden_parser.add_argument("--seed", type=int, default=42)
+    golden_parser.add_argument("--output", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Sweep configurations over a golden set")
+    run_parser.add_argument("--golden", required=True)
+    run_parser.add_argument("--queries", type=int, default=200, help="Number of golden queries")
+    run_parser.add_argument("--dimensions", type=_int_list, default=[256, 512, 1024])
+    run_parser.add_argument("--m", type=_int_list, default=[16])
+    run_parser.add_argument("--ef-construction", type=_int_list, default=[128])
+    run_parser.add_argument("--ef-search", type=_int_list, default=[100])
+    run_parser.add_argument("--k", type=_int_list, default=[1, 5, 10])
+    run_parser.add_argument("--keep-indexes", action="store_true")
+    run_parser.add_argument("--output", help="Optional path for the JSON report")
+    args = parser.parse_args()
+
+    opensearch_client = get_opensearch_client(
+        opensearch_host=os.environ.get("OPENSEARCH_HOST"),
+        region=os.getenv("AWS_REGION", "us-east-1"),
+    )
+
+    if args.command == "golden":
+        golden = build_golden_set(
+            opensearch_client, os.environ.get("OPENSEARCH_INDEX_NAME"), args.size, args.seed
+        )
+        with open(args.output, "w") as f:
+            f.writelines(json.dumps(record) + "\n" for record in golden)
+        print(f"Wrote {len(golden)} golden documents to {args.output}")
+        return
+
+    with open(args.golden) as f:
+        golden = [json.loads(line) for line in f if line.strip()]
+
+    knn_grid = [
+        {"m": m, "ef_construction": ef_construction}
+        for m, ef_construction in itertools.product(args.m, args.ef_construction)
+    ]
+    report = run_sweep(
+        opensearch_client,
+        get_bedrock_client(),
+        os.environ.get("BEDROCK_MODEL_ID", "amazon.titan-embed-text-v2:0"),
+        golden,
+        args.queries,
+        args.dimensions,
+        knn_grid,
+        args.ef_search,
+        args.k,
+        args.keep_indexes,
+    )
+
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
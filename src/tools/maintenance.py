@@ -0,0 +1,173 @@
+"""
+Index maintenance: force-merge, kNN warmup, kNN cache clearing and stats.
+
+Large ingestion runs leave the index with many small segments, each with its own HNSW graph,
+and graphs are only loaded into native memory by the first search that needs them. Run
+`post-ingest` after ingestion to merge segments down, preload the graphs and print the result,
+so the first queries after a deploy run at steady-state latency. With INDEX_PARTITIONING or
+INDEX_PARTITIONS_PATH set, as on the Lambdas, every partition index of --index is maintained.
+
+Usage:
+    PYTHONPATH=src python -m tools.maintenance post-ingest --max-segments 1
+    PYTHONPATH=src python -m tools.maintenance forcemerge --max-segments 4
+    PYTHONPATH=src python -m tools.maintenance warmup
+    PYTHONPATH=src python -m tools.maintenance clear-cache
+    PYTHONPATH=src python -m tools.maintenance stats
+"""
+
+import argparse
+import json
+import os
+import time
+
+from aws_lambda_powertools import Logger
+from opensearchpy import OpenSearch
+
+from common.aws import get_opensearch_client
+from common.embeddings import EmbeddingService
+from common.init_service import initialize_partitioner
+
+logger = Logger()
+
+
+def force_merge(
+    opensearch_client: OpenSearch, index_name: str, max_segments: int = 1, timeout: int = 3600
+) -> float:
+    """
+    Merge the index down to at most max_segments segments per shard. Merged segments get one
+    HNSW graph each instead of one per small segment, so searches visit fewer graphs.
+
+    :param opensearch_client: The OpenSearch client
+    :param index_name: The index to merge.
+    :param max_segments: Target number of segments per shard.
+    :param timeout: Request timeout in seconds; merging a large index takes minutes.
+    :return: The time the merge took in seconds
+    """
+    logger.info(f"Force-merging {index_name} to {max_segments} segments per shard")
+    start = time.perf_counter()
+    opensearch_client.indices.forcemerge(
+        index=index_name, max_num_segments=max_segments, request_timeout=timeout
+    )
+    return time.perf_counter() - start
+
+
+def warmup(opensearch_client: OpenSearch, index_name: str, timeout: int = 600) -> dict:
+    """
+    Load the index's HNSW graphs into native memory ahead of the first search.
+
+    :return: The shard summary of the warmup call
+    """
+    logger.info(f"Warming up kNN graphs of {index_name}")
+    response = opensearch_client.plugins.knn.warmup(index=index_name, request_timeout=timeout)
+    return response["_shards"]
+
+
+def clear_knn_cache(opensearch_client: OpenSearch, index_name: str) -> dict:
+    """
+    Evict the index's HNSW graphs from native memory, e.g. to measure cold-start latency.
+
+    :return: The shard summary of the clear cache call
+    """
+    logger.info(f"Clearing kNN graph cache of {index_name}")
+    response = opensearch_client.transport.perform_request(
+        "POST", f"/_plugins/_knn/clear_cache/{index_name}"
+    )
+    return response["_shards"]
+
+
+def collect_stats(opensearch_client: OpenSearch, index_name: str) -> dict:
+    """
+    :return: Segment, storage and kNN graph memory stats of the index, summed over all nodes
+    """
+    index_stats = opensearch_client.indices.stats(
+        index=index_name, metric="docs,segments,store"
+    )["indices"][index_name]["primaries"]
+
+    knn = {
+        "graph_memory_kb": 0,
+        "graph_count": 0,
+        "cache_hits": 0,
+        "cache_misses": 0,
+        "evictions": 0,
+        "max_graph_memory_percent": 0.0,
+    }
+    for node in opensearch_client.plugins.knn.stats()["nodes"].values():
+        index_graphs = node.get("indices_in_cache", {}).get(index_name, {})
+        knn["graph_memory_kb"] += index_graphs.get("graph_memory_usage", 0)
+        knn["graph_count"] += index_graphs.get("graph_count", 0)
+        knn["cache_hits"] += node.get("hit_count", 0)
+        knn["cache_misses"] += node.get("miss_count", 0)
+        knn["evictions"] += node.get("eviction_count", 0)
+        knn["max_graph_memory_percent"] = max(
+            knn["max_graph_memory_percent"], node.get("graph_memory_usage_percentage", 0.0)
+        )
+
+    return {
+        "index": index_name,
+        "documents": index_stats["docs"]["count"],
+        "deleted_documents": index_stats["docs"]["deleted"],
+        "segments": index_stats["segments"]["count"],
+        "segment_memory_bytes": index_stats["segments"]["memory_in_bytes"],
+        "store_bytes": index_stats["store"]["size_in_bytes"],
+        "knn": knn,
+    }
+
+
+def format_stats(stats: dict) -> str:
+    knn = stats["knn"]
+    return "\n".join(
+        [
+            f"index:                  {stats['index']}",
+            f"documents:              {stats['documents']} ({stats['deleted_documents']} deleted)",
+            f"segments:               {stats['segments']}",
+            f"segment memory:         {stats['segment_memory_bytes'] / 2**20:.1f} MiB",
+            f"store size:             {stats['store_bytes'] / 2**20:.1f} MiB",
+            f"kNN graphs loaded:      {knn['graph_count']} ({knn['graph_memory_kb'] / 2**10:.1f} MiB)",
+            f"kNN memory (max node):  {knn['max_graph_memory_percent']:.1f}% of the circuit breaker limit",
+            f"kNN cache:              {knn['cache_hits']} hits, {knn['cache_misses']} misses, {knn['evictions']} evictions",
+        ]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--index", default=os.environ.get("OPENSEARCH_INDEX_NAME"))
+    parser.add_argument("--json", action="store_true", help="Print stats as JSON")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for command in ("post-ingest", "forcemerge"):
+        command_parser = subparsers.add_parser(command)
+        command_parser.add_argument("--max-segments", type=int, default=1)
+        command_parser.add_argument("--timeout", type=int, default=3600, help="Seconds")
+    subparsers.add_parser("warmup", help="Load kNN graphs into native memory")
+    subparsers.add_parser("clear-cache", help="Evict kNN graphs from native memory")
+    subparsers.add_parser("stats", help="Print segment, memory and graph stats")
+    args = parser.parse_args()
+
+    opensearch_client = get_opensearch_client(
+        opensearch_host=os.environ.get("OPENSEARCH_HOST"),
+        region=os.getenv("AWS_REGION", "us-east-1"),
+    )
+
+    # A partitioned index is stored as one physical index per partition
+    index_names = EmbeddingService(
+        opensearch_client, None, args.index, None, partitioner=initialize_partitioner()
+    ).index_names
+
+    for index_name in index_names:
+        if args.command in ("post-ingest", "forcemerge"):
+            elapsed = force_merge(opensearch_client, index_name, args.max_segments, args.timeout)
+            print(f"Force-merged {index_name} to {args.max_segments} segments in {elapsed:.1f}s")
+        if args.command in ("post-ingest", "warmup"):
+            shards = warmup(opensearch_client, index_name)
+            print(f"Warmed up {shards['successful']}/{shards['total']} shards of {index_name}")
+        if args.command == "clear-cache":
+            shards = clear_knn_cache(opensearch_client, index_name)
+            print(f"Cleared kNN cache on {shards['successful']}/{shards['total']} shards of {index_name}")
+        if args.command in ("post-ingest", "stats"):
+            stats = collect_stats(opensearch_client, index_name)
+            print(json.dumps(stats, indent=2) if args.json else format_stats(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compute partition centroids for query classification.
+
+Samples documents from every partition index, averages their embeddings into one normalized
+centroid per partition and writes a partitioner config (partitions, default partition and
+centroids) to load with INDEX_PARTITIONS_PATH. Queries that mention no tag are then routed to
+the partition with the nearest centroid when it is a clear winner.
+
+Usage:
+    PYTHONPATH=src python -m tools.partitions centroids --sample 2000 --output partitions.json
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+from aws_lambda_powertools import Logger
+from opensearchpy import OpenSearch
+
+from common.aws import get_opensearch_client
+from common.partitions import DEFAULT_PARTITION, DEFAULT_PARTITIONS
+
+logger = Logger()
+
+
+def compute_centroids(
+    opensearch_client: OpenSearch,
+    index_name: str,
+    partitions: list[str],
+    sample_size: int = 2000,
+    seed: int = 42,
+) -> dict[str, list[float]]:
+    """
+    :param opensearch_client: The OpenSearch client
+    :param index_name: The base index name; partition indexes are '<index_name>-<partition>'.
+    :param partitions: The partitions to compute centroids for.
+    :param sample_size: Number of documents sampled per partition.
+    :param seed: Seed of the random sample.
+    :return: Partition name -> normalized mean embedding, for partitions with documents
+    """
+    centroids = {}
+    for partition in partitions:
+        partition_index = f"{index_name}-{partition}"
+        if not opensearch_client.indices.exists(partition_index):
+            logger.warning(f"Skipping {partition_index}, it does not exist")
+            continue
+        hits = opensearch_client.search(
+            index=partition_index,
+            body={
+                "size": sample_size,
+                "_source": ["embedding"],
+                "query": {"function_score": {"random_score": {"seed": seed, "field": "_seq_no"}}},
+            },
+        )["hits"]["hits"]
+        if not hits:
+            continue
+        centroid = np.mean(
+            [np.asarray(hit["_source"]["embedding"], dtype=np.float32) for hit in hits], axis=0
+        )
+        centroids[partition] = (centroid / np.linalg.norm(centroid)).tolist()
+        logger.info(f"Computed the {partition} centroid from {len(hits)} documents")
+    return centroids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    centroids_parser = subparsers.add_parser("centroids", help="Write a config with partition centroids")
+    centroids_parser.add_argument("--index", default=os.environ.get("OPENSEARCH_INDEX_NAME"))
+    centroids_parser.add_argument("--sample", type=int, default=2000)
+    centroids_parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    opensearch_client = get_opensearch_client(
+        opensearch_host=os.environ.get("OPENSEARCH_HOST"),
+        region=os.getenv("AWS_REGION", "us-east-1"),
+    )
+    # Centroids are computed for the content partitions only; 'other' is too mixed to classify into
+    centroids = compute_centroids(opensearch_client, args.index, list(DEFAULT_PARTITIONS), args.sample)
+    with open(args.output, "w") as f:
+        json.dump(
+            {"partitions": DEFAULT_PARTITIONS, "default": DEFAULT_PARTITION, "centroids": centroids},
+            f,
+        )
+    print(f"Wrote centroids of {len(centroids)} partitions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Precompute answers for the most popular queries.
+
+Mines query logs (JSON Lines with a 'query' field per line) for the top-N normalized queries,
+runs each through the full QueryHandler pipeline (Titan embedding, kNN search, rerank and Haiku
+rendering) and stores the rendered markdown in the precomputed answer index, which the query
+Lambda checks before anything else. Entries are only re-rendered when the searched index has
+changed since they were stored, so the job is cheap to run on a schedule.
+
+Usage:
+    PYTHONPATH=src python -m tools.precompute --log queries.jsonl --top 500
+"""
+
+import argparse
+import json
+import os
+from collections import Counter
+
+from aws_lambda_powertools import Logger
+
+from common.answers import PrecomputedAnswerStore, index_fingerprint, normalize_query
+from common.init_service import initialize_services
+from query.handler import QueryHandler
+
+logger = Logger()
+
+
+def mine_top_queries(records, top_n: int) -> list[dict]:
+    """
+    Count queries by their normalized form.
+
+    :param records: Query log records, each a dict with a 'query' field.
+    :param top_n: Number of queries to return.
+    :return: The top_n normalized queries, most frequent first, each with the most common raw
+             spelling (used to render the answer) and its count
+    """
+    counts, spellings = Counter(), {}
+    for record in records:
+        query = (record.get("query") or "").strip()
+        if not query:
+            continue
+        normalized = normalize_query(query)
+        counts[normalized] += 1
+        spellings.setdefault(normalized, Counter())[query] += 1
+
+    return [
+        {"query": normalized, "text": spellings[normalized].most_common(1)[0][0], "count": count}
+        for normalized, count in counts.most_common(top_n)
+    ]
+
+
+def refresh_answers(
+    handler: QueryHandler,
+    store: PrecomputedAnswerStore,
+    queries: list[dict],
+    fingerprint: str,
+    force: bool = False,
+    model_id: str | None = None,
+) -> dict:
+    """
+    Render and store answers for queries whose entry is missing, or was rendered against an
+    older version of the index or with another embedding model.
+
+    :param handler: The query handler used to render answers; it must not use the answer store.
+    :param store: The precomputed answer store.
+    :param queries: Queries as returned by mine_top_queries.
+    :param fingerprint: The current fingerprint of the searched index.
+    :param force: Re-render every query even if its entry is current.
+    :param model_id: The embedding model queries are embedded with.
+    :return: Counts of 'rendered', 'current' and 'failed' queries
+    """
+    counts = Counter(rendered=0, current=0, failed=0)
+    for query in queries:
+        entry = store.get(query["query"])
+        if (
+            entry
+            and entry.get("fingerprint") == fingerprint
+            and entry.get("model_id") == model_id
+            and not force
+        ):
+            counts["current"] += 1
+            continue
+
+        # Force rendering, and ask for the matched question IDs to record what the answer used
+        event = {
+            "queryStringParameters": {
+                "query": query["text"],
+                "mode": "render",
+                "fields": "question_id",
+            }
+        }
+        response = handler.handle(event, None)
+        if response["statusCode"] != 200:
+            logger.warning(f"Could not precompute '{query['query']}'", extra={"response": response})
+            counts["failed"] += 1
+            continue
+
+        body = json.loads(response["body"])
+        hit_ids = [match["question_id"] for match in body.get("matches", [])]
+        store.put(query["query"], body["markdown"], hit_ids, fingerprint, model_id)
+        counts["rendered"] += 1
+
+    return dict(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--log", action="append", required=True, help="Query log (repeatable)")
+    parser.add_argument("--top", type=int, default=500, help="Number of queries to precompute")
+    parser.add_argument("--k", type=int, default=int(os.getenv("SEARCH_K", "5")))
+    parser.add_argument("--fetch-k", type=int, default=int(os.getenv("RERANK_FETCH_K", "20")))
+    parser.add_argument("--force", action="store_true", help="Re-render current entries too")
+    args = parser.parse_args()
+
+    records = []
+    for path in args.log:
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    queries = mine_top_queries(records, args.top)
+    covered = sum(query["count"] for query in queries)
+    print(f"Top {len(queries)} queries cover {covered} of {len(records)} logged requests")
+
+    embedding_svc, bedrock_client = initialize_services()
+    store = PrecomputedAnswerStore(
+        embedding_svc.opensearch_client,
+        os.getenv("PRECOMPUTED_ANSWERS_INDEX", f"{embedding_svc.index_name}-answers"),
+    )
+    handler = QueryHandler(embedding_svc, bedrock_client, k=args.k, fetch_k=args.fetch_k)
+    fingerprint = index_fingerprint(embedding_svc.opensearch_client, embedding_svc.index_names)
+
+    counts = refresh_answers(
+        handler, store, queries, fingerprint, args.force, embedding_svc.model_id
+    )
+    print(f"Rendered {counts['rendered']}, {counts['current']} already current, {counts['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Replay a recorded query log as a load test and report a throughput/latency curve.
+
+Queries recorded by the query Lambda (QUERY_LOG_PATH) are sent open-loop at each target QPS,
+either straight through an in-process QueryHandler, backed by the docker-compose OpenSearch
+and a stubbed Bedrock with configurable latencies, or to a running API such as `sam local
+start-api`. Latency is measured from each request's scheduled send time, so queueing shows up
+once the stack saturates.
+
+Usage:
+    PYTHONPATH=src python -m tools.replay --log queries.jsonl --qps 5,10,20,40 --concurrency 16
+    PYTHONPATH=src python -m tools.replay --log queries.jsonl --target http \\
+        --url http://127.0.0.1:3000/code/search --qps 1,2,4
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from aws_lambda_powertools import Logger
+from opensearchpy import OpenSearch
+
+from common.embeddings import EmbeddingService
+from query.handler import QueryHandler
+from tools.evaluate import latency_percentiles
+
+logger = Logger()
+
+
+class StubBedrockClient:
+    """
+    Stands in for the Bedrock runtime client: deterministic pseudo-random embeddings per text
+    and a canned rendered answer, each after a fixed latency.
+    """
+
+    def __init__(self, dimensions: int = 1024, embed_latency_ms: float = 30, render_latency_ms: float = 800):
+        self._dimensions = dimensions
+        self._embed_latency = embed_latency_ms / 1000
+        self._render_latency = render_latency_ms / 1000
+
+    def invoke_model(self, body, modelId, accept, contentType):
+        text = json.loads(body)["inputText"]
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big")
+        vector = np.random.default_rng(seed).normal(size=self._dimensions)
+        time.sleep(self._embed_latency)
+        payload = json.dumps({"embedding": (vector / np.linalg.norm(vector)).tolist()})
+        return {"body": io.BytesIO(payload.encode())}
+
+    def converse(self, **kwargs):
+        time.sleep(self._render_latency)
+        return {
+            "output": {
+                "message": {"role": "assistant", "content": [{"text": "<markdown>stub answer</markdown>"}]}
+            }
+        }
+
+
+def load_log(path: str) -> list[dict]:
+    """:return: The recorded queries of a query log, skipping records without a query"""
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [record for record in records if record.get("query")]
+
+
+def build_params(record: dict) -> dict:
+    return {"query": record["query"], **record.get("params", {})}
+
+
+def handler_target(handler: QueryHandler):
+    """:return: A function sending a recorded query through the handler and returning the status code"""
+
+    def send(record: dict) -> int:
+        return handler.handle({"queryStringParameters": build_params(record)}, None)["statusCode"]
+
+    return send
+
+
+def http_target(url: str, api_key: str | None = None, timeout: float = 30):
+    """:return: A function sending a recorded query to an HTTP endpoint and returning the status code"""
+
+    def send(record: dict) -> int:
+        request = urllib.request.Request(f"{url}?{urllib.parse.urlencode(build_params(record))}")
+        if api_key:
+            request.add_header("api_key", api_key)
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    return send
+
+
+def run_step(send, records: list[dict], qps: float, concurrency: int, duration_s: float) -> dict:
+    """
+    Send queries open-loop at a fixed rate for a fixed duration, cycling through the records.
+
+    :param send: A target function returned by handler_target or http_target.
+    :param records: The recorded queries.
+    :param qps: The target request rate.
+    :param concurrency: Maximum number of requests in flight.
+    :param duration_s: How long to send requests for.
+    :return: Target and achieved QPS, latency percentiles and error rate of the step
+    """
+    total = max(1, int(qps * duration_s))
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def request(record: dict, scheduled: float):
+        nonlocal errors
+        try:
+            ok = 200 <= send(record) < 300
+        except Exception as e:
+            logger.warning(f"Replayed request failed: {e}")
+            ok = False
+        latency_ms = (time.perf_counter() - scheduled) * 1000
+        with lock:
+            latencies.append(latency_ms)
+            errors += 0 if ok else 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i in range(total):
+            scheduled = start + i / qps
+            time.sleep(max(0.0, scheduled - time.perf_counter()))
+            executor.submit(request, records[i % len(records)], scheduled)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "target_qps": qps,
+        "achieved_qps": round(total / elapsed, 2),
+        "requests": total,
+        **latency_percentiles(latencies),
+        "error_rate": round(errors / total, 4),
+    }
+
+
+def format_curve(rows: list[dict]) -> str:
+    header = f"{'target qps':>10} {'achieved':>9} {'requests':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(
+            f"{row['target_qps']:>10g} {row['achieved_qps']:>9.2f} {row['requests']:>9} "
+            f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['error_rate']:>7.2%}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--log", required=True, help="Query log recorded via QUERY_LOG_PATH")
+    parser.add_argument("--target", choices=["handler", "http"], default="handler")
+    parser.add_argument("--url", default="http://127.0.0.1:3000/code/search")
+    parser.add_argument("--qps", type=lambda v: [float(x) for x in v.split(",")], default=[1, 5, 10, 20])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per QPS step")
+    parser.add_argument("--opensearch-url", default="http://localhost:9200")
+    parser.add_argument("--embed-latency-ms", type=float, default=30)
+    parser.add_argument("--render-latency-ms", type=float, default=800)
+    parser.add_argument("--output", help="Optional path for the JSON report")
+    args = parser.parse_args()
+
+    records = load_log(args.log)
+    if args.target == "http":
+        send = http_target(args.url, os.getenv("API_KEY"))
+    else:
+        dimensions = int(os.getenv("EMBEDDING_DIMENSIONS", "1024"))
+        bedrock_client = StubBedrockClient(dimensions, args.embed_latency_ms, args.render_latency_ms)
+        embedding_svc = EmbeddingService(
+            OpenSearch(hosts=[args.opensearch_url]),
+            bedrock_client,
+            os.getenv("OPENSEARCH_INDEX_NAME", "code-snippets-embeddings"),
+            os.getenv("BEDROCK_MODEL_ID", "amazon.titan-embed-text-v2:0"),
+            embedding_dimensions=dimensions,
+        )
+        send = handler_target(QueryHandler(embedding_svc, bedrock_client))
+
+    print(f"Replaying {len(records)} recorded queries against {args.target}")
+    report = [
+        run_step(send, records, qps, args.concurrency, args.duration) for qps in args.qps
+    ]
+
+    print(format_curve(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Backfill the shadow index of an embedding model or mapping migration.
+
+While SHADOW_INDEX_NAME is set, ingestion writes new documents to both the current and the
+shadow index. This tool copies the documents indexed before that: it scans the current index,
+re-embeds each document with the shadow model (SHADOW_MODEL_ID, SHADOW_EMBEDDING_PROVIDER,
+SHADOW_EMBEDDING_DIMENSIONS) and writes it to the shadow index, skipping documents the shadow
+index already has. A mapping-only migration (the shadow model is the current one) copies the
+stored vectors instead of calling the model. Queries keep being served from the current index
+throughout.
+
+Usage:
+    PYTHONPATH=src python -m tools.shadow backfill --batch-size 100
+"""
+
+import argparse
+from collections import Counter
+from typing import Iterable
+
+from aws_lambda_powertools import Logger
+from botocore.exceptions import ClientError
+from opensearchpy import helpers
+
+from common.embeddings import EmbeddingService
+from common.init_service import initialize_services, initialize_shadow_service
+from common.providers import pack_batches
+from ingestion.throttling import AdaptiveConcurrencyLimiter, call_with_backoff
+from tools.snapshot import document_from_source
+
+logger = Logger()
+
+
+def scan_documents(
+    embedding_svc: EmbeddingService, batch_size: int = 500, include_embedding: bool = False
+) -> Iterable[dict]:
+    """
+    :param include_embedding: Keep the stored vector in the 'embedding' field of each source.
+    :return: The `_source` of every document in the current index
+    """
+    excludes = ["title_suggest"] if include_embedding else ["embedding", "title_suggest"]
+    for hit in helpers.scan(
+        embedding_svc.opensearch_client,
+        index=",".join(embedding_svc.index_names),
+        query={"query": {"match_all": {}}, "_source": {"excludes": excludes}},
+        size=batch_size,
+        ignore_unavailable=True,
+    ):
+        yield hit["_source"]
+
+
+def backfill_shadow(
+    shadow_svc: EmbeddingService,
+    sources: Iterable[dict],
+    batch_size: int = 100,
+    limiter: AdaptiveConcurrencyLimiter | None = None,
+) -> dict:
+    """
+    Re-embed documents with the shadow model and write them to the shadow index. Documents whose
+    source carries an 'embedding' are written with that vector as is.
+
+    :param shadow_svc: The embedding service of the shadow index.
+    :param sources: Documents of the current index, see scan_documents.
+    :param batch_size: Documents per shadow write.
+    :param limiter: Limiter used to back off while Bedrock throttles.
+    :return: Counts of 'copied', 'skipped' (already in the shadow index) and 'failed' documents
+    """
+    limiter = limiter or AdaptiveConcurrencyLimiter(initial=1, maximum=1)
+    counts = Counter(copied=0, skipped=0, failed=0)
+
+    def flush(pending):
+        embedded = [(document, vector) for document, vector in pending if vector is not None]
+        documents = [document for document, vector in pending if vector is None]
+        texts = [document if isinstance(document, str) else document.text for document in documents]
+        for batch in pack_batches(texts, *shadow_svc.batch_limits):
+            try:
+                vectors = call_with_backoff(
+                    limiter, lambda: shadow_svc.embed_batch([texts[position] for position in batch])
+                )
+            except ClientError as e:
+                logger.warning(f"Could not embed {len(batch)} documents: {e}")
+                counts["failed"] += len(batch)
+                continue
+            embedded.extend(zip([documents[position] for position in batch], vectors))
+        if embedded:
+            shadow_svc.save_to_opensearch(embedded, refresh=False)
+            counts["copied"] += len(embedded)
+
+    pending = []
+    for source in sources:
+        vector = source.get("embedding")
+        document = document_from_source(source)
+        if isinstance(document, str):
+            exists = shadow_svc.check_if_indexed(document)
+        else:
+            exists = shadow_svc.check_if_indexed(document.text, document.question_id, document.tags)
+        if exists:
+            counts["skipped"] += 1
+            continue
+        pending.append((document, vector))
+        if len(pending) >= batch_size:
+            flush(pending)
+            logger.info("Shadow backfill progress", extra=dict(counts))
+            pending = []
+    if pending:
+        flush(pending)
+
+    shadow_svc.opensearch_client.indices.refresh(
+        index=",".join(shadow_svc.index_names), ignore_unavailable=True
+    )
+    return dict(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Copy existing documents to the shadow index")
+    backfill_parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    embedding_svc, bedrock_client = initialize_services()
+    shadow_svc = initialize_shadow_service(embedding_svc, bedrock_client)
+    if shadow_svc is None:
+        parser.error("SHADOW_INDEX_NAME is not set")
+
+    # A mapping-only migration keeps the model, so the stored vectors are copied as they are
+    reuse_vectors = shadow_svc.embedding_model == embedding_svc.embedding_model
+    counts = backfill_shadow(
+        shadow_svc, scan_documents(embedding_svc, include_embedding=reuse_vectors), args.batch_size
+    )
+    print(f"Copied {counts['copied']}, {counts['skipped']} already present, {counts['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Export an index to a portable snapshot and bulk-load it into any OpenSearch.
+
+A snapshot is a directory with the documents (IDs, text and metadata) in `documents.parquet`,
+their embeddings as a float32 `.npy` matrix in the same row order (`vectors.npy`, memory-mapped
+on both export and import so the vectors never sit in memory at once) and a `manifest.json`
+with the index mapping and kNN settings. Importing needs no BigQuery or Bedrock calls, so a
+local or new cloud environment is seeded in minutes.
+
+Usage:
+    PYTHONPATH=src python -m tools.snapshot export --output snapshots/2024-06-01
+    PYTHONPATH=src python -m tools.snapshot import --input snapshots/2024-06-01 \\
+        --opensearch-url http://localhost:9200 --workers 4
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from aws_lambda_powertools import Logger
+from opensearchpy import OpenSearch, helpers
+
+from common.aws import get_opensearch_client
+from common.documents import DOCUMENT_PROPERTIES, StackOverflowDocument
+from common.embeddings import EmbeddingService
+from common.init_service import initialize_partitioner
+from common.partitions import TagPartitioner
+
+logger = Logger()
+
+DOCUMENTS_FILE = "documents.parquet"
+VECTORS_FILE = "vectors.npy"
+MANIFEST_FILE = "manifest.json"
+
+# Document metadata stored in the snapshot; the embedding goes to the vector matrix instead
+SNAPSHOT_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("text", pa.string()),
+        ("content_hash", pa.string()),
+        ("question_id", pa.string()),
+        ("title", pa.string()),
+        ("question_body", pa.string()),
+        ("answer_body", pa.string()),
+        ("tags", pa.list_(pa.string())),
+        ("score", pa.int64()),
+        ("creation_date", pa.string()),
+        ("last_activity_date", pa.string()),
+    ]
+)
+
+# Index settings carried over to the imported index
+_SNAPSHOT_SETTINGS = ("index.knn", "index.number_of_shards", "index.number_of_replicas")
+
+
+def export_snapshot(
+    opensearch_client: OpenSearch,
+    index_name: str,
+    directory: str,
+    batch_size: int = 1000,
+    partitioner: TagPartitioner | None = None,
+) -> dict:
+    """
+    Scroll through an index and write its documents and vectors to a snapshot directory.
+
+    :param opensearch_client: The OpenSearch client
+    :param index_name: The index to export.
+    :param directory: The snapshot directory, created if missing.
+    :param batch_size: Documents per scroll page and Parquet row group.
+    :param partitioner: Optional tag partitioner; the partition indexes of index_name are then
+                        exported together, with the mapping and settings of the first one.
+    :return: The snapshot manifest
+    """
+    source_indexes = [index_name]
+    if partitioner is not None:
+        partition_indexes = EmbeddingService(
+            opensearch_client, None, index_name, None, partitioner=partitioner
+        ).index_names
+        source_indexes = [name for name in partition_indexes if opensearch_client.indices.exists(name)]
+        if not source_indexes:
+            raise ValueError(f"No partition index of {index_name} exists")
+
+    os.makedirs(directory, exist_ok=True)
+    first_index = source_indexes[0]
+    mappings = opensearch_client.indices.get_mapping(index=first_index)[first_index]["mappings"]
+    settings = opensearch_client.indices.get_settings(index=first_index, flat_settings=True)
+    settings = {
+        key: value
+        for key, value in settings[first_index]["settings"].items()
+        if key.startswith(_SNAPSHOT_SETTINGS)
+    }
+    dimensions = mappings["properties"]["embedding"]["dimension"]
+    source_index = ",".join(source_indexes)
+    capacity = opensearch_client.count(index=source_index)["count"]
+
+    vectors = np.lib.format.open_memmap(
+        os.path.join(directory, VECTORS_FILE), mode="w+", dtype=np.float32, shape=(capacity, dimensions)
+    )
+    writer = pq.ParquetWriter(os.path.join(directory, DOCUMENTS_FILE), SNAPSHOT_SCHEMA)
+    rows, count = [], 0
+    for hit in helpers.scan(
+        opensearch_client, index=source_index, query={"query": {"match_all": {}}}, size=batch_size
+    ):
+        if count == capacity:
+            logger.warning(f"{index_name} grew during the export, stopping at {capacity} documents")
+            break
+        source = hit["_source"]
+        vectors[count] = source.pop("embedding")
+        rows.append({"id": hit["_id"], **{name: source.get(name) for name in SNAPSHOT_SCHEMA.names[1:]}})
+        count += 1
+        if len(rows) == batch_size:
+            writer.write_table(pa.Table.from_pylist(rows, SNAPSHOT_SCHEMA))
+            rows = []
+    if rows:
+        writer.write_table(pa.Table.from_pylist(rows, SNAPSHOT_SCHEMA))
+    writer.close()
+    vectors.flush()
+
+    # Documents deleted during the export leave unused rows at the end of the matrix
+    manifest = {
+        "index": index_name,
+        "count": count,
+        "dimensions": dimensions,
+        "mappings": mappings,
+        "settings": settings,
+    }
+    with open(os.path.join(directory, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def document_from_source(row: dict) -> StackOverflowDocument | str:
+    """
+    Rebuild what EmbeddingService.save_to_opensearch takes from a snapshot row or an indexed
+    document's `_source`.
+    """
+    if row.get("question_id") is None:
+        return row["text"]
+    return StackOverflowDocument(
+        title=row["title"],
+        question_body=row["question_body"],
+        answer_body=row["answer_body"],
+        question_id=row["question_id"],
+        tags=row.get("tags") or [],
+        score=row.get("score"),
+        creation_date=row.get("creation_date"),
+        last_activity_date=row.get("last_activity_date"),
+    )
+
+
+def import_snapshot(
+    opensearch_client: OpenSearch,
+    directory: str,
+    index_name: str | None = None,
+    batch_size: int = 500,
+    workers: int = 4,
+    partitioner: TagPartitioner | None = None,
+) -> int:
+    """
+    Bulk-load a snapshot into an index, creating it with the snapshot's mapping if missing.
+
+    Refreshes are disabled and replicas dropped while loading, and bulk requests are sent from
+    several workers; both are restored once every document is indexed.
+
+    :param opensearch_client: The OpenSearch client
+    :param directory: The snapshot directory.
+    :param index_name: The target index; defaults to the exported index's name.
+    :param batch_size: Documents per bulk request.
+    :param workers: Number of concurrent bulk requests.
+    :param partitioner: Optional tag partitioner; documents are then loaded into the partition
+                        indexes of index_name, as ingestion writes them.
+    :return: The number of documents indexed
+    """
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    index_name = index_name or manifest["index"]
+    replicas = manifest["settings"].get("index.number_of_replicas", "1")
+    embedding_svc = EmbeddingService(
+        opensearch_client,
+        None,
+        index_name,
+        None,
+        embedding_dimensions=manifest["dimensions"],
+        partitioner=partitioner,
+    )
+    target_indexes = embedding_svc.index_names
+
+    bulk_settings = {"index.refresh_interval": "-1", "index.number_of_replicas": 0}
+    # Settings each index gets back once the load is over, whether it succeeded or not
+    restored_settings = {}
+    for target_index in target_indexes:
+        if opensearch_client.indices.exists(target_index):
+            current = opensearch_client.indices.get_settings(index=target_index, flat_settings=True)
+            current = current[target_index]["settings"]
+            restored_settings[target_index] = {
+                "index.refresh_interval": current.get("index.refresh_interval"),
+                "index.number_of_replicas": current.get("index.number_of_replicas", replicas),
+            }
+            opensearch_client.indices.put_settings(index=target_index, body=bulk_settings)
+            continue
+
+        logger.info(f"Creating {target_index} index from the snapshot mapping")
+        restored_settings[target_index] = {
+            "index.refresh_interval": None,
+            "index.number_of_replicas": replicas,
+        }
+        opensearch_client.indices.create(
+            target_index,
+            body={
+                "settings": {**manifest["settings"], **bulk_settings},
+                # Snapshots of older indexes lack fields added to the mapping since
+                "mappings": {
+                    **manifest["mappings"],
+                    "properties": {**DOCUMENT_PROPERTIES, **manifest["mappings"].get("properties", {})},
+                },
+            },
+        )
+
+    vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r")
+
+    def load(rows: list[dict], start: int) -> int:
+        embedding_svc.save_to_opensearch(
+            [
+                (document_from_source(row), np.asarray(vectors[start + i]))
+                for i, row in enumerate(rows)
+            ],
+            refresh=False,
+        )
+        return len(rows)
+
+    indexed, start, pending = 0, 0, set()
+    parquet = pq.ParquetFile(os.path.join(directory, DOCUMENTS_FILE))
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch in parquet.iter_batches(batch_size=batch_size):
+                rows = batch.to_pylist()
+                pending.add(executor.submit(load, rows, start))
+                start += len(rows)
+                # Keep a bounded number of batches in flight
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    indexed += sum(future.result() for future in done)
+            indexed += sum(future.result() for future in pending)
+    finally:
+        # A failed or interrupted load must not leave a live index without refreshes or replicas
+        for target_index, settings in restored_settings.items():
+            opensearch_client.indices.put_settings(index=target_index, body=settings)
+        opensearch_client.indices.refresh(index=",".join(target_indexes))
+    return indexed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export an index to a snapshot directory")
+    export_parser.add_argument("--output", required=True)
+    export_parser.add_argument("--index", default=os.environ.get("OPENSEARCH_INDEX_NAME"))
+    export_parser.add_argument("--batch-size", type=int, default=1000)
+
+    import_parser = subparsers.add_parser("import", help="Bulk-load a snapshot directory")
+    import_parser.add_argument("--input", required=True)
+    import_parser.add_argument("--index", help="Target index; defaults to the exported index")
+    import_parser.add_argument(
+        "--opensearch-url", help="Load into this URL (e.g. the docker-compose node) instead of OPENSEARCH_HOST"
+    )
+    import_parser.add_argument("--batch-size", type=int, default=500)
+    import_parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if getattr(args, "opensearch_url", None):
+        opensearch_client = OpenSearch(hosts=[args.opensearch_url], timeout=60)
+    else:
+        opensearch_client = get_opensearch_client(
+            opensearch_host=os.environ.get("OPENSEARCH_HOST"),
+            region=os.getenv("AWS_REGION", "us-east-1"),
+        )
+
+    # INDEX_PARTITIONING / INDEX_PARTITIONS_PATH, as set on the Lambdas
+    partitioner = initialize_partitioner()
+    start = time.perf_counter()
+    if args.command == "export":
+        manifest = export_snapshot(
+            opensearch_client, args.index, args.output, args.batch_size, partitioner
+        )
+        print(
+            f"Exported {manifest['count']} documents x {manifest['dimensions']} dims "
+            f"to {args.output} in {time.perf_counter() - start:.1f}s"
+        )
+        return
+
+    indexed = import_snapshot(
+        opensearch_client, args.input, args.index, args.batch_size, args.workers, partitioner
+    )
+    elapsed = time.perf_counter() - start
+    print(f"Imported {indexed} documents in {elapsed:.1f}s ({indexed / max(elapsed, 1e-9):.0f} docs/s)")
+
+
+if __name__ == "__main__":
+    main()
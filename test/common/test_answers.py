@@ -0,0 +1,79 @@
+from unittest.mock import MagicMock
+
+from opensearchpy import NotFoundError
+
+from common.answers import PrecomputedAnswerStore, index_fingerprint, normalize_query
+
+
+def test_normalize_query():
+    assert normalize_query("  How to read a CSV\tin pandas?  ") == "how to read a csv in pandas"
+
+
+def test_answer_store_keys_entries_by_normalized_query():
+    """
+    GIVEN a precomputed answer stored for a query
+    WHEN a differently spelled version of the query is looked up
+    THEN the same entry is fetched by ID
+    THEN unknown queries return None
+    """
+    opensearch_client = MagicMock()
+    store = PrecomputedAnswerStore(opensearch_client, "answers")
+
+    store.put("How to read a CSV?", "markdown", ["42"], "fingerprint")
+    stored = opensearch_client.index.call_args.kwargs
+    assert stored["body"]["query"] == "how to read a csv"
+    assert stored["body"]["hit_ids"] == ["42"]
+
+    opensearch_client.get.return_value = {"_source": stored["body"]}
+    assert store.get("how to read a csv") == stored["body"]
+    assert opensearch_client.get.call_args.kwargs["id"] == stored["id"]
+
+    opensearch_client.get.side_effect = NotFoundError(404, "not_found")
+    assert store.get("unknown") is None
+
+
+def test_only_current_answers_are_served():
+    """
+    GIVEN answers rendered against the current index, an older version of it, and another model
+    WHEN they are looked up for serving
+    THEN only the current answer is returned
+    THEN the index fingerprint is computed once and reused between lookups
+    """
+    opensearch_client = MagicMock()
+    opensearch_client.indices.get_settings.return_value = {
+        "docs": {"settings": {"index": {"uuid": "abc"}}}
+    }
+    opensearch_client.count.return_value = {"count": 10}
+    opensearch_client.search.return_value = {"hits": {"hits": [{"_seq_no": 41}]}}
+    current = index_fingerprint(opensearch_client, "docs")
+    opensearch_client.search.reset_mock()
+    store = PrecomputedAnswerStore(
+        opensearch_client, "answers", source_index_names=["docs"], model_id="titan"
+    )
+    entries = {
+        "current": {"fingerprint": current, "model_id": "titan"},
+        "reindexed": {"fingerprint": "old", "model_id": "titan"},
+        "migrated": {"fingerprint": current, "model_id": "cohere"},
+    }
+
+    served = {}
+    for query, entry in entries.items():
+        opensearch_client.get.return_value = {"_source": entry}
+        served[query] = store.get_current(query)
+
+    assert served == {"current": entries["current"], "reindexed": None, "migrated": None}
+    assert opensearch_client.search.call_count == 1
+
+
+def test_index_fingerprint_changes_with_index_writes():
+    opensearch_client = MagicMock()
+    opensearch_client.indices.get_settings.return_value = {
+        "docs": {"settings": {"index": {"uuid": "abc"}}}
+    }
+    opensearch_client.count.return_value = {"count": 10}
+    opensearch_client.search.return_value = {"hits": {"hits": [{"_seq_no": 41}]}}
+    before = index_fingerprint(opensearch_client, "docs")
+
+    opensearch_client.search.return_value = {"hits": {"hits": [{"_seq_no": 42}]}}
+
+    assert index_fingerprint(opensearch_client, "docs") != before
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from common.cache import SemanticCache
+
+
+@pytest.fixture
+def cache():
+    return SemanticCache(capacity=2, threshold=0.9)
+
+
+def test_lookup_returns_similar_entry(cache):
+    """
+    GIVEN a cached answer for a query embedding
+    WHEN a paraphrased query with a nearly identical embedding is looked up
+    THEN the cached answer is returned
+    """
+    cache.add([1.0, 0.0, 0.0], ["doc-1", "doc-2"], "cached answer")
+
+    result = cache.lookup([0.99, 0.05, 0.0])
+
+    assert result["markdown"] == "cached answer"
+    assert result["hit_ids"] == ["doc-1", "doc-2"]
+    assert result["similarity"] > 0.9
+
+
+def test_lookup_misses_dissimilar_entry(cache):
+    cache.add([1.0, 0.0, 0.0], ["doc-1"], "cached answer")
+
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    assert cache.stats() == {"size": 1, "hits": 0, "misses": 1, "hit_rate": 0.0}
+
+
+def test_evicts_least_recently_used(cache):
+    """
+    GIVEN a full cache
+    WHEN a new entry is added
+    THEN the entry that was used least recently is evicted
+    """
+    cache.add([1.0, 0.0, 0.0], ["a"], "answer a")
+    cache.add([0.0, 1.0, 0.0], ["b"], "answer b")
+    # Touch 'a' so that 'b' becomes the least recently used entry
+    assert cache.lookup([1.0, 0.0, 0.0])["markdown"] == "answer a"
+
+    cache.add([0.0, 0.0, 1.0], ["c"], "answer c")
+
+    assert len(cache) == 2
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    assert cache.lookup([1.0, 0.0, 0.0])["markdown"] == "answer a"
+    assert cache.lookup([0.0, 0.0, 1.0])["markdown"] == "answer c"
+    assert cache.stats()["hit_rate"] == 0.75
+
+
+def test_evicts_least_recently_used_after_growing():
+    """
+    GIVEN a cache filled past the initial size of its embedding matrix up to its capacity
+    WHEN a new entry is added
+    THEN the least recently used entry is evicted, including entries added after the matrix grew
+    """
+    capacity = 100
+    cache = SemanticCache(capacity=capacity, threshold=0.9)
+    one_hot = np.eye(capacity + 1)
+    for i in range(capacity):
+        cache.add(one_hot[i], [str(i)], f"answer {i}")
+    # Touch every entry but the one added last, which becomes the least recently used
+    for i in range(capacity - 1):
+        assert cache.lookup(one_hot[i])["markdown"] == f"answer {i}"
+
+    cache.add(one_hot[capacity], [str(capacity)], f"answer {capacity}")
+
+    assert len(cache) == capacity
+    assert cache.lookup(one_hot[capacity - 1]) is None
+    assert cache.lookup(one_hot[0])["markdown"] == "answer 0"
+    assert cache.lookup(one_hot[capacity])["markdown"] == f"answer {capacity}"
+
+
+def test_persist_and_reload(tmp_path):
+    path = str(tmp_path / "cache.npz")
+    cache = SemanticCache(capacity=10, threshold=0.9, path=path)
+    cache.add([1.0, 0.0], ["doc-1"], "persisted answer")
+    cache.persist()
+
+    reloaded = SemanticCache(capacity=10, threshold=0.9, path=path)
+
+    assert len(reloaded) == 1
+    assert reloaded.lookup([1.0, 0.01])["markdown"] == "persisted answer"
+
+
+def test_maybe_persist_batches_writes(tmp_path):
+    """
+    GIVEN a cache persisted every 2 additions
+    WHEN entries are added one by one
+    THEN the file is only written once 2 additions are pending
+    """
+    path = tmp_path / "cache.npz"
+    cache = SemanticCache(capacity=10, threshold=0.9, path=str(path), persist_every=2)
+
+    cache.add([1.0, 0.0], ["doc-1"], "answer 1")
+    assert not cache.maybe_persist()
+    assert not path.exists()
+
+    cache.add([0.0, 1.0], ["doc-2"], "answer 2")
+    assert cache.maybe_persist()
+    assert len(SemanticCache(capacity=10, path=str(path))) == 2
+    assert not cache.maybe_persist()
@@ -0,0 +1,299 @@
+import hashlib
+import json
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from opensearchpy import NotFoundError
+from opensearchpy.helpers import BulkIndexError
+
+from common.documents import StackOverflowDocument
+from common.embeddings import EmbeddingService
+from common.partitions import TagPartitioner
+from common.usage import BedrockUsage
+
+
+@pytest.fixture
+def opensearch_client():
+    client = MagicMock()
+    client.count.return_value = {"count": 0}
+    return client
+
+
+@pytest.fixture
+def embedding_svc(opensearch_client):
+    return EmbeddingService(opensearch_client, MagicMock(), "test-index", "test-model")
+
+
+def test_check_if_indexed_by_question_id(opensearch_client, embedding_svc):
+    """
+    GIVEN a document stored under its question ID
+    WHEN checking whether the same or changed content is indexed
+    THEN only unchanged content counts as indexed
+    """
+    content_hash = hashlib.sha256("content".encode()).hexdigest()
+    opensearch_client.get.return_value = {"_source": {"content_hash": content_hash}}
+
+    assert embedding_svc.check_if_indexed("content", "42")
+    assert not embedding_svc.check_if_indexed("changed content", "42")
+
+    opensearch_client.get.side_effect = NotFoundError(404, "not_found")
+    assert not embedding_svc.check_if_indexed("content", "43")
+
+
+def test_save_to_opensearch_stores_typed_fields(opensearch_client, embedding_svc):
+    """
+    GIVEN a structured document and a plain text document
+    WHEN they are saved to OpenSearch
+    THEN the structured one is keyed by question ID and stored with its typed fields
+    THEN the plain text one is keyed by its content hash
+    """
+    document = StackOverflowDocument(
+        title="Title", question_body="Body", answer_body="Answer",
+        question_id="42", tags=["python", "pandas"], score=12,
+    )
+    opensearch_client.bulk.return_value = {"errors": False, "items": []}
+    embedding_svc.save_to_opensearch(
+        [(document, np.array([0.1], dtype=np.float32)), ("other", [0.2])]
+    )
+
+    lines = opensearch_client.bulk.call_args[1]["body"].decode().splitlines()
+    actions, sources = [json.loads(line) for line in lines[::2]], [json.loads(line) for line in lines[1::2]]
+    assert actions[0] == {"index": {"_index": "test-index", "_id": "42"}}
+    assert sources[0]["embedding"] == pytest.approx([0.1])
+    assert sources[0]["tags"] == ["python", "pandas"]
+    assert sources[0]["score"] == 12
+    assert sources[0]["title_suggest"] == {"input": ["Title"], "weight": 12}
+    assert sources[0]["content_hash"] == hashlib.sha256(document.text.encode()).hexdigest()
+    assert actions[1]["index"]["_id"] == hashlib.sha256("other".encode()).hexdigest()
+
+
+def test_save_replaces_hash_keyed_documents(opensearch_client, embedding_svc):
+    """
+    GIVEN an existing index that still holds documents keyed by content hash
+    WHEN a structured document is saved
+    THEN its hash-keyed copy is deleted in the same bulk request
+    """
+    document = StackOverflowDocument(title="Title", question_body="Body", answer_body="Answer", question_id="42")
+    opensearch_client.indices.exists.return_value = True
+    opensearch_client.count.return_value = {"count": 3}
+    opensearch_client.bulk.return_value = {"errors": False, "items": []}
+
+    embedding_svc.save_to_opensearch([(document, [0.1])])
+
+    lines = [json.loads(line) for line in opensearch_client.bulk.call_args[1]["body"].decode().splitlines()]
+    content_hash = hashlib.sha256(document.text.encode()).hexdigest()
+    assert lines[0] == {"delete": {"_index": "test-index", "_id": content_hash}}
+    assert lines[1] == {"index": {"_index": "test-index", "_id": "42"}}
+
+
+def test_save_to_opensearch_raises_on_failed_documents(opensearch_client, embedding_svc):
+    """
+    GIVEN a bulk response reporting a failed document
+    WHEN documents are saved to OpenSearch
+    THEN a BulkIndexError with the failed items is raised
+    """
+    failed_item = {"index": {"_id": "42", "status": 400, "error": {"type": "mapper_parsing_exception"}}}
+    opensearch_client.bulk.return_value = {
+        "errors": True,
+        "items": [failed_item, {"index": {"_id": "43", "status": 201}}],
+    }
+
+    with pytest.raises(BulkIndexError) as error:
+        embedding_svc.save_to_opensearch([("text", [0.1]), ("more text", [0.2])])
+
+    assert error.value.errors == [failed_item]
+
+
+def test_generate_embedding_returns_float32_vector(embedding_svc):
+    """
+    GIVEN a Bedrock embedding response
+    WHEN an embedding is generated
+    THEN it is returned as a contiguous float32 vector
+    """
+    body = MagicMock()
+    body.read.return_value = json.dumps({"embedding": [0.1, 0.2, 0.3]}).encode()
+    embedding_svc._bedrock_client.invoke_model.return_value = {"body": body}
+
+    embedding = embedding_svc.generate_embedding("text")
+
+    assert embedding.dtype == np.float32
+    assert embedding.tolist() == pytest.approx([0.1, 0.2, 0.3])
+
+
+def test_generate_embedding_records_usage(embedding_svc):
+    """
+    GIVEN a Bedrock embedding response with a token count and invocation latency
+    WHEN an embedding is generated with a usage accumulator
+    THEN the tokens and model latency are recorded under the model and key
+    """
+    body = MagicMock()
+    body.read.return_value = json.dumps({"embedding": [0.1], "inputTextTokenCount": 42}).encode()
+    embedding_svc._bedrock_client.invoke_model.return_value = {
+        "body": body,
+        "ResponseMetadata": {"HTTPHeaders": {"x-amzn-bedrock-invocation-latency": "35"}},
+    }
+    usage = BedrockUsage()
+
+    embedding_svc.generate_embedding("text", usage=usage, key="7")
+
+    totals = usage.to_dict()["models"][embedding_svc.model_id]
+    assert totals["calls"] == 1
+    assert totals["input_tokens"] == 42
+    assert totals["bedrock_ms"] == 35.0
+    assert usage.to_dict()["largest_inputs"] == [{"key": "7", "input_tokens": 42}]
+
+
+def test_query_opensearch_with_filters(opensearch_client, embedding_svc):
+    opensearch_client.search.return_value = {"hits": {"hits": []}}
+
+    embedding_svc.query_opensearch(
+        [0.1, 0.2],
+        k=3,
+        filters={"tags": ["python"], "min_score": 10},
+        source_fields=["title", "answer_body"],
+    )
+
+    opensearch_client.search.assert_called_once_with(
+        index="test-index",
+        body={
+            "size": 3,
+            "query": {
+                "knn": {
+                    "embedding": {
+                        "vector": [0.1, 0.2],
+                        "k": 3,
+                        "filter": {
+                            "bool": {
+                                "filter": [
+                                    {"terms": {"tags": ["python"]}},
+                                    {"range": {"score": {"gte": 10}}},
+                                ]
+                            }
+                        },
+                    }
+                }
+            },
+            "_source": ["title", "answer_body"],
+        },
+    )
+
+
+def test_partitioned_save_and_query(opensearch_client):
+    """
+    GIVEN an embedding service with tag partitions
+    WHEN documents are saved and queries are run
+    THEN documents are written to the index of their tag's partition
+    THEN a copy left in another partition by a tag change is found and deleted in the same bulk
+    THEN a query mentioning a language only searches its partition
+    THEN an unclassified query, or a partition without matches, searches all partitions
+    """
+    embedding_svc = EmbeddingService(
+        opensearch_client,
+        MagicMock(),
+        "docs",
+        "test-model",
+        partitioner=TagPartitioner({"python": ["python"], "sql": ["sql"]}),
+    )
+    opensearch_client.indices.exists.return_value = True
+    opensearch_client.bulk.return_value = {"errors": False, "items": []}
+    python_document = StackOverflowDocument(
+        title="Read a csv", question_body="Body", answer_body="Answer", question_id="1", tags=["python"]
+    )
+
+    opensearch_client.mget.return_value = {
+        "docs": [
+            {"_index": "docs-python", "_id": "1", "found": False},
+            {"_index": "docs-sql", "_id": "1", "found": True, "_source": {"content_hash": "old"}},
+            {"_index": "docs-other", "_id": "1", "error": {"type": "index_not_found_exception"}},
+        ]
+    }
+    assert not embedding_svc.check_if_indexed(python_document.text, "1", ["python"])
+
+    embedding_svc.save_to_opensearch([(python_document, [0.1]), ("plain text", [0.2])])
+
+    actions = [
+        json.loads(line)
+        for line in opensearch_client.bulk.call_args.kwargs["body"].decode().splitlines()
+        if "embedding" not in line
+    ]
+    assert actions == [
+        {"delete": {"_index": "docs-sql", "_id": "1"}},
+        {"index": {"_index": "docs-python", "_id": "1"}},
+        {"index": {"_index": "docs-other", "_id": hashlib.sha256(b"plain text").hexdigest()}},
+    ]
+    assert embedding_svc.index_names == ["docs-python", "docs-sql", "docs-other"]
+
+    # Saving a document without a moved copy adds no deletes
+    embedding_svc.save_to_opensearch([(python_document, [0.1])])
+    assert b"delete" not in opensearch_client.bulk.call_args.kwargs["body"]
+
+    hit = {"_id": "1", "_score": 1.0, "_source": {}}
+    opensearch_client.search.return_value = {"hits": {"hits": [hit]}}
+    assert embedding_svc.query_opensearch([0.1], query_text="python read csv") == [hit]
+    assert opensearch_client.search.call_args.kwargs["index"] == "docs-python"
+
+    embedding_svc.query_opensearch([0.1], query_text="read a file")
+    assert opensearch_client.search.call_args.kwargs["index"] == "docs-python,docs-sql,docs-other"
+
+    opensearch_client.search.side_effect = [{"hits": {"hits": []}}, {"hits": {"hits": [hit]}}]
+    assert embedding_svc.query_opensearch([0.1], filters={"tags": ["sql"]}) == [hit]
+    assert [c.kwargs["index"] for c in opensearch_client.search.call_args_list[-2:]] == [
+        "docs-sql",
+        "docs-python,docs-sql,docs-other",
+    ]
+
+
+def test_suggest_titles(opensearch_client, embedding_svc):
+    opensearch_client.search.return_value = {
+        "suggest": {
+            "titles": [
+                {
+                    "text": "read c",
+                    "options": [
+                        {
+                            "text": "Read csv in pandas",
+                            "_score": 12.0,
+                            "_source": {"question_id": "42", "title": "Read csv in pandas"},
+                        }
+                    ],
+                }
+            ]
+        }
+    }
+
+    suggestions = embedding_svc.suggest_titles("read c", size=3)
+
+    assert suggestions == [{"question_id": "42", "title": "Read csv in pandas", "score": 12.0}]
+    body = opensearch_client.search.call_args.kwargs["body"]
+    assert body["size"] == 0
+    assert body["_source"] == ["question_id", "title"]
+    completion = body["suggest"]["titles"]
+    assert completion == {
+        "prefix": "read c",
+        "completion": {"field": "title_suggest", "size": 3, "skip_duplicates": True},
+    }
+
+
+def test_faiss_ef_search_in_method_and_per_query(opensearch_client):
+    """
+    GIVEN HNSW parameters including ef_search
+    WHEN the index is created and queried with an ef_search override
+    THEN ef_search is a faiss method parameter, not the nmslib-only index setting
+    THEN the override is sent with the kNN query
+    """
+    opensearch_client.indices.exists.return_value = False
+    opensearch_client.search.return_value = {"hits": {"hits": []}}
+    embedding_svc = EmbeddingService(
+        opensearch_client, MagicMock(), "test-index", "test-model",
+        knn_parameters={"m": 16, "ef_construction": 128, "ef_search": 100},
+    )
+
+    embedding_svc.query_opensearch([0.1], k=3, ef_search=256)
+
+    body = opensearch_client.indices.create.call_args[1]["body"]
+    assert body["settings"] == {"index.knn": True}
+    method = body["mappings"]["properties"]["embedding"]["method"]
+    assert method["parameters"] == {"m": 16, "ef_construction": 128, "ef_search": 100}
+    knn_query = opensearch_client.search.call_args[1]["body"]["query"]["knn"]["embedding"]
+    assert knn_query["method_parameters"] == {"ef_search": 256}
@@ -0,0 +1,47 @@
+from common.partitions import TagPartitioner
+
+
+def test_documents_are_routed_by_tags():
+    partitioner = TagPartitioner({"python": ["python", "pandas"], "sql": ["sql", "mysql"]})
+
+    assert partitioner.partitions == ["python", "sql", "other"]
+    assert partitioner.partition_for_tags(["mysql", "python"]) == "python"
+    assert partitioner.partition_for_tags(["MySQL"]) == "sql"
+    assert partitioner.partition_for_tags(["haskell"]) == "other"
+    assert partitioner.partition_for_tags([]) == "other"
+    assert partitioner.partitions_for_tags(["pandas", "sql"]) == ["python", "sql"]
+    assert partitioner.partitions_for_tags(["pandas", "haskell"]) is None
+
+
+def test_queries_are_classified_by_keywords():
+    """
+    GIVEN the default partitions
+    WHEN queries mention one language, several, or none
+    THEN only a single mentioned language narrows the search
+    """
+    partitioner = TagPartitioner()
+
+    assert partitioner.classify("How to read a csv with pandas?") == ["python"]
+    assert partitioner.classify("node.js stream backpressure") == ["javascript"]
+    assert partitioner.classify("Call a java library from javascript") is None
+    assert partitioner.classify("c# async await deadlock") == ["csharp"]
+    assert partitioner.classify("convert python list to sql query") is None
+    assert partitioner.classify("how to reverse a linked list") is None
+    assert partitioner.classify("what is plan c for a failed deploy") is None
+    assert TagPartitioner().partition_for_tags(["c"]) == "cpp"
+
+
+def test_queries_are_classified_by_nearest_centroid():
+    """
+    GIVEN partition centroids
+    WHEN a query without keywords is close to one centroid, or equally close to two
+    THEN only the clear winner narrows the search
+    """
+    partitioner = TagPartitioner(
+        {"python": ["python"], "sql": ["sql"]},
+        centroids={"python": [1.0, 0.0], "sql": [0.0, 1.0]},
+    )
+
+    assert partitioner.classify("read a csv file", [0.9, 0.1]) == ["python"]
+    assert partitioner.classify("read a csv file", [0.5, 0.5]) is None
+    assert partitioner.classify("read a csv file", [-1.0, -1.0]) is None
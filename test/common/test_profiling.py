@@ -0,0 +1,98 @@
+import json
+import marshal
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from common.profiling import S3ProfileSink, profile_handler, profile_section
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv("PROFILE_MODE", raising=False)
+    monkeypatch.setenv("PROFILE_SINK", str(tmp_path))
+    return tmp_path
+
+
+def busy_handler(event, context):
+    with profile_section("work"):
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+    return {"statusCode": 200}
+
+
+def test_unflagged_invocations_are_not_profiled(profile_dir):
+    """
+    GIVEN a profiled handler and no PROFILE_MODE
+    WHEN it is invoked without a profile flag
+    THEN it runs as is and no profile is written
+    """
+    handler = profile_handler("query")(busy_handler)
+
+    assert handler({"query": "pandas"}, None) == {"statusCode": 200}
+    assert not list(profile_dir.rglob("*"))
+
+
+def test_event_flag_writes_collapsed_stacks_and_sections(profile_dir):
+    """
+    GIVEN a profiled handler
+    WHEN it is invoked with "profile": true
+    THEN the sampled stacks are written in collapsed format, including the handler frame
+    THEN the timed sections are written next to them
+    """
+    context = MagicMock(aws_request_id="req-1")
+    handler = profile_handler("ingestion")(busy_handler)
+
+    assert handler({"profile": True}, context) == {"statusCode": 200}
+
+    [collapsed] = (profile_dir / "ingestion").glob("*-req-1.collapsed")
+    lines = collapsed.read_text().splitlines()
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("busy_handler" in line for line in lines)
+
+    [sections] = (profile_dir / "ingestion").glob("*-req-1.sections.json")
+    summary = json.loads(sections.read_text())
+    assert summary["mode"] == "sample"
+    assert summary["sections"]["work"]["count"] == 1
+    assert summary["sections"]["work"]["total_ms"] >= 50
+
+
+def test_cprofile_mode_from_env_writes_pstats(profile_dir, monkeypatch):
+    """
+    GIVEN PROFILE_MODE=cprofile
+    WHEN the handler raises
+    THEN the error is propagated and pstats data of the invocation is still written
+    """
+    monkeypatch.setenv("PROFILE_MODE", "cprofile")
+
+    def failing_handler(event, context):
+        busy_handler(event, context)
+        raise ValueError("boom")
+
+    handler = profile_handler("query")(failing_handler)
+
+    with pytest.raises(ValueError):
+        handler({}, None)
+
+    [pstats_file] = (profile_dir / "query").glob("*-local.pstats")
+    stats = marshal.loads(pstats_file.read_bytes())
+    assert any(function == "busy_handler" for _, _, function in stats)
+
+
+def test_s3_sink_writes_under_prefix():
+    """
+    GIVEN an S3 sink with a prefix
+    WHEN a profile is written
+    THEN it is put under the prefix and its S3 URI is returned
+    """
+    s3_client = MagicMock()
+    sink = S3ProfileSink(s3_client, "bucket", "/profiles/")
+
+    location = sink.write("query/1.collapsed", b"main 1\n")
+
+    s3_client.put_object.assert_called_once_with(
+        Bucket="bucket", Key="profiles/query/1.collapsed", Body=b"main 1\n"
+    )
+    assert location == "s3://bucket/profiles/query/1.collapsed"
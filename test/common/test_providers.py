@@ -0,0 +1,96 @@
+import json
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from common.embeddings import EmbeddingService
+from common.providers import (
+    CohereEmbeddingProvider,
+    SEARCH_QUERY,
+    LocalEmbeddingProvider,
+    TitanEmbeddingProvider,
+    pack_batches,
+)
+from common.usage import BedrockUsage
+
+
+def test_pack_batches_respects_count_and_size_limits():
+    texts = ["a" * 10, "b" * 10, "c" * 10, "d" * 25, "e" * 5]
+
+    assert pack_batches(texts, max_count=2) == [[0, 1], [2, 3], [4]]
+    assert pack_batches(texts, max_count=10, max_chars=20) == [[0, 1], [2], [3], [4]]
+
+
+def test_cohere_provider_embeds_many_texts_per_request():
+    """
+    GIVEN the batched Cohere provider
+    WHEN more texts are embedded than fit in one request
+    THEN they are sent in as few requests as the limits allow, and returned in order
+    THEN long texts are clipped to the model's per-text limit
+    THEN texts are embedded as documents unless queries are asked for
+    """
+    bedrock_client = MagicMock()
+
+    def invoke_model(body, **kwargs):
+        texts = json.loads(body)["texts"]
+        response_body = MagicMock()
+        response_body.read.return_value = json.dumps(
+            {"embeddings": {"float": [[float(text.split()[0]), 0.0] for text in texts]}}
+        ).encode()
+        return {
+            "body": response_body,
+            "ResponseMetadata": {"HTTPHeaders": {"x-amzn-bedrock-input-token-count": "50"}},
+        }
+
+    bedrock_client.invoke_model.side_effect = invoke_model
+    provider = CohereEmbeddingProvider(bedrock_client, dimensions=2)
+    texts = [f"{i} " + "x" * 3000 for i in range(200)]
+    usage = BedrockUsage()
+
+    embeddings = provider.embed_batch(texts, usage)
+
+    assert bedrock_client.invoke_model.call_count == 3
+    assert embeddings.dtype == np.float32
+    assert embeddings[:, 0].tolist() == list(range(200))
+    first_request = json.loads(bedrock_client.invoke_model.call_args_list[0].kwargs["body"])
+    assert len(first_request["texts"]) == 96
+    assert len(first_request["texts"][0]) == 2048
+    assert usage.to_dict()["models"]["cohere.embed-english-v3"]["input_tokens"] == 150
+    assert first_request["input_type"] == "search_document"
+
+    provider.embed_batch(["1 query"], input_type=SEARCH_QUERY)
+    assert json.loads(bedrock_client.invoke_model.call_args.kwargs["body"])["input_type"] == "search_query"
+
+
+
+def test_providers_build_single_text_requests():
+    """
+    GIVEN the Titan and Cohere providers
+    WHEN the request of one text is built, e.g. for batch inference input
+    THEN both take a single text, and only Titan supports batch inference
+    """
+    titan = TitanEmbeddingProvider(MagicMock(), "amazon.titan-embed-text-v2:0", dimensions=256)
+    cohere = CohereEmbeddingProvider(MagicMock())
+
+    assert titan.build_request("hello") == {"inputText": "hello", "dimensions": 256, "normalize": True}
+    assert cohere.build_request("hello") == {
+        "texts": ["hello"],
+        "input_type": "search_document",
+        "truncate": "END",
+    }
+    embedding_svc = EmbeddingService(MagicMock(), MagicMock(), "docs", cohere.model_id, provider=cohere)
+    assert embedding_svc.build_embedding_request("hello")["texts"] == ["hello"]
+    assert titan.supports_batch_inference
+    assert not embedding_svc.supports_batch_inference
+
+
+def test_local_provider_is_deterministic():
+    provider = LocalEmbeddingProvider(dimensions=8)
+
+    first = provider.embed_batch(["pandas read csv", "git rebase"])
+    second = provider.embed_batch(["pandas read csv"])
+
+    assert first.shape == (2, 8)
+    assert np.array_equal(first[0], second[0])
+    assert np.linalg.norm(first[1]) == pytest.approx(1.0)
@@ -0,0 +1,35 @@
+from common.rerank import maximal_marginal_relevance, rerank_hits, score_gap_cutoff
+
+
+def test_score_gap_cutoff():
+    assert score_gap_cutoff([0.9, 0.88, 0.85, 0.5, 0.49], max_gap=0.1) == 3
+    assert score_gap_cutoff([0.9, 0.88, 0.85], max_gap=0.1) == 3
+    assert score_gap_cutoff([], max_gap=0.1) == 0
+
+
+def test_mmr_prefers_diverse_documents():
+    """
+    GIVEN two near-identical documents and a third, different one
+    WHEN reranking with MMR
+    THEN the second pick is the different document rather than the duplicate
+    """
+    query = [1.0, 0.0, 0.0]
+    docs = [[0.9, 0.1, 0.0], [0.9, 0.11, 0.0], [0.7, 0.0, 0.7]]
+
+    assert maximal_marginal_relevance(query, docs, k=2, diversity=0.5) == [0, 2]
+    assert maximal_marginal_relevance(query, docs, k=2, diversity=0.0) == [0, 1]
+
+
+def test_mmr_drops_duplicates():
+    query = [1.0, 0.0]
+    docs = [[1.0, 0.0], [1.0, 0.001], [0.0, 1.0]]
+
+    assert maximal_marginal_relevance(
+        query, docs, k=3, diversity=0.0, duplicate_threshold=0.99
+    ) == [0, 2]
+
+
+def test_rerank_hits_without_embeddings_falls_back_to_score_order():
+    hits = [{"_id": i, "_score": 1.0, "_source": {"text": "t"}} for i in range(5)]
+
+    assert rerank_hits([1.0, 0.0], hits, k=2) == hits[:2]
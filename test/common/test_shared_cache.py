@@ -0,0 +1,158 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+from botocore.exceptions import ClientError
+
+from common.shared_cache import (
+    DynamoDbCacheBackend,
+    LocalCacheBackend,
+    RedisCacheBackend,
+    SharedCache,
+)
+
+
+def test_concurrent_identical_requests_are_coalesced():
+    """
+    GIVEN a shared cache
+    WHEN identical requests arrive while the first one is still being computed
+    THEN the response is computed once and every request gets it
+    """
+    cache = SharedCache(LocalCacheBackend(), poll_interval=0.01)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"statusCode": 200, "body": '{"markdown": "answer"}'}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute("q", compute)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"statusCode": 200, "body": '{"markdown": "answer"}'}] * 5
+
+
+def test_no_match_responses_are_cached_and_errors_are_not():
+    """
+    GIVEN a shared cache with a short negative TTL
+    WHEN a request has no matches, or fails
+    THEN the no-match response is reused until it expires, and the failure is not cached
+    """
+    cache = SharedCache(LocalCacheBackend(), negative_ttl=0.05)
+    not_found = MagicMock(return_value={"statusCode": 404, "body": "{}"})
+    failed = MagicMock(return_value={"statusCode": 500, "body": "{}"})
+
+    cache.get_or_compute("none", not_found)
+    cache.get_or_compute("none", not_found)
+    assert not_found.call_count == 1
+    time.sleep(0.06)
+    cache.get_or_compute("none", not_found)
+    assert not_found.call_count == 2
+
+    cache.get_or_compute("broken", failed)
+    cache.get_or_compute("broken", failed)
+    assert failed.call_count == 2
+
+
+def test_unavailable_backend_computes_without_cache():
+    backend = MagicMock()
+    backend.get.side_effect = ConnectionError("cache is down")
+    cache = SharedCache(backend)
+
+    response = cache.get_or_compute("q", lambda: {"statusCode": 200, "body": "{}"})
+
+    assert response == {"statusCode": 200, "body": "{}"}
+
+
+def test_dynamodb_backend_lock_is_conditional():
+    """
+    GIVEN a DynamoDB backend
+    WHEN a lock is taken that another request holds
+    THEN the conditional put fails and the lock is reported as not taken
+    """
+    dynamodb_client = MagicMock()
+    dynamodb_client.put_item.side_effect = ClientError(
+        {"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem"
+    )
+    backend = DynamoDbCacheBackend(dynamodb_client, "cache")
+
+    assert backend.add("q:lock", {"owner": "a"}, 30) is False
+    kwargs = dynamodb_client.put_item.call_args.kwargs
+    assert kwargs["ConditionExpression"].startswith("attribute_not_exists(cache_key)")
+    assert kwargs["Item"]["cache_key"] == {"S": "q:lock"}
+
+
+def test_waiters_share_a_failed_computation():
+    """
+    GIVEN a shared cache
+    WHEN identical requests wait on a computation that fails
+    THEN the failure is computed once and every waiting request gets it
+    THEN a later request computes the response again
+    """
+    cache = SharedCache(LocalCacheBackend(), poll_interval=0.01)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"statusCode": 500, "body": "{}"}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute("q", compute)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"statusCode": 500, "body": "{}"}] * 5
+
+    cache.get_or_compute("q", compute)
+    assert len(calls) == 2
+
+
+def test_expired_lock_is_not_released_by_its_former_owner():
+    """
+    GIVEN a request whose lock expired while it was computing, and was taken by another request
+    WHEN the first request finishes
+    THEN the other request's lock is left in place
+    """
+    backend = LocalCacheBackend()
+    cache = SharedCache(backend, lock_ttl=0.05)
+
+    def compute():
+        time.sleep(0.06)
+        assert backend.add("q:lock", {"owner": "other"}, 30)
+        return {"statusCode": 200, "body": "{}"}
+
+    cache.get_or_compute("q", compute)
+
+    assert backend.get("q:lock") == {"owner": "other"}
+
+
+def test_remote_backends_release_only_their_own_lock():
+    redis_client = MagicMock()
+    RedisCacheBackend(redis_client).delete_if("q:lock", {"owner": "a"})
+    script, keys, key, value = redis_client.eval.call_args.args
+    assert (keys, key, value) == (1, "codequest:q:lock", '{"owner": "a"}')
+    assert "redis.call('get', KEYS[1]) == ARGV[1]" in script
+
+    dynamodb_client = MagicMock()
+    dynamodb_client.delete_item.side_effect = ClientError(
+        {"Error": {"Code": "ConditionalCheckFailedException"}}, "DeleteItem"
+    )
+    DynamoDbCacheBackend(dynamodb_client, "cache").delete_if("q:lock", {"owner": "a"})
+    kwargs = dynamodb_client.delete_item.call_args.kwargs
+    assert kwargs["ConditionExpression"] == "#v = :value"
+    assert kwargs["ExpressionAttributeValues"] == {":value": {"S": '{"owner": "a"}'}}
@@ -0,0 +1,31 @@
+from common.usage import BedrockUsage
+
+
+def test_usage_totals_per_model_and_largest_inputs():
+    """
+    GIVEN Bedrock calls recorded for two models
+    WHEN the usage is summarized
+    THEN tokens, model latency and our own overhead are totalled per model
+    THEN only the largest keyed inputs are kept, largest first
+    """
+    usage = BedrockUsage(top_n=2)
+    usage.add("titan", input_tokens=10, bedrock_ms=20, elapsed_ms=25, key="1")
+    usage.add("titan", input_tokens=300, bedrock_ms=40, elapsed_ms=41, key="2")
+    usage.add("titan", input_tokens=50, key="3")
+    usage.add("haiku", input_tokens=900, output_tokens=120, bedrock_ms=800, elapsed_ms=850)
+
+    summary = usage.to_dict()
+
+    assert summary["models"]["titan"] == {
+        "calls": 3,
+        "input_tokens": 360,
+        "output_tokens": 0,
+        "bedrock_ms": 60.0,
+        "overhead_ms": 6.0,
+    }
+    assert summary["models"]["haiku"]["output_tokens"] == 120
+    assert summary["models"]["haiku"]["overhead_ms"] == 50.0
+    assert summary["largest_inputs"] == [
+        {"key": "2", "input_tokens": 300},
+        {"key": "3", "input_tokens": 50},
+    ]
@@ -0,0 +1,163 @@
+import json
+from unittest.mock import MagicMock
+
+import pandas as pd
+import pytest
+
+from common.embeddings import EmbeddingService
+from ingestion.backfill import BackfillHandler, LocalBatchJobRunner, LocalStorage, S3Storage
+from ingestion.retrievers import StackOverflowDataRetriever
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(str(tmp_path))
+
+
+@pytest.fixture
+def embedding_svc():
+    embedding_svc = MagicMock(spec=EmbeddingService)
+    embedding_svc.supports_batch_inference = True
+    embedding_svc.index_names = ["test-index"]
+    embedding_svc.build_embedding_request.side_effect = lambda text: {
+        "inputText": text,
+        "dimensions": 3,
+        "normalize": True,
+    }
+    return embedding_svc
+
+
+@pytest.fixture
+def data_retriever():
+    retriever = MagicMock(spec=StackOverflowDataRetriever)
+
+    def get_dataframe(limit, offset):
+        rows = [
+            {
+                "question_id": i,
+                "question_title": f"Title{i}",
+                "question_body": f"Body{i}",
+                "accepted_answer_body": f"Answer{i}",
+            }
+            for i in range(offset, min(offset + limit, 5))
+        ]
+        return pd.DataFrame(rows)
+
+    retriever.get_dataframe.side_effect = get_dataframe
+    return retriever
+
+
+def fake_embed(model_input):
+    if model_input["inputText"].startswith("Title: Title3\n"):
+        raise ValueError("Input too long")
+    return [0.1, 0.2, 0.3]
+
+
+def test_backfill_submit_and_load(embedding_svc, data_retriever, storage):
+    """
+    GIVEN five rows to backfill, split into batch jobs of two records
+    WHEN the backfill is submitted
+    THEN one JSONL batch input file and job is created per two records
+    WHEN the completed output is loaded
+    THEN embeddings are joined back to their documents by record ID and indexed
+    THEN records with an error or missing from the output are reported as failed and queued for retry
+    THEN the index is refreshed once after the last bulk request
+    """
+    retry_queue = MagicMock()
+    handler = BackfillHandler(
+        embedding_svc,
+        data_retriever,
+        storage,
+        LocalBatchJobRunner(storage, fake_embed),
+        retry_queue,
+    )
+
+    response = handler.handle(
+        {"action": "submit", "number_of_records": "10", "batch_size": "3", "records_per_job": "2"}
+    )
+    submitted = json.loads(response["body"])
+
+    assert response["statusCode"] == 202
+    assert submitted["records"] == 5
+    assert len(submitted["job_ids"]) == 3
+    first_input = storage.read(f"backfill/{submitted['run_id']}/input/part-00000.jsonl")
+    assert json.loads(first_input.decode().splitlines()[0]) == {
+        "recordId": "0",
+        "modelInput": {"inputText": "Title: Title0\nBody: Body0\nAccepted Answer: Answer0", "dimensions": 3, "normalize": True},
+    }
+
+    # The last job wrote no output record for its only document
+    last_output = storage.list(f"backfill/{submitted['run_id']}/output/")[-1]
+    storage.write(last_output, b"")
+
+    response = handler.handle({"action": "load", "run_id": submitted["run_id"], "batch_size": "2"})
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"]) == {"status": "Completed", "results": 3, "failed": 2}
+    indexed = [
+        document.question_id
+        for call in embedding_svc.save_to_opensearch.call_args_list
+        for document, _ in call[0][0]
+    ]
+    assert sorted(indexed) == ["0", "1", "2"]
+    assert all(
+        call.kwargs == {"refresh": False}
+        for call in embedding_svc.save_to_opensearch.call_args_list
+    )
+    embedding_svc.opensearch_client.indices.refresh.assert_called_once_with(index="test-index")
+    retried = [
+        record["question_id"] for call in retry_queue.put.call_args_list for record in call[0][0]
+    ]
+    assert sorted(retried) == ["3", "4"]
+
+
+def test_backfill_load_waits_for_running_jobs(embedding_svc, data_retriever, storage):
+    job_runner = MagicMock()
+    job_runner.submit.return_value = "job-arn"
+    job_runner.status.return_value = "InProgress"
+    handler = BackfillHandler(embedding_svc, data_retriever, storage, job_runner)
+
+    run_id = handler.submit(number_of_records=2)["run_id"]
+    response = handler.handle({"action": "load", "run_id": run_id})
+
+    assert response["statusCode"] == 202
+    assert json.loads(response["body"])["status"] == "InProgress"
+    embedding_svc.save_to_opensearch.assert_not_called()
+
+
+def test_backfill_refuses_providers_without_batch_inference(embedding_svc, data_retriever, storage):
+    """
+    GIVEN an embedding provider that Bedrock batch inference does not support
+    WHEN a backfill is submitted
+    THEN it is refused without fetching rows or submitting jobs
+    """
+    embedding_svc.supports_batch_inference = False
+    embedding_svc.model_id = "cohere.embed-english-v3"
+    job_runner = MagicMock()
+    handler = BackfillHandler(embedding_svc, data_retriever, storage, job_runner)
+
+    response = handler.handle({"action": "submit", "number_of_records": "10"})
+
+    assert response["statusCode"] == 400
+    assert "cohere.embed-english-v3" in json.loads(response["body"])["error"]
+    with pytest.raises(ValueError):
+        handler.submit(number_of_records=10)
+    data_retriever.get_dataframe.assert_not_called()
+    job_runner.submit.assert_not_called()
+
+
+def test_s3_storage_streams_lines():
+    """
+    GIVEN an S3 object with JSON Lines
+    WHEN its lines are read
+    THEN they are streamed from the body instead of read whole, skipping blank lines
+    """
+    s3_client = MagicMock()
+    body = MagicMock()
+    body.iter_lines.return_value = iter([b'{"a": 1}', b"", b'{"a": 2}'])
+    s3_client.get_object.return_value = {"Body": body}
+
+    lines = list(S3Storage(s3_client, "bucket").read_lines("output/part-00000.jsonl.out"))
+
+    assert lines == [b'{"a": 1}', b'{"a": 2}']
+    body.read.assert_not_called()
@@ -1,10 +1,13 @@
 import json
 import re
 from unittest.mock import MagicMock, call
+import pandas as pd
 import pytest
 from common.embeddings import EmbeddingService
 from ingestion.handler import IngestionHandler
 from ingestion.retrievers import StackOverflowDataRetriever
+from ingestion.retry_queue import FileRetryQueue
+from ingestion.watermark import WatermarkStore
 from botocore.exceptions import ClientError
 
 
@@ -19,8 +22,14 @@ def embedding_svc():
 
     # Mock the generate_embedding method
     embedding_svc.generate_embedding.return_value = [0.1, 0.2, 0.3]
+    # Titan embeds one text per request; batches embed each text with generate_embedding
+    embedding_svc.batch_limits = (1, None)
+    embedding_svc.embed_batch.side_effect = lambda texts, usage=None, keys=None: [
+        embedding_svc.generate_embedding(text=text, usage=usage, key=key)
+        for text, key in zip(texts, keys or [None] * len(texts))
+    ]
 
-    def exsists_side_effect(doc: str):
+    def exsists_side_effect(doc: str, document_id=None, tags=None):
         title_search = re.search("Title(\d+)", doc, re.IGNORECASE)
         return int(title_search.group(1)) % 2 == 0
 
@@ -31,31 +40,18 @@ def embedding_svc():
 @pytest.fixture
 def data_retriever():
     retriever = MagicMock(spec=StackOverflowDataRetriever)
-    mock_dataframe = MagicMock()
-    index = 0
-    batch_size = 1
-
-    def side_effect():
-        result = [
-            (
-                index + i,
-                {
-                    "question_title": f"Title{index + 1 + i}",
-                    "question_body": f"Body{index + 1 + i}",
-                    "accepted_answer_body": f"Answer{index + 1 + i}",
-                },
-            )
-            for i in range(batch_size)
-        ]
-        return result
-
-    mock_dataframe.iterrows.side_effect = side_effect
 
     def get_dataframe_side_effect(limit, offset):
-        nonlocal batch_size, index
-        batch_size = limit
-        index = offset
-        return mock_dataframe
+        return pd.DataFrame(
+            [
+                {
+                    "question_title": f"Title{offset + 1 + i}",
+                    "question_body": f"Body{offset + 1 + i}",
+                    "accepted_answer_body": f"Answer{offset + 1 + i}",
+                }
+                for i in range(limit)
+            ]
+        )
 
     retriever.get_dataframe.side_effect = get_dataframe_side_effect
     return retriever
@@ -67,43 +63,54 @@ def test_ingestion_happy(embedding_svc, data_retriever, handler):
     Retrieves data from bigQuery.
     THEN Generates embeddings for each row.
     THEN Calls save_to_elasticsearch with the correct documents.
+    THEN Fetching stops shortly after enough documents were admitted.
     """
 
-    test_event = {"number_of_records": "10", "batch_size": "2", "records_offset": "4"}
+    queue_size = 2
+    test_event = {
+        "number_of_records": "10",
+        "batch_size": "2",
+        "records_offset": "4",
+        "queue_size": str(queue_size),
+    }
     response = handler.handle(event=test_event, context=None)
-    assert response == {"statusCode": 200, "body": json.dumps({"results": 10})}
-
-    # calls to fetch dataframes with limits and offsets
-    assert data_retriever.get_dataframe.call_args_list == [
-        call(2, 4),
-        call(2, 6),
-        call(2, 8),
-        call(2, 10),
-        call(2, 12),
-        call(2, 14),
-        call(2, 16),
-        call(2, 18),
-        call(2, 20),
-        call(2, 22),
-    ]
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["results"] == 10
 
-    # The generate_embedding method should have been called once per each doc being indexed
-    # save_to_elasticsearch method should have been called exactly once
-    assert embedding_svc.generate_embedding.call_count == 10
-    # 10 batches (since batch size is 2 and number of records is 10 and 1 record in each batch is already written) should be saved to the DB
-    assert embedding_svc.save_to_opensearch.call_count == 10
+    # calls to fetch dataframes with limits and consecutive offsets
+    calls = data_retriever.get_dataframe.call_args_list
+    assert calls == [call(2, 4 + 2 * i) for i in range(len(calls))]
 
-    call_args = embedding_svc.save_to_opensearch.call_args_list
+    # Each page of two rows has one document to index, so ten pages are needed. Fetching runs
+    # ahead by at most the pages buffered in the pipeline: a full queue of pages, the page being
+    # normalized, the page waiting to be queued, and the pages whose documents fill the queue into
+    # the dedupe stage and its four workers.
+    target_pages = 10
+    buffered_pages = queue_size + 1 + 1 + (queue_size + 4) // 2
+    assert len(calls) <= target_pages + buffered_pages
 
-    for i in range(10):
+    # Only documents not yet indexed (odd titles) are embedded and saved, up to the target,
+    # even when fetching ran ahead
+    assert embedding_svc.generate_embedding.call_count == 10
+    saved = [
+        document
+        for save_call in embedding_svc.save_to_opensearch.call_args_list
+        for document in save_call[0][0]
+    ]
+    assert len(saved) == 10
+    assert {document.title for document, _ in saved} <= {
+        f"Title{2*i + 5}" for i in range(len(calls))
+    }
+    for document, embedding in saved:
+        number = document.title[len("Title") :]
         assert (
-            call_args[i][0][0][0][0]
+            document.text
             == f"""\
-Title: Title{2*i + 5}
-Body: Body{2*i + 5}
-Accepted Answer: Answer{2*i + 5}"""
+Title: Title{number}
+Body: Body{number}
+Accepted Answer: Answer{number}"""
         )
-        assert call_args[i][0][0][0][1] == [0.1, 0.2, 0.3]
+        assert embedding == [0.1, 0.2, 0.3]
 
 
 def test_ingestion_embedding_failures(embedding_svc, data_retriever, handler):
@@ -125,10 +132,243 @@ def test_ingestion_embedding_failures(embedding_svc, data_retriever, handler):
 
     test_event = {"number_of_records": "10", "batch_size": "10", "records_offset": "0"}
     response = handler.handle(event=test_event, context=None)
-    # half of the items had successful embeddings generated for them, so we should be able to save that half
-    assert response == {"statusCode": 200, "body": json.dumps({"results": 10})}
+    # half of the items had successful embeddings generated for them, so fetching continues
+    # until exactly enough documents were indexed
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["results"] == 10
 
-    assert data_retriever.get_dataframe.call_args_list == [
+    assert data_retriever.get_dataframe.call_args_list[:2] == [
         call(10, 0),
         call(10, 10),
     ]
+
+
+def test_incremental_ingestion_advances_watermark(embedding_svc, data_retriever):
+    """
+    GIVEN a persisted watermark
+    WHEN an incremental ingestion run is triggered
+    THEN only rows past the watermark are fetched, keyed by question ID
+    THEN the watermark is advanced to the last processed row
+    """
+    watermark_store = MagicMock(spec=WatermarkStore)
+    watermark_store.get.return_value = {
+        "last_activity_date": "2024-01-01T00:00:00+00:00",
+        "question_id": 10,
+    }
+    embedding_svc.check_if_indexed.side_effect = lambda *args: False
+    delta = pd.DataFrame(
+        [
+            {
+                "question_id": 11 + i,
+                "question_title": f"Title{11 + i}",
+                "question_body": f"Body{11 + i}",
+                "accepted_answer_body": f"Answer{11 + i}",
+                "creation_date": pd.Timestamp("2023-06-01", tz="UTC"),
+                "last_activity_date": pd.Timestamp(f"2024-01-0{2 + i}", tz="UTC"),
+            }
+            for i in range(3)
+        ]
+    )
+    data_retriever.get_dataframe_since.side_effect = [delta, delta.iloc[0:0]]
+    handler = IngestionHandler(embedding_svc, data_retriever, watermark_store)
+
+    response = handler.handle(
+        event={"mode": "incremental", "number_of_records": "10", "batch_size": "3"}
+    )
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["results"] == 3
+    assert data_retriever.get_dataframe_since.call_args_list[0] == call(
+        watermark_store.get.return_value, 3
+    )
+    data_retriever.get_dataframe.assert_not_called()
+
+    documents = [
+        document
+        for save_call in embedding_svc.save_to_opensearch.call_args_list
+        for document, _ in save_call[0][0]
+    ]
+    assert sorted(document.question_id for document in documents) == ["11", "12", "13"]
+    watermark_store.set.assert_called_with(
+        {
+            "last_activity_date": "2024-01-04T00:00:00+00:00",
+            "creation_date": "2023-06-01T00:00:00+00:00",
+            "question_id": 13,
+        }
+    )
+
+
+
+def test_incremental_watermark_stops_before_documents_left_out(embedding_svc, data_retriever):
+    """
+    GIVEN a page with more changed rows than the run's target
+    WHEN an incremental ingestion run is triggered
+    THEN only target documents are embedded
+    THEN the watermark is not advanced past the rows left out
+    """
+    watermark_store = MagicMock(spec=WatermarkStore)
+    watermark_store.get.return_value = None
+    embedding_svc.check_if_indexed.side_effect = lambda *args: False
+    delta = pd.DataFrame(
+        [
+            {
+                "question_id": 11 + i,
+                "question_title": f"Title{11 + i}",
+                "question_body": f"Body{11 + i}",
+                "accepted_answer_body": f"Answer{11 + i}",
+                "creation_date": pd.Timestamp("2023-06-01", tz="UTC"),
+                "last_activity_date": pd.Timestamp(f"2024-01-0{2 + i}", tz="UTC"),
+            }
+            for i in range(3)
+        ]
+    )
+    data_retriever.get_dataframe_since.side_effect = [delta, delta.iloc[0:0]]
+    handler = IngestionHandler(embedding_svc, data_retriever, watermark_store)
+
+    response = handler.handle(
+        event={"mode": "incremental", "number_of_records": "2", "batch_size": "3"}
+    )
+
+    assert json.loads(response["body"])["results"] == 2
+    assert embedding_svc.generate_embedding.call_count == 2
+    watermark_store.set.assert_not_called()
+
+def test_failed_embeddings_are_retried_by_next_run(
+    embedding_svc, data_retriever, tmp_path
+):
+    """
+    GIVEN a retry queue
+    WHEN an embedding fails during a run
+    THEN the failed document is queued instead of dropped
+    THEN the next run drains the queue and indexes it
+    """
+    retry_queue = FileRetryQueue(str(tmp_path / "retry.jsonl"))
+    handler = IngestionHandler(embedding_svc, data_retriever, retry_queue=retry_queue)
+    embedding_svc.check_if_indexed.side_effect = lambda *args: False
+
+    def fail_first_title(text, **kwargs):
+        if text.startswith("Title: Title1\n"):
+            raise ClientError(MagicMock(), "InvokeModel")
+        return [0.1, 0.2, 0.3]
+
+    embedding_svc.generate_embedding.side_effect = fail_first_title
+    handler.handle(event={"number_of_records": "2", "batch_size": "2"}, context=None)
+
+    queued = [json.loads(line) for line in open(tmp_path / "retry.jsonl")]
+    assert [record["title"] for record in queued] == ["Title1"]
+
+    embedding_svc.generate_embedding.side_effect = None
+    embedding_svc.save_to_opensearch.reset_mock()
+    response = handler.handle(event={"number_of_records": "1", "batch_size": "2"}, context=None)
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["results"] == 1
+    retried = embedding_svc.save_to_opensearch.call_args[0][0]
+    assert [document.title for document, _ in retried] == ["Title1"]
+    with retry_queue.drain() as records:
+        assert records == []
+
+
+def test_ingestion_reports_bedrock_usage(embedding_svc, data_retriever, handler):
+    """
+    GIVEN embedding calls that report their token usage
+    WHEN documents are ingested
+    THEN the response body totals the run's tokens and names the largest documents
+    """
+
+    def generate_embedding(text, usage=None, key=None):
+        usage.add("titan", input_tokens=len(text), bedrock_ms=5, elapsed_ms=6, key=key)
+        return [0.1, 0.2, 0.3]
+
+    embedding_svc.generate_embedding.side_effect = generate_embedding
+    response = handler.handle(event={"number_of_records": "4", "batch_size": "4"}, context=None)
+
+    body = json.loads(response["body"])
+    totals = body["usage"]["models"]["titan"]
+    assert totals["calls"] == embedding_svc.generate_embedding.call_count
+    assert totals["input_tokens"] > 0
+    assert totals["overhead_ms"] == pytest.approx(totals["calls"])
+    assert body["usage"]["largest_inputs"]
+
+
+def test_ingestion_packs_texts_into_provider_batches(embedding_svc, data_retriever, handler):
+    """
+    GIVEN an embedding provider that accepts up to 4 texts per request
+    WHEN documents are ingested
+    THEN the documents are embedded in batches of up to 4 texts
+    """
+    embedding_svc.batch_limits = (4, None)
+    embedding_svc.embed_batch.side_effect = lambda texts, usage=None, keys=None: [
+        [0.1, 0.2, 0.3]
+    ] * len(texts)
+    embedding_svc.check_if_indexed.side_effect = lambda *args: False
+
+    response = handler.handle(event={"number_of_records": "8", "batch_size": "8"}, context=None)
+
+    batch_sizes = [len(call_args[0][0]) for call_args in embedding_svc.embed_batch.call_args_list]
+    assert json.loads(response["body"])["results"] == sum(batch_sizes)
+    assert max(batch_sizes) == 4
+    assert sum(batch_sizes) >= 8
+
+
+def test_ingestion_dual_writes_to_the_shadow_index(embedding_svc, data_retriever):
+    """
+    GIVEN a handler migrating to a shadow index
+    WHEN documents are ingested
+    THEN every written document is embedded with the shadow model and written to the shadow index
+    THEN a failing shadow write does not fail the run
+    """
+    shadow_svc = MagicMock(spec=EmbeddingService)
+    shadow_svc.batch_limits = (10, None)
+    shadow_svc.embed_batch.side_effect = lambda texts, usage=None, keys=None: [[0.5]] * len(texts)
+    handler = IngestionHandler(embedding_svc, data_retriever, shadow_svc=shadow_svc)
+    embedding_svc.check_if_indexed.side_effect = lambda *args: False
+
+    response = handler.handle(event={"number_of_records": "4", "batch_size": "4"}, context=None)
+
+    written = [
+        document
+        for save_call in embedding_svc.save_to_opensearch.call_args_list
+        for document, _ in save_call[0][0]
+    ]
+    shadowed = [
+        document
+        for save_call in shadow_svc.save_to_opensearch.call_args_list
+        for document, _ in save_call[0][0]
+    ]
+    assert shadowed == written
+    assert json.loads(response["body"])["results"] == len(written)
+
+    shadow_svc.save_to_opensearch.side_effect = Exception("shadow index is read-only")
+    response = handler.handle(event={"number_of_records": "2", "batch_size": "2"}, context=None)
+    assert response["statusCode"] == 200
+
+
+def test_mapping_only_shadow_reuses_the_current_embeddings(embedding_svc, data_retriever):
+    """
+    GIVEN a shadow index with the same provider, model and dimensions as the current one
+    WHEN documents are ingested
+    THEN their current embeddings are written to the shadow index without embedding them again
+    THEN a failing shadow write does not fail the run
+    """
+    model = ("TitanEmbeddingProvider", "amazon.titan-embed-text-v2:0", 1024)
+    embedding_svc.embedding_model = model
+    shadow_svc = MagicMock(spec=EmbeddingService)
+    shadow_svc.embedding_model = model
+    handler = IngestionHandler(embedding_svc, data_retriever, shadow_svc=shadow_svc)
+    embedding_svc.check_if_indexed.side_effect = lambda *args: False
+
+    handler.handle(event={"number_of_records": "4", "batch_size": "4"}, context=None)
+
+    written = [
+        pair for save_call in embedding_svc.save_to_opensearch.call_args_list for pair in save_call[0][0]
+    ]
+    shadowed = [
+        pair for save_call in shadow_svc.save_to_opensearch.call_args_list for pair in save_call[0][0]
+    ]
+    assert written and shadowed == written
+    shadow_svc.embed_batch.assert_not_called()
+
+    shadow_svc.save_to_opensearch.side_effect = Exception("shadow index is read-only")
+    response = handler.handle(event={"number_of_records": "2", "batch_size": "2"}, context=None)
+    assert response["statusCode"] == 200
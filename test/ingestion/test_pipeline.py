@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from ingestion.pipeline import Pipeline
+
+
+def test_pipeline_runs_stages_in_sequence():
+    """
+    GIVEN a source and a chain of stages, one of them batching
+    WHEN the pipeline runs
+    THEN every item flows through every stage and batches are capped at batch_size
+    THEN per-stage statistics are reported, source first
+    """
+    batches = []
+    lock = threading.Lock()
+
+    def collect(batch):
+        with lock:
+            batches.append(batch)
+
+    stats = (
+        Pipeline(range(10), name="numbers", queue_size=2)
+        .add_stage("double", lambda n: [n * 2], concurrency=3)
+        .add_stage("explode", lambda n: [n, n + 1])
+        .add_stage("collect", collect, batch_size=4)
+        .run()
+    )
+
+    collected = sorted(n for batch in batches for n in batch)
+    assert collected == sorted([2 * n for n in range(10)] + [2 * n + 1 for n in range(10)])
+    assert all(len(batch) <= 4 for batch in batches)
+    assert [stage["stage"] for stage in stats] == ["numbers", "double", "explode", "collect"]
+    assert [stage["items"] for stage in stats] == [10, 10, 10, 20]
+    assert stats[1]["concurrency"] == 3
+
+
+def test_pipeline_bounded_queues_apply_backpressure():
+    """
+    GIVEN a slow last stage and small queues
+    WHEN the pipeline runs
+    THEN the source never gets more than the queued capacity ahead of the slow stage
+    """
+    produced, consumed = [], []
+
+    def source():
+        for n in range(20):
+            produced.append(n)
+            yield n
+
+    def slow(n):
+        time.sleep(0.005)
+        assert len(produced) - len(consumed) <= 8
+        consumed.append(n)
+
+    Pipeline(source(), queue_size=1).add_stage("pass", lambda n: [n]).add_stage("slow", slow).run()
+
+    assert consumed == list(range(20))
+
+
+def test_pipeline_reraises_stage_errors():
+    """
+    GIVEN a stage that fails on one item
+    WHEN the pipeline runs
+    THEN the pipeline is aborted and the error is re-raised
+    """
+
+    def fail_on_five(n):
+        if n == 5:
+            raise ValueError("bad item")
+        return [n]
+
+    pipeline = Pipeline(range(1000), queue_size=2).add_stage("fail", fail_on_five, concurrency=2)
+
+    with pytest.raises(ValueError, match="bad item"):
+        pipeline.run()
+
+
+def test_pipeline_flushes_partial_batches_when_input_stalls():
+    """
+    GIVEN a batching stage with flush_after and a source that stalls after two items
+    WHEN the pipeline runs
+    THEN the partial batch is processed before the source ends
+    """
+    flushed = threading.Event()
+    batches = []
+
+    def source():
+        yield 1
+        yield 2
+        assert flushed.wait(timeout=5)
+        yield 3
+
+    def collect(batch):
+        batches.append(list(batch))
+        flushed.set()
+
+    Pipeline(source()).add_stage("collect", collect, batch_size=10, flush_after=0.1).run()
+
+    assert batches == [[1, 2], [3]]
@@ -1,3 +1,4 @@
+from datetime import datetime, timezone
 from unittest.mock import MagicMock
 import pytest
 
@@ -24,7 +25,10 @@ WITH accepted_answers AS (
         q.title AS question_title,
         q.body AS question_body,
         q.accepted_answer_id,
-        a.body AS accepted_answer_body
+        a.body AS accepted_answer_body,
+        q.tags,
+        q.score,
+        q.creation_date
     FROM
         `bigquery-public-data.stackoverflow.posts_questions` q
     LEFT JOIN
@@ -50,7 +54,10 @@ WITH accepted_answers AS (
         q.title AS question_title,
         q.body AS question_body,
         q.accepted_answer_id,
-        a.body AS accepted_answer_body
+        a.body AS accepted_answer_body,
+        q.tags,
+        q.score,
+        q.creation_date
     FROM
         `bigquery-public-data.stackoverflow.posts_questions` q
     LEFT JOIN
@@ -65,3 +72,21 @@ LIMIT 50
 OFFSET 10\
 """
     )
+
+
+def test_get_dataframe_since_watermark(bigquery_client, stackoverflow_retriever):
+    stackoverflow_retriever.get_dataframe_since(
+        {"last_activity_date": "2024-01-01T00:00:00+00:00", "question_id": 42}, 50
+    )
+
+    query, kwargs = bigquery_client.query.call_args
+    assert "ORDER BY last_activity_date, question_id" in query[0]
+    parameters = {
+        parameter.name: parameter.value
+        for parameter in kwargs["job_config"].query_parameters
+    }
+    assert parameters == {
+        "last_activity_date": datetime(2024, 1, 1, tzinfo=timezone.utc),
+        "question_id": 42,
+        "number_of_records": 50,
+    }
@@ -0,0 +1,129 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from ingestion.retry_queue import FileRetryQueue, SqsRetryQueue
+
+
+def test_file_retry_queue(tmp_path):
+    queue = FileRetryQueue(str(tmp_path / "retry.jsonl"))
+    with queue.drain() as records:
+        assert records == []
+
+    queue.put([{"question_id": "1"}, {"question_id": "2"}])
+    queue.put([{"question_id": "3"}])
+
+    with queue.drain(max_records=2) as records:
+        assert records == [{"question_id": "1"}, {"question_id": "2"}]
+        queue.put([{"question_id": "4"}])
+    with queue.drain() as records:
+        assert records == [{"question_id": "3"}, {"question_id": "4"}]
+    with queue.drain() as records:
+        assert records == []
+
+
+def test_file_retry_queue_keeps_records_of_failed_drain(tmp_path):
+    """
+    GIVEN queued records
+    WHEN processing the drained records raises
+    THEN the records stay queued
+    """
+    queue = FileRetryQueue(str(tmp_path / "retry.jsonl"))
+    queue.put([{"question_id": "1"}])
+
+    with pytest.raises(RuntimeError):
+        with queue.drain():
+            raise RuntimeError("indexing failed")
+
+    with queue.drain() as records:
+        assert records == [{"question_id": "1"}]
+
+
+def test_sqs_retry_queue():
+    """
+    GIVEN an SQS queue
+    WHEN records are drained
+    THEN their messages are only deleted after the with block completed
+    """
+    sqs_client = MagicMock()
+    sqs_client.send_message_batch.return_value = {"Successful": []}
+    sqs_client.delete_message_batch.return_value = {"Successful": []}
+    queue = SqsRetryQueue(sqs_client, "https://sqs/queue")
+
+    queue.put([{"question_id": str(i)} for i in range(12)])
+
+    assert sqs_client.send_message_batch.call_count == 2
+    assert len(sqs_client.send_message_batch.call_args_list[0].kwargs["Entries"]) == 10
+
+    sqs_client.receive_message.side_effect = [
+        {
+            "Messages": [
+                {"Body": json.dumps({"question_id": "1"}), "ReceiptHandle": "r1"},
+            ]
+        },
+        {},
+    ]
+
+    with queue.drain(max_records=5) as records:
+        assert records == [{"question_id": "1"}]
+        sqs_client.delete_message_batch.assert_not_called()
+    sqs_client.delete_message_batch.assert_called_once_with(
+        QueueUrl="https://sqs/queue", Entries=[{"Id": "0", "ReceiptHandle": "r1"}]
+    )
+    assert sqs_client.receive_message.call_args_list[0].kwargs["VisibilityTimeout"] == 900
+
+    sqs_client.receive_message.side_effect = [
+        {"Messages": [{"Body": json.dumps({"question_id": "2"}), "ReceiptHandle": "r2"}]},
+        {},
+    ]
+    with pytest.raises(RuntimeError):
+        with queue.drain():
+            raise RuntimeError("indexing failed")
+    sqs_client.delete_message_batch.assert_called_once()
+
+
+def test_sqs_retry_queue_splits_batches_by_size():
+    """
+    GIVEN records that together exceed the SQS batch size limit
+    WHEN they are put
+    THEN they are sent in batches under 256 KiB
+    """
+    sqs_client = MagicMock()
+    sqs_client.send_message_batch.return_value = {}
+    queue = SqsRetryQueue(sqs_client, "https://sqs/queue")
+
+    queue.put([{"answer_body": "x" * 100_000} for _ in range(5)])
+
+    batches = [call.kwargs["Entries"] for call in sqs_client.send_message_batch.call_args_list]
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    with pytest.raises(ValueError):
+        queue.put([{"answer_body": "x" * 300_000}])
+
+
+def test_sqs_retry_queue_resends_failed_entries():
+    """
+    GIVEN SQS rejecting an entry of a batch
+    WHEN records are put
+    THEN only the rejected entry is resent
+    THEN an entry rejected on every attempt raises instead of being dropped
+    """
+    sqs_client = MagicMock()
+    sqs_client.send_message_batch.side_effect = [
+        {"Failed": [{"Id": "1", "SenderFault": False, "Code": "InternalError"}]},
+        {},
+    ]
+    queue = SqsRetryQueue(sqs_client, "https://sqs/queue")
+
+    queue.put([{"question_id": "1"}, {"question_id": "2"}])
+
+    resent = sqs_client.send_message_batch.call_args_list[1].kwargs["Entries"]
+    assert resent == [{"Id": "1", "MessageBody": json.dumps({"question_id": "2"})}]
+
+    sqs_client.send_message_batch.side_effect = None
+    sqs_client.send_message_batch.return_value = {
+        "Failed": [{"Id": "0", "SenderFault": False, "Code": "InternalError"}]
+    }
+    with pytest.raises(RuntimeError):
+        queue.put([{"question_id": "3"}])
+    assert sqs_client.send_message_batch.call_count == 5
@@ -0,0 +1,89 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+from ingestion.throttling import (
+    AdaptiveConcurrencyLimiter,
+    call_with_backoff,
+    is_throttling_error,
+)
+
+
+def throttling_error():
+    return ClientError(
+        {"Error": {"Code": "ThrottlingException", "Message": "Too many requests"}},
+        "InvokeModel",
+    )
+
+
+def test_is_throttling_error():
+    assert is_throttling_error(throttling_error())
+    assert not is_throttling_error(
+        ClientError({"Error": {"Code": "ValidationException"}}, "InvokeModel")
+    )
+    assert not is_throttling_error(ClientError(MagicMock(), "InvokeModel"))
+
+
+def test_limiter_increases_additively_and_decreases_multiplicatively():
+    """
+    GIVEN a limiter at concurrency 4
+    WHEN a full window of calls succeeds
+    THEN the limit grows by one
+    WHEN calls are throttled within the cooldown
+    THEN the limit is halved only once
+    """
+    limiter = AdaptiveConcurrencyLimiter(initial=4, maximum=8, cooldown_seconds=60)
+
+    for _ in range(4):
+        limiter.on_success()
+    assert limiter.limit == 4
+    limiter.on_success()
+    assert limiter.limit == 5
+
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.limit == 2
+
+
+def test_limiter_respects_bounds():
+    limiter = AdaptiveConcurrencyLimiter(initial=2, minimum=1, maximum=2, cooldown_seconds=0)
+
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.limit == 2
+
+    for _ in range(5):
+        limiter.on_throttle()
+    assert limiter.limit == 1
+
+
+@patch("ingestion.throttling.time.sleep")
+def test_call_with_backoff_retries_throttled_calls(sleep):
+    limiter = AdaptiveConcurrencyLimiter(initial=4, cooldown_seconds=0)
+    func = MagicMock(side_effect=[throttling_error(), throttling_error(), [0.1]])
+
+    assert call_with_backoff(limiter, func) == [0.1]
+    assert func.call_count == 3
+    assert sleep.call_count == 2
+    # Halved twice (4 -> 2 -> 1), then one success adds a full slot at concurrency 1
+    assert limiter.limit == 2
+
+
+@patch("ingestion.throttling.time.sleep")
+def test_call_with_backoff_gives_up(sleep):
+    limiter = AdaptiveConcurrencyLimiter()
+    func = MagicMock(side_effect=throttling_error())
+
+    with pytest.raises(ClientError):
+        call_with_backoff(limiter, func, max_attempts=3)
+    assert func.call_count == 3
+
+
+def test_call_with_backoff_does_not_retry_other_errors():
+    limiter = AdaptiveConcurrencyLimiter()
+    func = MagicMock(side_effect=ClientError({"Error": {"Code": "ValidationException"}}, "InvokeModel"))
+
+    with pytest.raises(ClientError):
+        call_with_backoff(limiter, func)
+    assert func.call_count == 1
@@ -1,7 +1,10 @@
 import json
-from unittest.mock import MagicMock
+from unittest.mock import ANY, MagicMock
 import pytest
 
+from common.answers import PrecomputedAnswerStore
+from common.cache import SemanticCache
+from common.shared_cache import LocalCacheBackend, SharedCache
 from query.handler import QueryHandler
 
 
@@ -65,9 +68,17 @@ def test_returns_results_from_elasticsearch(embedding_svc, handler, bedrock_clie
     response = handler.handle(event=test_event, context=None)
     body = json.loads(response["body"])
 
-    embedding_svc.query_opensearch.assert_called_once_with(query=[0.1, 0.2, 0.3], k=5)
+    embedding_svc.query_opensearch.assert_called_once_with(
+        query=[0.1, 0.2, 0.3],
+        k=5,
+        filters={"tags": [], "min_score": None},
+        source_fields=["answer_body", "text", "title"],
+        query_text="Sample query text",
+    )
 
-    embedding_svc.generate_embedding.assert_called_once_with(text="Sample query text")
+    embedding_svc.generate_embedding.assert_called_once_with(
+        text="Sample query text", usage=ANY, input_type="search_query"
+    )
 
     # validate LLM call is rendered successfully
     bedrock_client.converse.assert_called_once_with(
@@ -93,6 +104,7 @@ def test_returns_results_from_elasticsearch(embedding_svc, handler, bedrock_clie
     # Assertions
     assert response["statusCode"] == 200
     assert body["markdown"] == "here's the result: `print('foo-bar')`"
+    assert body["path"] == "rendered"
 
 
 def test_missing_query_parameter_returns_400(embedding_svc, handler):
@@ -123,7 +135,7 @@ def test_no_results_from_elasticsearch(embedding_svc, handler):
     body = json.loads(response["body"])
 
     embedding_svc.generate_embedding.assert_called_once_with(
-        text="Non-matching query text"
+        text="Non-matching query text", usage=ANY, input_type="search_query"
     )
     embedding_svc.query_opensearch.assert_called_once()
 
@@ -144,7 +156,9 @@ def test_embedding_generation_failure(embedding_svc, handler):
     response = handler.handle(event=test_event, context=None)
     body = json.loads(response["body"])
 
-    embedding_svc.generate_embedding.assert_called_once_with(text="Sample query text")
+    embedding_svc.generate_embedding.assert_called_once_with(
+        text="Sample query text", usage=ANY, input_type="search_query"
+    )
 
     assert response["statusCode"] == 500
     assert body["error"] == "Embedding generation failed: Embedding service error"
@@ -163,8 +177,279 @@ def test_opensearch_query_failure(embedding_svc, handler):
     response = handler.handle(event=test_event, context=None)
     body = json.loads(response["body"])
 
-    embedding_svc.generate_embedding.assert_called_once_with(text="Sample query text")
+    embedding_svc.generate_embedding.assert_called_once_with(
+        text="Sample query text", usage=ANY, input_type="search_query"
+    )
     embedding_svc.query_opensearch.assert_called_once()
 
     assert response["statusCode"] == 500
     assert body["error"] == "Opensearch query failed: Opensearch query error"
+
+
+def test_semantic_cache_hit_skips_search_and_rendering(
+    embedding_svc, bedrock_client
+):
+    """
+    GIVEN an answer cached for a semantically similar query
+    WHEN the lambda function is called with the query string
+    THEN the cached answer is returned without querying OpenSearch or calling the LLM
+    """
+    semantic_cache = SemanticCache(capacity=10, threshold=0.95)
+    semantic_cache.add([0.1, 0.2, 0.31], ["0"], "cached markdown")
+    handler = QueryHandler(embedding_svc, bedrock_client, semantic_cache=semantic_cache)
+
+    test_event = {"queryStringParameters": {"query": "Sample query text"}}
+    response = handler.handle(event=test_event, context=None)
+    body = json.loads(response["body"])
+
+    assert response["statusCode"] == 200
+    assert body["markdown"] == "cached markdown"
+    assert body["path"] == "cache"
+    embedding_svc.query_opensearch.assert_not_called()
+    bedrock_client.converse.assert_not_called()
+
+
+def test_semantic_cache_miss_caches_rendered_answer(embedding_svc, bedrock_client):
+    semantic_cache = SemanticCache(capacity=10, threshold=0.95)
+    handler = QueryHandler(embedding_svc, bedrock_client, semantic_cache=semantic_cache)
+
+    test_event = {"queryStringParameters": {"query": "Sample query text"}}
+    handler.handle(event=test_event, context=None)
+
+    cached = semantic_cache.lookup([0.1, 0.2, 0.3])
+    assert cached["markdown"] == "here's the result: `print('foo-bar')`"
+    assert cached["hit_ids"] == [0, 1, 2, 3, 4]
+
+
+def test_overfetch_and_rerank(embedding_svc, bedrock_client):
+    """
+    GIVEN a handler that over-fetches candidates
+    WHEN the candidates contain near-duplicates
+    THEN only the diverse matches are sent to the LLM
+    """
+    embedding_svc.query_opensearch.return_value = [
+        {
+            "_id": i,
+            "_score": 1.0,
+            "_source": {"text": f"Sample text{i}", "embedding": vector},
+        }
+        for i, vector in enumerate([[1.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    ]
+    handler = QueryHandler(embedding_svc, bedrock_client, k=3, fetch_k=10)
+
+    test_event = {"queryStringParameters": {"query": "Sample query text"}}
+    response = handler.handle(event=test_event, context=None)
+
+    assert response["statusCode"] == 200
+    assert embedding_svc.query_opensearch.call_args.kwargs["k"] == 10
+    assert "embedding" in embedding_svc.query_opensearch.call_args.kwargs["source_fields"]
+    prompt = bedrock_client.converse.call_args.kwargs["messages"][0]["content"][0]["text"]
+    assert "Sample text0" in prompt
+    assert "Sample text1" not in prompt
+    assert "Sample text2" in prompt
+
+
+def test_per_request_search_options(embedding_svc, handler):
+    test_event = {"queryStringParameters": {"query": "Sample query text", "k": "2", "fetch_k": "8"}}
+    response = handler.handle(event=test_event, context=None)
+
+    assert response["statusCode"] == 200
+    assert embedding_svc.query_opensearch.call_args.kwargs["k"] == 8
+
+
+def test_invalid_search_options_return_400(embedding_svc, handler):
+    test_event = {"queryStringParameters": {"query": "Sample query text", "diversity": "2"}}
+    response = handler.handle(event=test_event, context=None)
+    body = json.loads(response["body"])
+
+    assert response["statusCode"] == 400
+    assert body["error"] == "Invalid search options: 'diversity' must be between 0 and 1"
+    embedding_svc.generate_embedding.assert_not_called()
+
+
+def test_filtered_search_returns_requested_fields(embedding_svc, bedrock_client, handler):
+    """
+    GIVEN structured documents in the index
+    WHEN the lambda function is called with tag and score filters and a list of fields
+    THEN the filters are passed to the kNN search
+    THEN only the title and accepted answer are sent to the LLM
+    THEN the response carries only the requested fields of each match
+    """
+    embedding_svc.query_opensearch.return_value = [
+        {
+            "_id": "42",
+            "_score": 1.0,
+            "_source": {
+                "question_id": "42",
+                "title": "Read a csv",
+                "answer_body": "Use pd.read_csv",
+                "score": 12,
+                "text": "Title: Read a csv\nBody: long body\nAccepted Answer: Use pd.read_csv",
+            },
+        }
+    ]
+    test_event = {
+        "queryStringParameters": {
+            "query": "pandas read csv file",
+            "tags": "python,pandas",
+            "min_score": "10",
+            "fields": "question_id,score",
+        }
+    }
+
+    response = handler.handle(event=test_event, context=None)
+    body = json.loads(response["body"])
+
+    assert response["statusCode"] == 200
+    kwargs = embedding_svc.query_opensearch.call_args.kwargs
+    assert kwargs["filters"] == {"tags": ["python", "pandas"], "min_score": 10}
+    assert {"question_id", "score"} <= set(kwargs["source_fields"])
+    prompt = bedrock_client.converse.call_args.kwargs["messages"][0]["content"][0]["text"]
+    assert "Title: Read a csv\nAccepted Answer: Use pd.read_csv" in prompt
+    assert "long body" not in prompt
+    assert body["matches"] == [{"question_id": "42", "score": 12}]
+
+
+@pytest.fixture
+def structured_hits():
+    return [
+        {
+            "_id": "42",
+            "_score": score,
+            "_source": {
+                "question_id": "42",
+                "title": "Read a csv",
+                "answer_body": "Use pd.read_csv",
+                "text": "Title: Read a csv\nBody: long body\nAccepted Answer: Use pd.read_csv",
+            },
+        }
+        for score in (0.97, 0.5)
+    ]
+
+
+def test_confident_match_takes_fast_path(embedding_svc, bedrock_client, structured_hits):
+    """
+    GIVEN a handler with a fast path score threshold
+    WHEN the top match scores above the threshold
+    THEN its accepted answer is returned directly without calling the LLM
+    """
+    embedding_svc.query_opensearch.return_value = structured_hits
+    handler = QueryHandler(embedding_svc, bedrock_client, fast_path_score=0.94)
+
+    response = handler.handle(
+        event={"queryStringParameters": {"query": "pandas read csv file"}}, context=None
+    )
+    body = json.loads(response["body"])
+
+    assert response["statusCode"] == 200
+    assert body["path"] == "fast"
+    assert body["markdown"] == (
+        "## Read a csv\n\nUse pd.read_csv\n\n"
+        "[View on Stack Overflow](https://stackoverflow.com/questions/42)"
+    )
+    assert "question_id" in embedding_svc.query_opensearch.call_args.kwargs["source_fields"]
+    bedrock_client.converse.assert_not_called()
+
+
+def test_fast_path_converts_html_answer_to_markdown(
+    embedding_svc, bedrock_client, structured_hits
+):
+    """
+    GIVEN a confident match whose accepted answer is StackOverflow HTML
+    WHEN the fast path returns it
+    THEN the answer is converted to markdown, keeping code blocks intact
+    """
+    structured_hits[0]["_source"]["title"] = "Read a csv &amp; skip rows"
+    structured_hits[0]["_source"]["answer_body"] = (
+        "<p>Use <code>pd.read_csv</code> with <strong>skiprows</strong>:</p>\n\n"
+        "<pre><code>df = pd.read_csv(&quot;f.csv&quot;,\n                 skiprows=2)\n</code></pre>\n\n"
+        '<ul>\n<li>see <a href="https://pandas.pydata.org">the docs</a></li>\n</ul>\n'
+    )
+    embedding_svc.query_opensearch.return_value = structured_hits
+    handler = QueryHandler(embedding_svc, bedrock_client, fast_path_score=0.94)
+
+    response = handler.handle(
+        event={"queryStringParameters": {"query": "pandas read csv file"}}, context=None
+    )
+
+    assert json.loads(response["body"])["markdown"] == (
+        "## Read a csv & skip rows\n\n"
+        "Use `pd.read_csv` with **skiprows**:\n\n"
+        '```\ndf = pd.read_csv("f.csv",\n                 skiprows=2)\n```\n\n'
+        "- see [the docs](https://pandas.pydata.org)\n\n"
+        "[View on Stack Overflow](https://stackoverflow.com/questions/42)"
+    )
+
+
+def test_fast_path_mode_overrides_threshold(embedding_svc, bedrock_client, structured_hits):
+    """
+    GIVEN a handler with a fast path score threshold
+    WHEN the request sets 'mode'
+    THEN 'fast' skips the LLM regardless of score and 'render' always calls it
+    """
+    structured_hits[0]["_score"] = 0.5
+    embedding_svc.query_opensearch.return_value = structured_hits
+    handler = QueryHandler(embedding_svc, bedrock_client, fast_path_score=0.94)
+
+    auto = handler.handle(event={"queryStringParameters": {"query": "csv"}}, context=None)
+    assert json.loads(auto["body"])["path"] == "rendered"
+
+    fast = handler.handle(
+        event={"queryStringParameters": {"query": "csv", "mode": "fast"}}, context=None
+    )
+    assert json.loads(fast["body"])["path"] == "fast"
+    assert bedrock_client.converse.call_count == 1
+
+    structured_hits[0]["_score"] = 0.99
+    render = handler.handle(
+        event={"queryStringParameters": {"query": "csv", "mode": "render"}}, context=None
+    )
+    assert json.loads(render["body"])["path"] == "rendered"
+    assert bedrock_client.converse.call_count == 2
+
+
+def test_precomputed_answer_skips_embedding(embedding_svc, bedrock_client):
+    """
+    GIVEN an answer precomputed for a popular query
+    WHEN the query is received with default options
+    THEN the stored answer is returned without calling Titan, OpenSearch kNN or Haiku
+    """
+    answer_store = MagicMock(spec=PrecomputedAnswerStore)
+    answer_store.get_current.return_value = {"query": "sample query text", "markdown": "precomputed"}
+    handler = QueryHandler(embedding_svc, bedrock_client, answer_store=answer_store)
+
+    response = handler.handle(
+        event={"queryStringParameters": {"query": "Sample query text?"}}, context=None
+    )
+
+    assert json.loads(response["body"]) == {"markdown": "precomputed", "path": "precomputed"}
+    answer_store.get_current.assert_called_once_with("Sample query text?")
+    embedding_svc.generate_embedding.assert_not_called()
+    bedrock_client.converse.assert_not_called()
+
+
+def test_shared_cache_answers_repeated_queries_once(embedding_svc, bedrock_client):
+    """
+    GIVEN a handler with a shared cache
+    WHEN the same question is asked twice with different spelling
+    THEN the second request is answered from the cache with the same response
+    THEN requests with a wrong API key are still rejected
+    """
+    handler = QueryHandler(
+        embedding_svc,
+        bedrock_client,
+        api_key="secret",
+        shared_cache=SharedCache(LocalCacheBackend()),
+    )
+    headers = {"api_key": "secret"}
+
+    first = handler.handle({"queryStringParameters": {"query": "Read CSV?"}, "headers": headers}, None)
+    second = handler.handle({"queryStringParameters": {"query": "read csv"}, "headers": headers}, None)
+    rejected = handler.handle(
+        {"queryStringParameters": {"query": "read csv"}, "headers": {"api_key": "wrong"}}, None
+    )
+
+    assert second == first
+    assert embedding_svc.generate_embedding.call_count == 1
+    assert bedrock_client.converse.call_count == 1
+    assert rejected["statusCode"] == 401
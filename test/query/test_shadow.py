@@ -0,0 +1,87 @@
+from unittest.mock import MagicMock
+
+from query.handler import QueryHandler
+from query.shadow import ShadowMirror, overlap_at_k
+
+
+def test_overlap_at_k():
+    assert overlap_at_k(["1", "2", "3", "4"], ["2", "1", "9", "3"], k=3) == 2 / 3
+    assert overlap_at_k([], [], k=3) == 1.0
+
+
+def test_mirrored_query_is_compared_with_the_shadow_index():
+    """
+    GIVEN a handler mirroring every query to a shadow index
+    WHEN a query is answered
+    THEN the answer comes from the current index
+    THEN the shadow index is searched with its own embedding and the top-k overlap is recorded
+    """
+    embedding_svc = MagicMock()
+    embedding_svc.generate_embedding.return_value = [0.1, 0.2]
+    embedding_svc.query_opensearch.return_value = [
+        {"_id": str(i), "_score": 0.5, "_source": {"text": f"text{i}"}} for i in range(3)
+    ]
+    shadow_svc = MagicMock()
+    shadow_svc.generate_embedding.return_value = [0.3, 0.4, 0.5]
+    shadow_svc.query_opensearch.return_value = [{"_id": "0"}, {"_id": "7"}, {"_id": "2"}]
+    bedrock_client = MagicMock()
+    bedrock_client.converse.return_value = {
+        "output": {"message": {"content": [{"text": "<markdown>answer</markdown>"}]}}
+    }
+    shadow = ShadowMirror(shadow_svc, percentage=100, timeout=5)
+    comparisons = []
+    wait = shadow.wait
+    shadow.wait = lambda future: comparisons.append(wait(future))
+    handler = QueryHandler(embedding_svc, bedrock_client, k=3, shadow=shadow)
+
+    response = handler.handle({"queryStringParameters": {"query": "read csv"}}, None)
+
+    assert response["statusCode"] == 200
+    assert "text1" in bedrock_client.converse.call_args.kwargs["messages"][0]["content"][0]["text"]
+    shadow_svc.query_opensearch.assert_called_once()
+    assert shadow_svc.query_opensearch.call_args.kwargs["query"] == [0.3, 0.4, 0.5]
+    assert len(comparisons) == 1
+    assert comparisons[0]["overlap"] == 2 / 3
+
+
+def test_shadow_comparison_is_not_waited_for_inside_the_shared_cache():
+    """
+    GIVEN a handler mirroring every query, behind a shared cache
+    WHEN a query without matches and a rendered query are answered
+    THEN only the rendered query is mirrored
+    THEN its comparison is waited for after the shared cache lock is released
+    """
+    embedding_svc = MagicMock()
+    embedding_svc.generate_embedding.return_value = [0.1, 0.2]
+    bedrock_client = MagicMock()
+    bedrock_client.converse.return_value = {
+        "output": {"message": {"content": [{"text": "<markdown>answer</markdown>"}]}}
+    }
+    events = []
+    shared_cache = MagicMock()
+
+    def get_or_compute(key, compute):
+        events.append("lock")
+        response = compute()
+        events.append("unlock")
+        return response
+
+    shared_cache.get_or_compute.side_effect = get_or_compute
+    shadow = MagicMock()
+    shadow.sample.return_value = True
+    shadow.wait.side_effect = lambda future: events.append("wait")
+    handler = QueryHandler(
+        embedding_svc, bedrock_client, k=3, shared_cache=shared_cache, shadow=shadow
+    )
+
+    embedding_svc.query_opensearch.return_value = []
+    assert handler.handle({"queryStringParameters": {"query": "no match"}}, None)["statusCode"] == 404
+    shadow.submit.assert_not_called()
+
+    events.clear()
+    embedding_svc.query_opensearch.return_value = [
+        {"_id": "0", "_score": 0.5, "_source": {"text": "text0"}}
+    ]
+    assert handler.handle({"queryStringParameters": {"query": "read csv"}}, None)["statusCode"] == 200
+    shadow.submit.assert_called_once()
+    assert events == ["lock", "unlock", "wait"]
@@ -0,0 +1,40 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from common.embeddings import EmbeddingService
+from query.suggest import SuggestHandler
+
+
+@pytest.fixture
+def embedding_svc():
+    embedding_svc = MagicMock(spec=EmbeddingService)
+    embedding_svc.suggest_titles.return_value = [
+        {"question_id": "42", "title": "How to read a csv file in pandas", "score": 120.0}
+    ]
+    return embedding_svc
+
+
+def test_suggest_returns_titles_without_embedding(embedding_svc):
+    """
+    GIVEN titles indexed in the completion field
+    WHEN a prefix is sent to the suggest route
+    THEN matching titles and question IDs are returned without generating an embedding
+    """
+    handler = SuggestHandler(embedding_svc)
+
+    response = handler.handle({"queryStringParameters": {"prefix": "how to read", "size": "3"}}, None)
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["suggestions"][0]["question_id"] == "42"
+    embedding_svc.suggest_titles.assert_called_once_with("how to read", 3)
+    embedding_svc.generate_embedding.assert_not_called()
+
+
+@pytest.mark.parametrize("params", [{}, {"prefix": "  "}, {"prefix": "how", "size": "100"}])
+def test_suggest_rejects_invalid_requests(embedding_svc, params):
+    response = SuggestHandler(embedding_svc).handle({"queryStringParameters": params}, None)
+
+    assert response["statusCode"] == 400
+    embedding_svc.suggest_titles.assert_not_called()
@@ -0,0 +1,72 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from common.documents import StackOverflowDocument
+from common.embeddings import EmbeddingService
+from tools.evaluate import (
+    corpus_text,
+    evaluate_searches,
+    format_report,
+    latency_percentiles,
+    recall_at_k,
+    reciprocal_rank,
+)
+
+
+def test_recall_and_reciprocal_rank():
+    ranked = ["3", "1", "2"]
+
+    assert recall_at_k(ranked, "1", k=1) == 0.0
+    assert recall_at_k(ranked, "1", k=2) == 1.0
+    assert reciprocal_rank(ranked, "1") == 0.5
+    assert reciprocal_rank(ranked, "4") == 0.0
+
+
+def test_corpus_text_holds_out_the_title():
+    document = StackOverflowDocument(
+        title="Read a csv", question_body="How do I read a csv?", answer_body="Use pd.read_csv"
+    )
+
+    assert corpus_text(document) == "Body: How do I read a csv?\nAccepted Answer: Use pd.read_csv"
+
+
+def test_latency_percentiles():
+    percentiles = latency_percentiles(list(range(1, 101)))
+
+    assert percentiles["p50_ms"] == pytest.approx(50.5)
+    assert percentiles["p99_ms"] == pytest.approx(99.01)
+
+
+def test_evaluate_searches():
+    """
+    GIVEN two golden queries, one answered at rank 1 and one at rank 2
+    WHEN the searches are evaluated with k=1
+    THEN recall@k counts only the first and MRR averages both reciprocal ranks
+    """
+    embedding_svc = MagicMock(spec=EmbeddingService)
+    embedding_svc.query_opensearch.side_effect = [
+        [{"_source": {"question_id": "1"}}, {"_source": {"question_id": "2"}}],
+        [{"_source": {"question_id": "1"}}, {"_source": {"question_id": "2"}}],
+    ]
+
+    result = evaluate_searches(embedding_svc, [("1", [0.1]), ("2", [0.2])], k=1)
+
+    assert result["recall@k"] == 0.5
+    assert result["mrr"] == 0.75
+    assert set(result) == {"recall@k", "mrr", "p50_ms", "p95_ms", "p99_ms"}
+
+
+def test_format_report():
+    report = [
+        {
+            "dimensions": 256, "m": 16, "ef_construction": 128, "ef_search": 100, "k": 5,
+            "recall@k": 0.9, "mrr": 0.8, "p50_ms": 1.0, "p95_ms": 2.0, "p99_ms": 3.0,
+            "index_size_bytes": 1024,
+        }
+    ]
+
+    table = format_report(report).splitlines()
+
+    assert table[0].startswith("| dimensions | m | ef_construction")
+    assert table[2] == "| 256 | 16 | 128 | 100 | 5 | 0.900 | 0.800 | 1.000 | 2.000 | 3.000 | 1024 |"
@@ -0,0 +1,72 @@
+from unittest.mock import MagicMock
+
+from tools.maintenance import collect_stats, force_merge, format_stats, warmup
+
+
+def test_force_merge_and_warmup():
+    opensearch_client = MagicMock()
+    opensearch_client.plugins.knn.warmup.return_value = {
+        "_shards": {"total": 2, "successful": 2, "failed": 0}
+    }
+
+    force_merge(opensearch_client, "docs", max_segments=2, timeout=60)
+    shards = warmup(opensearch_client, "docs")
+
+    opensearch_client.indices.forcemerge.assert_called_once_with(
+        index="docs", max_num_segments=2, request_timeout=60
+    )
+    opensearch_client.plugins.knn.warmup.assert_called_once_with(index="docs", request_timeout=600)
+    assert shards["successful"] == 2
+
+
+def test_collect_stats_sums_graph_memory_over_nodes():
+    """
+    GIVEN index stats and kNN stats from two nodes
+    WHEN stats are collected
+    THEN segment and storage stats come from the index primaries
+    THEN graph memory and counts of the index are summed over the nodes
+    """
+    opensearch_client = MagicMock()
+    opensearch_client.indices.stats.return_value = {
+        "indices": {
+            "docs": {
+                "primaries": {
+                    "docs": {"count": 1000, "deleted": 5},
+                    "segments": {"count": 3, "memory_in_bytes": 2048},
+                    "store": {"size_in_bytes": 10 * 2**20},
+                }
+            }
+        }
+    }
+    opensearch_client.plugins.knn.stats.return_value = {
+        "nodes": {
+            "a": {
+                "indices_in_cache": {"docs": {"graph_memory_usage": 1024, "graph_count": 2}},
+                "hit_count": 10,
+                "miss_count": 2,
+                "eviction_count": 0,
+                "graph_memory_usage_percentage": 12.5,
+            },
+            "b": {
+                "indices_in_cache": {"docs": {"graph_memory_usage": 512, "graph_count": 1}},
+                "hit_count": 5,
+                "miss_count": 1,
+                "eviction_count": 1,
+                "graph_memory_usage_percentage": 20.0,
+            },
+        }
+    }
+
+    stats = collect_stats(opensearch_client, "docs")
+
+    assert stats["segments"] == 3
+    assert stats["documents"] == 1000
+    assert stats["knn"] == {
+        "graph_memory_kb": 1536,
+        "graph_count": 3,
+        "cache_hits": 15,
+        "cache_misses": 3,
+        "evictions": 1,
+        "max_graph_memory_percent": 20.0,
+    }
+    assert "kNN graphs loaded:      3 (1.5 MiB)" in format_stats(stats)
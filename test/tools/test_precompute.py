@@ -0,0 +1,57 @@
+import json
+from unittest.mock import MagicMock
+
+from common.answers import PrecomputedAnswerStore
+from query.handler import QueryHandler
+from tools.precompute import mine_top_queries, refresh_answers
+
+
+def test_mine_top_queries_groups_spellings():
+    records = [
+        {"query": "Read CSV pandas?"},
+        {"query": "read csv pandas"},
+        {"query": "read csv pandas"},
+        {"query": "merge dicts"},
+        {"latency_ms": 12},
+    ]
+
+    assert mine_top_queries(records, top_n=1) == [
+        {"query": "read csv pandas", "text": "read csv pandas", "count": 3}
+    ]
+
+
+def test_refresh_answers_only_renders_stale_entries():
+    """
+    GIVEN one query whose answer is current, one rendered against an older index and one
+          rendered with another embedding model
+    WHEN answers are refreshed
+    THEN only the stale queries are rendered through the handler and stored with the new
+         fingerprint and the current model
+    """
+    store = MagicMock(spec=PrecomputedAnswerStore)
+    store.get.side_effect = lambda query: {
+        "fresh query": {"fingerprint": "new", "model_id": "titan"},
+        "stale query": {"fingerprint": "old", "model_id": "titan"},
+        "migrated query": {"fingerprint": "new", "model_id": "cohere"},
+    }[query]
+    handler = MagicMock(spec=QueryHandler)
+    handler.handle.return_value = {
+        "statusCode": 200,
+        "body": json.dumps({"markdown": "answer", "matches": [{"question_id": "42"}]}),
+    }
+    queries = [
+        {"query": "fresh query", "text": "Fresh query", "count": 5},
+        {"query": "stale query", "text": "Stale query", "count": 3},
+        {"query": "migrated query", "text": "Migrated query", "count": 2},
+    ]
+
+    counts = refresh_answers(handler, store, queries, "new", model_id="titan")
+
+    assert counts == {"rendered": 2, "current": 1, "failed": 0}
+    event = handler.handle.call_args_list[0][0][0]
+    assert event["queryStringParameters"]["query"] == "Stale query"
+    assert event["queryStringParameters"]["mode"] == "render"
+    assert [c.args for c in store.put.call_args_list] == [
+        ("stale query", "answer", ["42"], "new", "titan"),
+        ("migrated query", "answer", ["42"], "new", "titan"),
+    ]
@@ -0,0 +1,43 @@
+import json
+
+from tools.replay import StubBedrockClient, format_curve, load_log, run_step
+
+
+def test_run_step_reports_rate_latency_and_errors():
+    """
+    GIVEN a target that fails every fourth request
+    WHEN a replay step runs
+    THEN every scheduled request is sent and the error rate is reported
+    """
+    sent = []
+
+    def send(record):
+        sent.append(record["query"])
+        return 500 if len(sent) % 4 == 0 else 200
+
+    records = [{"query": "a"}, {"query": "b"}]
+    row = run_step(send, records, qps=200, concurrency=1, duration_s=0.1)
+
+    assert row["requests"] == 20
+    assert sorted(sent) == ["a"] * 10 + ["b"] * 10
+    assert row["error_rate"] == 0.25
+    assert row["p50_ms"] <= row["p99_ms"]
+    assert "target qps" in format_curve([row])
+
+
+def test_load_log_skips_records_without_query(tmp_path):
+    path = tmp_path / "queries.jsonl"
+    path.write_text(json.dumps({"query": "a", "params": {"k": "3"}}) + "\n" + json.dumps({"query": ""}) + "\n")
+
+    assert load_log(str(path)) == [{"query": "a", "params": {"k": "3"}}]
+
+
+def test_stub_bedrock_embeddings_are_deterministic():
+    client = StubBedrockClient(dimensions=8, embed_latency_ms=0)
+
+    def embed(text):
+        body = json.dumps({"inputText": text})
+        return json.loads(client.invoke_model(body, "model", "application/json", "application/json")["body"].read())["embedding"]
+
+    assert embed("read csv") == embed("read csv")
+    assert embed("read csv") != embed("merge dicts")
@@ -0,0 +1,76 @@
+import hashlib
+from unittest.mock import MagicMock
+
+from opensearchpy import NotFoundError
+
+from common.documents import StackOverflowDocument
+from common.embeddings import EmbeddingService
+from common.providers import LocalEmbeddingProvider
+from tools.shadow import backfill_shadow
+
+
+def test_backfill_copies_missing_documents_with_the_shadow_model():
+    """
+    GIVEN documents of the current index, one of which the shadow index already has
+    WHEN the shadow index is backfilled
+    THEN the missing and stale documents are re-embedded with the shadow model and written to it
+    """
+    sources = [
+        {"question_id": str(i), "title": f"t{i}", "question_body": "b", "answer_body": "a"}
+        for i in range(1, 4)
+    ]
+    current_hash = hashlib.sha256(StackOverflowDocument(**sources[2]).text.encode()).hexdigest()
+    opensearch_client = MagicMock()
+    opensearch_client.get.side_effect = [
+        NotFoundError(404, "not found"),
+        {"_source": {"content_hash": "stale"}},
+        {"_source": {"content_hash": current_hash}},
+    ]
+    opensearch_client.bulk.return_value = {"errors": False, "items": []}
+    shadow_svc = EmbeddingService(
+        opensearch_client,
+        None,
+        "shadow",
+        None,
+        embedding_dimensions=4,
+        provider=LocalEmbeddingProvider(dimensions=4),
+    )
+
+    counts = backfill_shadow(shadow_svc, sources, batch_size=10)
+
+    assert counts == {"copied": 2, "skipped": 1, "failed": 0}
+    body = opensearch_client.bulk.call_args.kwargs["body"].decode()
+    assert '"_index":"shadow"' in body
+    assert '"_id":"1"' in body and '"_id":"2"' in body and '"_id":"3"' not in body
+
+
+def test_backfill_copies_stored_vectors_without_embedding():
+    """
+    GIVEN documents of the current index scanned with their stored vectors (a mapping-only migration)
+    WHEN the shadow index is backfilled
+    THEN the stored vectors are written to the shadow index and the model is not called
+    """
+    sources = [
+        {
+            "question_id": str(i),
+            "title": f"t{i}",
+            "question_body": "b",
+            "answer_body": "a",
+            "embedding": [float(i)] * 4,
+        }
+        for i in range(1, 3)
+    ]
+    opensearch_client = MagicMock()
+    opensearch_client.get.side_effect = NotFoundError(404, "not found")
+    opensearch_client.bulk.return_value = {"errors": False, "items": []}
+    provider = MagicMock(wraps=LocalEmbeddingProvider(dimensions=4))
+    shadow_svc = EmbeddingService(
+        opensearch_client, None, "shadow", None, embedding_dimensions=4, provider=provider
+    )
+
+    counts = backfill_shadow(shadow_svc, sources, batch_size=10)
+
+    assert counts == {"copied": 2, "skipped": 0, "failed": 0}
+    provider.embed_batch.assert_not_called()
+    body = opensearch_client.bulk.call_args.kwargs["body"].decode()
+    assert '"embedding":[2.0,2.0,2.0,2.0]' in body
@@ -0,0 +1,168 @@
+import hashlib
+import json
+from itertools import chain, repeat
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+from common.partitions import TagPartitioner
+from tools.snapshot import export_snapshot, import_snapshot
+
+
+@pytest.fixture
+def source_client():
+    opensearch_client = MagicMock()
+    opensearch_client.indices.get_mapping.return_value = {
+        "docs": {"mappings": {"properties": {"embedding": {"type": "knn_vector", "dimension": 2}}}}
+    }
+    opensearch_client.indices.get_settings.return_value = {
+        "docs": {"settings": {"index.knn": "true", "index.uuid": "abc", "index.number_of_replicas": "1"}}
+    }
+    opensearch_client.count.return_value = {"count": 3}
+    return opensearch_client
+
+
+def test_snapshot_round_trip(source_client, tmp_path):
+    """
+    GIVEN an index with structured and plain text documents
+    WHEN it is exported to a snapshot and imported into another OpenSearch
+    THEN the index is created from the snapshot mapping with refreshes disabled while loading
+    THEN every document is bulk-loaded under its original ID with its float32 vector
+    """
+    hits = [
+        {
+            "_id": str(i),
+            "_source": {
+                "question_id": str(i),
+                "title": f"Title{i}",
+                "question_body": "Body",
+                "answer_body": "Answer",
+                "tags": ["python"],
+                "score": i,
+                "text": f"Title: Title{i}\nBody: Body\nAccepted Answer: Answer",
+                "embedding": [i, i + 0.5],
+            },
+        }
+        for i in range(2)
+    ]
+    plain_id = hashlib.sha256("plain text".encode()).hexdigest()
+    hits.append({"_id": plain_id, "_source": {"text": "plain text", "embedding": [9.0, 9.5]}})
+
+    with patch("tools.snapshot.helpers.scan", return_value=iter(hits)):
+        manifest = export_snapshot(source_client, "docs", str(tmp_path), batch_size=2)
+
+    assert manifest["count"] == 3
+    assert manifest["settings"] == {"index.knn": "true", "index.number_of_replicas": "1"}
+    assert np.load(tmp_path / "vectors.npy").tolist() == [[0, 0.5], [1, 1.5], [9, 9.5]]
+
+    target_client = MagicMock()
+    target_client.indices.exists.side_effect = [False, True, True]
+    target_client.count.return_value = {"count": 0}
+    target_client.bulk.return_value = {"errors": False, "items": []}
+
+    indexed = import_snapshot(target_client, str(tmp_path), "docs-copy", batch_size=2, workers=2)
+
+    assert indexed == 3
+    create_body = target_client.indices.create.call_args.kwargs["body"]
+    assert create_body["settings"]["index.refresh_interval"] == "-1"
+    properties = create_body["mappings"]["properties"]
+    assert properties["embedding"] == manifest["mappings"]["properties"]["embedding"]
+    assert properties["title_suggest"] == {"type": "completion"}
+    lines = [
+        json.loads(line)
+        for bulk_call in target_client.bulk.call_args_list
+        for line in bulk_call.kwargs["body"].decode().splitlines()
+    ]
+    loaded = {action["index"]["_id"]: source for action, source in zip(lines[::2], lines[1::2])}
+    assert set(loaded) == {"0", "1", plain_id}
+    assert loaded["1"]["embedding"] == [1.0, 1.5]
+    assert loaded["1"]["tags"] == ["python"]
+    assert loaded[plain_id]["embedding"] == [9.0, 9.5]
+    target_client.indices.put_settings.assert_called_once_with(
+        index="docs-copy",
+        body={"index.refresh_interval": None, "index.number_of_replicas": "1"},
+    )
+
+
+def test_import_restores_settings_when_loading_fails(tmp_path):
+    """
+    GIVEN a snapshot and an existing target index with its own refresh interval and replicas
+    WHEN a bulk request fails during the import
+    THEN the error is raised and the index's own settings are restored anyway
+    """
+    source_client = MagicMock()
+    source_client.indices.get_mapping.return_value = {
+        "docs": {"mappings": {"properties": {"embedding": {"type": "knn_vector", "dimension": 2}}}}
+    }
+    source_client.indices.get_settings.return_value = {"docs": {"settings": {"index.knn": "true"}}}
+    source_client.count.return_value = {"count": 1}
+    hit = {"_id": "a", "_source": {"text": "plain text", "embedding": [1.0, 2.0]}}
+    with patch("tools.snapshot.helpers.scan", return_value=iter([hit])):
+        export_snapshot(source_client, "docs", str(tmp_path))
+
+    target_client = MagicMock()
+    target_client.indices.exists.return_value = True
+    target_client.indices.get_settings.return_value = {
+        "docs": {"settings": {"index.refresh_interval": "5s", "index.number_of_replicas": "2"}}
+    }
+    target_client.count.return_value = {"count": 0}
+    target_client.bulk.side_effect = ConnectionError("connection reset")
+
+    with pytest.raises(ConnectionError):
+        import_snapshot(target_client, str(tmp_path))
+
+    assert target_client.indices.put_settings.call_args_list[-1].kwargs == {
+        "index": "docs",
+        "body": {"index.refresh_interval": "5s", "index.number_of_replicas": "2"},
+    }
+
+
+def test_import_routes_documents_into_partitions(source_client, tmp_path):
+    """
+    GIVEN a snapshot of a single index
+    WHEN it is imported with a tag partitioner
+    THEN every partition index is created, and documents are loaded into the one of their tags
+    THEN the settings of every partition index are restored
+    """
+    hits = [
+        {
+            "_id": question_id,
+            "_source": {
+                "question_id": question_id,
+                "title": f"Title{question_id}",
+                "question_body": "Body",
+                "answer_body": "Answer",
+                "tags": tags,
+                "text": f"Title: Title{question_id}\nBody: Body\nAccepted Answer: Answer",
+                "embedding": [1.0, 2.0],
+            },
+        }
+        for question_id, tags in (("1", ["python"]), ("2", ["sql"]))
+    ]
+    source_client.count.return_value = {"count": 2}
+    with patch("tools.snapshot.helpers.scan", return_value=iter(hits)):
+        export_snapshot(source_client, "docs", str(tmp_path))
+
+    target_client = MagicMock()
+    # Missing until the import creates them
+    target_client.indices.exists.side_effect = chain([False] * 3, repeat(True))
+    target_client.count.return_value = {"count": 0}
+    target_client.bulk.return_value = {"errors": False, "items": []}
+    partitioner = TagPartitioner({"python": ["python"], "sql": ["sql"]})
+
+    assert import_snapshot(target_client, str(tmp_path), partitioner=partitioner) == 2
+
+    created = [c.args[0] for c in target_client.indices.create.call_args_list]
+    assert created == ["docs-python", "docs-sql", "docs-other"]
+    actions = [
+        json.loads(line)
+        for bulk_call in target_client.bulk.call_args_list
+        for line in bulk_call.kwargs["body"].decode().splitlines()[::2]
+    ]
+    assert {action["index"]["_id"]: action["index"]["_index"] for action in actions} == {
+        "1": "docs-python",
+        "2": "docs-sql",
+    }
+    restored = [c.kwargs["index"] for c in target_client.indices.put_settings.call_args_list]
+    assert restored == created